@@ -24,6 +24,15 @@ from runners.support.agent import (  # noqa:E402
     SIG_TYPE_BLS,
 )
 from runners.support.utils import log_msg, log_status, prompt, prompt_loop  # noqa:E402
+from load_support import (  # noqa:E402
+    ExchangeWaiter,
+    LoadReport,
+    run_bounded,
+    save_reports,
+    script_loop,
+)
+from revocation import RegistryManager, RevocationBatcher, read_targets  # noqa:E402
+from tenant_pool import TenantWalletPool  # noqa:E402
 
 CRED_PREVIEW_TYPE = "https://didcomm.org/issue-credential/2.0/credential-preview"
 SELF_ATTESTED = os.getenv("SELF_ATTESTED")
@@ -31,6 +40,16 @@ TAILS_FILE_COUNT = int(os.getenv("TAILS_FILE_COUNT", 100))
 
 DEMO_EXTRA_AGENT_ARGS = os.getenv("DEMO_EXTRA_AGENT_ARGS")
 
+# --batch-revoke value that targets the credentials from the bulk issue runs
+BULK_ISSUED = "bulk"
+
+PROOF_FORMATS = [
+    CRED_FORMAT_ANONCREDS,
+    CRED_FORMAT_INDY,
+    CRED_FORMAT_VC_DI,
+    CRED_FORMAT_JSON_LD,
+]
+
 logging.basicConfig(level=logging.WARNING)
 LOGGER = logging.getLogger(__name__)
 
@@ -70,6 +89,11 @@ class FaberAgent(AriesAgent):
         # TODO define a dict to hold credential attributes
         # based on cred_def_id
         self.cred_attrs = {}
+        # completion of exchanges started by the load modes, fed by webhooks
+        self.issue_waiter = ExchangeWaiter()
+        self.proof_waiter = ExchangeWaiter()
+        # cred_ex_ids issued by bulk runs, so a batch revocation can target them
+        self.bulk_issued = []
 
     async def detect_connection(self):
         await self._connection_ready
@@ -79,7 +103,144 @@ class FaberAgent(AriesAgent):
     def connection_ready(self):
         return self._connection_ready.done() and self._connection_ready.result()
 
-    def generate_credential_offer(self, cred_type, cred_def_id, exchange_tracing):
+    async def handle_issue_credential_v2_0(self, message):
+        await super().handle_issue_credential_v2_0(message)
+        state = message.get("state")
+        if state in ("done", "abandoned"):
+            self.issue_waiter.resolve(message["cred_ex_id"], state)
+
+    async def handle_present_proof_v2_0(self, message):
+        await super().handle_present_proof_v2_0(message)
+        state = message.get("state")
+        if state == "done":
+            self.proof_waiter.resolve(
+                message["pres_ex_id"],
+                "verified" if message.get("verified") == "true" else "not verified",
+            )
+        elif state == "abandoned":
+            self.proof_waiter.resolve(message["pres_ex_id"], state)
+
+    async def active_connection_ids(self):
+        resp = await self.admin_GET("/connections", params={"state": "active"})
+        return [conn["connection_id"] for conn in resp["results"]]
+
+    async def bulk_issue_credentials(
+        self, cred_type, cred_def_id, count, concurrency, timeout, exchange_tracing
+    ):
+        """Issue `count` credentials round-robin over all active connections.
+
+        Each exchange counts as complete when its "done" webhook arrives.
+        """
+        connection_ids = await self.active_connection_ids()
+        if not connection_ids:
+            raise Exception("Bulk issue needs at least one active connection")
+        report = LoadReport(f"Bulk issue ({cred_type})")
+
+        async def issue(i):
+            offer_request = self.generate_credential_offer(
+                cred_type,
+                cred_def_id,
+                exchange_tracing,
+                connection_id=connection_ids[i % len(connection_ids)],
+            )
+            start = time.perf_counter()
+            try:
+                cred_ex = await self.admin_POST(
+                    "/issue-credential-2.0/send-offer", offer_request
+                )
+                state = await self.issue_waiter.wait(cred_ex["cred_ex_id"], timeout)
+            except asyncio.TimeoutError:
+                report.fail("timeout")
+                return
+            except ClientError as e:
+                report.fail(f"admin API: {e}")
+                return
+            if state == "done":
+                report.record(time.perf_counter() - start)
+                self.bulk_issued.append(cred_ex["cred_ex_id"])
+            else:
+                report.fail(state)
+
+        self.log(
+            f"Issuing {count} credentials over {len(connection_ids)} connection(s), "
+            f"up to {concurrency} in flight"
+        )
+        report.start()
+        await run_bounded(count, concurrency, issue)
+        report.stop()
+        return report
+
+    async def proof_request_load(
+        self, cred_types, count, concurrency, timeout, revocation, exchange_tracing
+    ):
+        """Send `count` proof requests per credential format over all active connections.
+
+        Formats run one after the other so each gets its own verifications/sec
+        and latency figures; a request counts when its verified "done" webhook arrives.
+        """
+        connection_ids = await self.active_connection_ids()
+        if not connection_ids:
+            raise Exception("Proof load needs at least one active connection")
+        reports = []
+        for cred_type in cred_types:
+            report = LoadReport(f"Proof requests ({cred_type})")
+
+            async def verify(i):
+                proof_request_web_request = self.generate_proof_request_web_request(
+                    cred_type,
+                    revocation,
+                    exchange_tracing,
+                    connection_id=connection_ids[i % len(connection_ids)],
+                )
+                start = time.perf_counter()
+                try:
+                    pres_ex = await self.admin_POST(
+                        "/present-proof-2.0/send-request", proof_request_web_request
+                    )
+                    result = await self.proof_waiter.wait(
+                        pres_ex["pres_ex_id"], timeout
+                    )
+                except asyncio.TimeoutError:
+                    report.fail("timeout")
+                    return
+                except ClientError as e:
+                    report.fail(f"admin API: {e}")
+                    return
+                if result == "verified":
+                    report.record(time.perf_counter() - start)
+                else:
+                    report.fail(result)
+
+            self.log(
+                f"Sending {count} {cred_type} proof requests over "
+                f"{len(connection_ids)} connection(s), up to {concurrency} in flight"
+            )
+            report.start()
+            await run_bounded(count, concurrency, verify)
+            report.stop()
+            reports.append(report)
+        return reports
+
+    def use_tenant_wallet(self, wallet, token):
+        """Point the admin calls at a sub-wallet handed out by the tenant pool."""
+        self.managed_wallet_params = {
+            "wallet_id": wallet.wallet_id,
+            "wallet_key": wallet.wallet_key,
+            "token": token,
+        }
+        if wallet.did:
+            self.did = wallet.did
+
+    def update_tenant_token(self, wallet, token):
+        """Swap in the refreshed token when `wallet` is the one in use."""
+        params = getattr(self, "managed_wallet_params", None)
+        if params and params.get("wallet_id") == wallet.wallet_id:
+            params["token"] = token
+
+    def generate_credential_offer(
+        self, cred_type, cred_def_id, exchange_tracing, connection_id=None
+    ):
+        connection_id = connection_id or self.connection_id
         age = 24
         d = datetime.date.today()
         birth_date = datetime.date(d.year - age, d.month, d.day)
@@ -105,7 +266,7 @@ class FaberAgent(AriesAgent):
             else:
                 _filter = {"anoncreds": {"cred_def_id": cred_def_id}}
             offer_request = {
-                "connection_id": self.connection_id,
+                "connection_id": connection_id,
                 "comment": f"Offer on cred def id {cred_def_id}",
                 "auto_remove": False,
                 "credential_preview": cred_preview,
@@ -131,7 +292,7 @@ class FaberAgent(AriesAgent):
                 ],
             }
             offer_request = {
-                "connection_id": self.connection_id,
+                "connection_id": connection_id,
                 "comment": f"Offer on cred def id {cred_def_id}",
                 "auto_remove": False,
                 "credential_preview": cred_preview,
@@ -142,7 +303,7 @@ class FaberAgent(AriesAgent):
 
         elif cred_type == CRED_FORMAT_JSON_LD:
             offer_request = {
-                "connection_id": self.connection_id,
+                "connection_id": connection_id,
                 "filter": {
                     "ld_proof": {
                         "credential": {
@@ -177,8 +338,14 @@ class FaberAgent(AriesAgent):
             raise Exception(f"Error invalid credential type: {self.cred_type}")
 
     def generate_proof_request_web_request(
-        self, cred_type, revocation, exchange_tracing, connectionless=False
+        self,
+        cred_type,
+        revocation,
+        exchange_tracing,
+        connectionless=False,
+        connection_id=None,
     ):
+        connection_id = connection_id or self.connection_id
         age = 18
         d = datetime.date.today()
         birth_date = datetime.date(d.year - age, d.month, d.day)
@@ -247,7 +414,7 @@ class FaberAgent(AriesAgent):
                 "trace": exchange_tracing,
             }
             if not connectionless:
-                proof_request_web_request["connection_id"] = self.connection_id
+                proof_request_web_request["connection_id"] = connection_id
 
             return proof_request_web_request
 
@@ -328,7 +495,7 @@ class FaberAgent(AriesAgent):
                     "directive"
                 ] = "required"
             if not connectionless:
-                proof_request_web_request["connection_id"] = self.connection_id
+                proof_request_web_request["connection_id"] = connection_id
             return proof_request_web_request
 
         elif cred_type == CRED_FORMAT_JSON_LD:
@@ -389,7 +556,7 @@ class FaberAgent(AriesAgent):
                 },
             }
             if not connectionless:
-                proof_request_web_request["connection_id"] = self.connection_id
+                proof_request_web_request["connection_id"] = connection_id
             return proof_request_web_request
 
         else:
@@ -483,6 +650,39 @@ async def main(args):
             wait=True,
         )
 
+        registry_manager = None
+        if faber_agent.revocation and faber_agent.cred_def_id and args.rev_reg_depth:
+            registry_manager = RegistryManager(
+                faber_agent.agent,
+                anoncreds=faber_agent.agent.__dict__["wallet_type"] == "askar-anoncreds",
+                depth=args.rev_reg_depth,
+                prepare_at=args.rev_reg_prepare_at,
+                switch_at=args.rev_reg_switch_at,
+                interval=args.rev_reg_interval,
+            )
+            registry_manager.watch(faber_agent.cred_def_id)
+            registry_manager.start()
+
+        tenant_pool = None
+        if args.tenant_pool and (
+            faber_agent.mediation or faber_agent.endorser_role or faber_agent.taa_accept
+        ):
+            # pooled wallets skip the mediation, endorser and TAA setup that
+            # register_or_switch_wallet does for each new tenant
+            log_msg(
+                "Tenant pool disabled: not supported with mediation, endorser or TAA"
+            )
+        elif faber_agent.multitenant and args.tenant_pool:
+            tenant_pool = TenantWalletPool(
+                faber_agent.agent,
+                size=args.tenant_pool,
+                webhook_urls=(
+                    [faber_agent.agent.webhook_url] if args.tenant_pool_webhooks else []
+                ),
+                on_token=faber_agent.agent.update_tenant_token,
+            )
+            tenant_pool.start()
+
         exchange_tracing = False
         options = "    (1) Issue Credential\n"
         if faber_agent.cred_type in [
@@ -491,33 +691,81 @@ async def main(args):
             CRED_FORMAT_VC_DI,
         ]:
             options += "    (1a) Set Credential Type (%CRED_TYPE%)\n"
+        options += "    (1b) Bulk Issue Credentials\n"
         options += (
             "    (2) Send Proof Request\n"
             "    (2a) Send *Connectionless* Proof Request (requires a Mobile client)\n"
+            "    (2b) Proof Request Load\n"
             "    (3) Send Message\n"
             "    (4) Create New Invitation\n"
         )
         if faber_agent.revocation:
             options += (
                 "    (5) Revoke Credential\n"
+                "    (5b) Batch Revoke Credentials\n"
                 "    (6) Publish Revocations\n"
                 "    (7) Rotate Revocation Registry\n"
                 "    (8) List Revocation Registries\n"
             )
+            if registry_manager:
+                options += "    (8b) Registry Pre-provisioning Status\n"
         if faber_agent.endorser_role and faber_agent.endorser_role == "author":
             options += "    (D) Set Endorser's DID\n"
         if faber_agent.multitenant:
             options += "    (W) Create and/or Enable Wallet\n"
             options += "    (U) Upgrade wallet to anoncreds \n"
+            if tenant_pool:
+                options += "    (WP) Tenant Wallet Pool Status\n"
         options += "    (T) Toggle tracing on credential/proof exchange\n"
         options += "    (X) Exit?\n[1/2/3/4/{}{}T/X] ".format(
             "5/6/7/8/" if faber_agent.revocation else "",
             "W/" if faber_agent.multitenant else "",
         )
 
+        # load modes given on the command line run without the menu, then exit
+        batch_options = []
+        if args.bulk_issue:
+            batch_options.append("1b")
+        if args.proof_load:
+            batch_options.append("2b")
+        if args.batch_revoke:
+            batch_options.append("5b")
+        load_reports = []
+
+        async def load_param(preset, text, default):
+            if preset is not None:
+                return preset
+            if batch_options:
+                return default
+            while True:
+                value = (await prompt(text, default=str(default))).strip()
+                if not value:
+                    return default
+                if value.isdigit() and int(value) > 0:
+                    return int(value)
+                log_msg("Please enter a positive whole number")
+
+        async def run_load(unit, coro):
+            if faber_agent.show_timing:
+                await faber_agent.agent.reset_timing()
+            result = await coro
+            reports = result if isinstance(result, list) else [result]
+            load_reports.extend(reports)
+            for report in reports:
+                for line in report.format(unit):
+                    log_msg(line)
+            if faber_agent.show_timing:
+                timing = await faber_agent.agent.fetch_timing()
+                if timing:
+                    for line in faber_agent.agent.format_timing(timing):
+                        log_msg(line)
+            return reports
+
         upgraded_to_anoncreds = False
-        async for option in prompt_loop(
-            options.replace("%CRED_TYPE%", faber_agent.cred_type)
+        async for option in (
+            script_loop(batch_options)
+            if batch_options
+            else prompt_loop(options.replace("%CRED_TYPE%", faber_agent.cred_type))
         ):
             if option is not None:
                 option = option.strip()
@@ -542,10 +790,23 @@ async def main(args):
 
             elif option in "wW" and faber_agent.multitenant:
                 target_wallet_name = await prompt("Enter wallet name: ")
-                include_subwallet_webhook = await prompt(
-                    "(Y/N) Create sub-wallet webhook target: "
-                )
-                if include_subwallet_webhook.lower() == "y":
+                pooled_wallet = None
+                if tenant_pool:
+                    pooled_wallet = tenant_pool.claimed.get(target_wallet_name)
+                    created = pooled_wallet is None
+                    if created:
+                        pooled_wallet = await tenant_pool.claim(target_wallet_name)
+                if pooled_wallet:
+                    faber_agent.agent.use_tenant_wallet(
+                        pooled_wallet, await tenant_pool.tokens.get(pooled_wallet)
+                    )
+                    log_msg(
+                        f"Using pooled wallet {pooled_wallet.wallet_name} "
+                        f"for {target_wallet_name}"
+                    )
+                elif (
+                    await prompt("(Y/N) Create sub-wallet webhook target: ")
+                ).lower() == "y":
                     created = await faber_agent.agent.register_or_switch_wallet(
                         target_wallet_name,
                         webhook_port=faber_agent.agent.get_new_webhook_port(),
@@ -572,6 +833,10 @@ async def main(args):
                         schema_attrs=faber_schema_attrs,
                     )
 
+            elif option in ("wp", "WP") and tenant_pool:
+                for line in tenant_pool.format():
+                    log_msg(line)
+
             elif option in "tT":
                 exchange_tracing = not exchange_tracing
                 log_msg(
@@ -627,6 +892,30 @@ async def main(args):
                     "/issue-credential-2.0/send-offer", offer_request
                 )
 
+            elif option == "1b":
+                log_status("#13 Bulk issue credential offers to all connections")
+                count = await load_param(
+                    args.bulk_issue, "Number of credentials to issue: ", 100
+                )
+                concurrency = await load_param(
+                    args.load_concurrency, "Max exchanges in flight: ", 10
+                )
+                await run_load(
+                    "creds",
+                    faber_agent.agent.bulk_issue_credentials(
+                        faber_agent.cred_type,
+                        (
+                            None
+                            if faber_agent.cred_type == CRED_FORMAT_JSON_LD
+                            else faber_agent.cred_def_id
+                        ),
+                        count,
+                        concurrency,
+                        args.load_timeout,
+                        exchange_tracing,
+                    ),
+                )
+
             elif option == "2":
                 log_status("#20 Request proof of degree from alice")
                 if faber_agent.cred_type in [
@@ -654,6 +943,44 @@ async def main(args):
                     "/present-proof-2.0/send-request", proof_request_web_request
                 )
 
+            elif option == "2b":
+                log_status("#20 Proof request load against all connections")
+                count = await load_param(
+                    args.proof_load, "Proof requests per credential format: ", 100
+                )
+                concurrency = await load_param(
+                    args.load_concurrency, "Max exchanges in flight: ", 10
+                )
+                if args.proof_formats:
+                    cred_types = args.proof_formats
+                elif batch_options:
+                    cred_types = [faber_agent.cred_type]
+                else:
+                    cred_types = (
+                        await prompt(
+                            "Credential formats, comma separated ({}): ".format(
+                                ", ".join(PROOF_FORMATS)
+                            ),
+                            default=faber_agent.cred_type,
+                        )
+                    ).split(",")
+                cred_types = [c.strip() for c in cred_types if c.strip()]
+                invalid = [c for c in cred_types if c not in PROOF_FORMATS]
+                if invalid:
+                    log_msg(f"Not a valid credential type: {', '.join(invalid)}")
+                    continue
+                await run_load(
+                    "verifications",
+                    faber_agent.agent.proof_request_load(
+                        cred_types,
+                        count,
+                        concurrency,
+                        args.load_timeout,
+                        faber_agent.revocation,
+                        exchange_tracing,
+                    ),
+                )
+
             elif option == "2a":
                 log_status("#20 Request * Connectionless * proof of degree from alice")
                 if faber_agent.cred_type in [
@@ -746,6 +1073,49 @@ async def main(args):
                 except ClientError:
                     pass
 
+            elif option == "5b" and faber_agent.revocation:
+                source = (
+                    args.batch_revoke
+                    if batch_options
+                    else (
+                        await prompt(
+                            "JSON file with cred_ex_ids or [rev_reg_id, cred_rev_id] "
+                            "pairs (blank: credentials from the bulk issue runs): "
+                        )
+                    ).strip()
+                )
+                if source and source != BULK_ISSUED:
+                    try:
+                        targets = read_targets(source)
+                    except (OSError, TypeError, ValueError) as e:
+                        log_msg(f"Cannot read revocation targets from {source}: {e}")
+                        continue
+                else:
+                    targets = faber_agent.agent.bulk_issued
+                    faber_agent.agent.bulk_issued = []
+                if not targets:
+                    log_msg("Nothing to revoke.")
+                    continue
+                log_status(f"#23 Revoke {len(targets)} credentials in batches")
+                concurrency = await load_param(
+                    args.load_concurrency, "Max revocations in flight: ", 10
+                )
+                batcher = RevocationBatcher(
+                    faber_agent.agent,
+                    anoncreds=is_anoncreds,
+                    max_pending=args.revoke_batch_size,
+                    max_delay=args.revoke_batch_delay,
+                )
+                await run_load(
+                    "revocations", batcher.revoke_many(targets, concurrency)
+                )
+                log_msg(
+                    f"{batcher.published} revocations published in "
+                    f"{batcher.ledger_writes} ledger write(s), "
+                    f"{batcher.ledger_writes_saved} write(s) saved, "
+                    f"{batcher.publish_failures} failed to publish"
+                )
+
             elif option == "6" and faber_agent.revocation:
                 try:
                     endpoint = (
@@ -826,6 +1196,9 @@ async def main(args):
                     )
                 except ClientError:
                     pass
+            elif option == "8b" and registry_manager:
+                for line in registry_manager.format():
+                    log_msg(line)
             elif option in "uU" and faber_agent.multitenant:
                 log_status("Upgrading wallet to anoncreds. Wait a couple seconds...")
                 await faber_agent.agent.admin_POST(
@@ -835,6 +1208,22 @@ async def main(args):
                 upgraded_to_anoncreds = True
                 await asyncio.sleep(2.0)
 
+        if tenant_pool:
+            await tenant_pool.stop()
+            for line in tenant_pool.format():
+                log_msg(line)
+            load_reports.append(tenant_pool.provisioning)
+
+        if registry_manager:
+            await registry_manager.stop()
+            for line in registry_manager.format():
+                log_msg(line)
+            load_reports.append(registry_manager.provisioning)
+
+        if load_reports and args.load_report:
+            save_reports(args.load_report, load_reports)
+            log_msg(f"Load results saved to {args.load_report}")
+
         if faber_agent.show_timing:
             timing = await faber_agent.agent.fetch_timing()
             if timing:
@@ -852,6 +1241,123 @@ async def main(args):
 
 if __name__ == "__main__":
     parser = arg_parser(ident="faber", port=8020)
+    parser.add_argument(
+        "--bulk-issue",
+        type=int,
+        metavar="<count>",
+        help=(
+            "Issue <count> credentials round-robin over the active connections, "
+            "report throughput and exit"
+        ),
+    )
+    parser.add_argument(
+        "--proof-load",
+        type=int,
+        metavar="<count>",
+        help=(
+            "Send <count> proof requests per credential format over the active "
+            "connections, report verifications/sec and exit"
+        ),
+    )
+    parser.add_argument(
+        "--proof-formats",
+        type=lambda value: value.split(","),
+        metavar="<formats>",
+        help=(
+            "Comma separated credential formats for the proof load "
+            "(anoncreds, indy, vc_di, json-ld; default: the agent's --cred-type)"
+        ),
+    )
+    parser.add_argument(
+        "--batch-revoke",
+        metavar="<file>",
+        help=(
+            "Revoke the credentials listed in <file> (JSON list of cred_ex_ids "
+            "and/or [rev_reg_id, cred_rev_id] pairs) with coalesced publishing and "
+            f"exit; '{BULK_ISSUED}' revokes the ones issued by --bulk-issue"
+        ),
+    )
+    parser.add_argument(
+        "--revoke-batch-size",
+        type=int,
+        default=100,
+        metavar="<count>",
+        help="Publish a registry once this many revocations are pending on it",
+    )
+    parser.add_argument(
+        "--revoke-batch-delay",
+        type=float,
+        default=5.0,
+        metavar="<seconds>",
+        help="Publish a registry at most this long after its first pending revocation",
+    )
+    parser.add_argument(
+        "--rev-reg-depth",
+        type=int,
+        default=0,
+        metavar="<count>",
+        help=(
+            "Keep <count> revocation registries per cred def created and published "
+            "ahead of issuance, in the background (default 0: off)"
+        ),
+    )
+    parser.add_argument(
+        "--rev-reg-prepare-at",
+        type=float,
+        default=0.5,
+        metavar="<fraction>",
+        help="Start pre-provisioning when the active registry is this full",
+    )
+    parser.add_argument(
+        "--rev-reg-switch-at",
+        type=float,
+        default=None,
+        metavar="<fraction>",
+        help=(
+            "Anoncreds wallets: activate a ready registry when the active one is "
+            "this full (default: off, the agent switches when it is full)"
+        ),
+    )
+    parser.add_argument(
+        "--rev-reg-interval",
+        type=float,
+        default=5.0,
+        metavar="<seconds>",
+        help="How often registry fill levels are checked",
+    )
+    parser.add_argument(
+        "--tenant-pool",
+        type=int,
+        default=0,
+        metavar="<count>",
+        help=(
+            "Multitenant: keep <count> sub-wallets with a public DID provisioned in "
+            "the background and hand them out in option W (default 0: off)"
+        ),
+    )
+    parser.add_argument(
+        "--tenant-pool-webhooks",
+        action="store_true",
+        help="Send the pooled wallets' webhooks to this agent's webhook listener",
+    )
+    parser.add_argument(
+        "--load-concurrency",
+        type=int,
+        metavar="<count>",
+        help="Max exchanges in flight during load runs (default 10)",
+    )
+    parser.add_argument(
+        "--load-timeout",
+        type=float,
+        default=120.0,
+        metavar="<seconds>",
+        help="How long each load exchange may take before it counts as failed",
+    )
+    parser.add_argument(
+        "--load-report",
+        metavar="<file>",
+        help="Write the results of the load runs to <file> as JSON",
+    )
     args = parser.parse_args()
 
     ENABLE_PYDEVD_PYCHARM = os.getenv("ENABLE_PYDEVD_PYCHARM", "").lower()
@@ -1,38 +1,16 @@
 import subprocess
-import shlex
 import sys
+from pathlib import Path
 
-command = """
-aca-py start \
- --inbound-transport http 0.0.0.0 8010 \
- --outbound-transport ws \
- --outbound-transport http \
- --log-level debug \
- --endpoint http://localhost:8010 \
- --label Holder \
- --seed 000000000000000000000000Steward1 \
- --genesis-url http://localhost:9000/genesis \
- --ledger-pool-name localindypool \
- --wallet-key 123456 \
- --wallet-name holder_wallet_clean \
- --wallet-type askar-anoncreds \
- --admin 0.0.0.0 8011 \
- --admin-insecure-mode \
- --auto-provision \
- --auto-accept-invites \
- --auto-accept-requests \
- --auto-ping-connection \
- --auto-respond-messages \
- --auto-respond-credential-offer \
- --auto-store-credential \
- --auto-respond-presentation-request \
- --auto-respond-presentation-proposal
-"""
+# O comando é montado de agents/stack.toml (o mesmo usado pelo supervisor.py e pelo controller)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from stack_config import AGENTES, STACK
 
-print(f"Iniciando Holder na porta admin 8011...")
-print(f"Comando: {command}")
+agente = AGENTES["holder"]
+print(f"Iniciando Holder na porta admin {agente.porta_admin} (perfil {STACK.perfil})...")
+print(f"Comando: {agente.comando}")
 
-args = shlex.split(command)
+args = agente.argumentos()
 
 try:
     process = subprocess.run(args, check=True)
@@ -40,4 +18,4 @@ except subprocess.CalledProcessError as e:
     print(f"O agente Holder falhou: {e}")
 except KeyboardInterrupt:
     print("\nParando o agente Holder...")
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(0)
@@ -1,40 +1,16 @@
 import subprocess
-import shlex
 import sys
+from pathlib import Path
 
-# Comando exato fornecido por você
-command = """
-aca-py start \
- --inbound-transport http 0.0.0.0 8000 \
- --outbound-transport ws \
- --outbound-transport http \
- --log-level debug \
- --endpoint http://localhost:8000 \
- --label Issuer \
- --seed 000000000000000000000000Steward1 \
- --genesis-url http://localhost:9000/genesis \
- --ledger-pool-name localindypool \
- --wallet-key 123456 \
- --wallet-name issuer_wallet_prod \
- --wallet-type askar-anoncreds \
- --admin 0.0.0.0 8001 \
- --admin-insecure-mode \
- --public-invites \
- --auto-accept-invites \
- --auto-accept-requests \
- --auto-ping-connection \
- --auto-respond-messages \
- --auto-respond-credential-proposal \
- --auto-respond-credential-request \
- --auto-provision \
- --requests-through-public-did
-"""
+# O comando é montado de agents/stack.toml (o mesmo usado pelo supervisor.py e pelo controller)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from stack_config import AGENTES, STACK
 
-print(f"Iniciando Issuer na porta admin 8001...")
-print(f"Comando: {command}")
+agente = AGENTES["issuer"]
+print(f"Iniciando Issuer na porta admin {agente.porta_admin} (perfil {STACK.perfil})...")
+print(f"Comando: {agente.comando}")
 
-# shlex.split lida corretamente com os argumentos
-args = shlex.split(command)
+args = agente.argumentos()
 
 try:
     # Usamos subprocess.run() que bloqueia, 
@@ -44,4 +20,4 @@ except subprocess.CalledProcessError as e:
     print(f"O agente Issuer falhou: {e}")
 except KeyboardInterrupt:
     print("\nParando o agente Issuer...")
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(0)
@@ -0,0 +1,138 @@
+"""Helpers for the Faber load modes (bulk issuance, proof load, ...).
+
+Exchanges are fired with bounded concurrency and completed through the
+agent's webhooks; latencies are aggregated into a report with throughput
+and nearest-rank percentiles.
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+# Webhooks that arrive before anyone waits on the exchange are kept (bounded)
+EARLY_RESULTS_MAX = 10000
+
+
+def percentile(samples: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of `samples` (None when empty)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class ExchangeWaiter:
+    """Futures for exchanges that finish via webhook, keyed by exchange id."""
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._early: "OrderedDict[str, Any]" = OrderedDict()
+
+    def resolve(self, exchange_id: str, result: Any):
+        future = self._futures.get(exchange_id)
+        if future is None:
+            self._early[exchange_id] = result
+            while len(self._early) > EARLY_RESULTS_MAX:
+                self._early.popitem(last=False)
+        elif not future.done():
+            future.set_result(result)
+
+    async def wait(self, exchange_id: str, timeout: float) -> Any:
+        if exchange_id in self._early:
+            return self._early.pop(exchange_id)
+        future = asyncio.get_running_loop().create_future()
+        self._futures[exchange_id] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._futures.pop(exchange_id, None)
+
+    @property
+    def pending(self) -> int:
+        return len(self._futures)
+
+
+class LoadReport:
+    """Latency samples and failures of one load run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors: Counter = Counter()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def record(self, latency: float):
+        self.latencies.append(latency)
+
+    def fail(self, reason: str):
+        self.errors[reason] += 1
+
+    @property
+    def failures(self) -> int:
+        return sum(self.errors.values())
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.perf_counter()) - (self.started or 0)
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "name": self.name,
+            "completed": len(self.latencies),
+            "failures": self.failures,
+            "elapsed_s": round(elapsed, 3),
+            "per_second": round(len(self.latencies) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": ms(percentile(self.latencies, 50)),
+            "p95_ms": ms(percentile(self.latencies, 95)),
+            "p99_ms": ms(percentile(self.latencies, 99)),
+            "max_ms": ms(max(self.latencies, default=None)),
+            "errors": dict(self.errors),
+        }
+
+    def format(self, unit: str = "exchanges") -> List[str]:
+        s = self.summary()
+        lines = [
+            f"{s['name']}: {s['completed']} {unit} in {s['elapsed_s']}s "
+            f"({s['per_second']} {unit}/sec), {s['failures']} failed",
+            f"  latency p50={s['p50_ms']}ms p95={s['p95_ms']}ms "
+            f"p99={s['p99_ms']}ms max={s['max_ms']}ms",
+        ]
+        for reason, count in s["errors"].items():
+            lines.append(f"  error x{count}: {reason}")
+        return lines
+
+
+async def run_bounded(
+    count: int, concurrency: int, fn: Callable[[int], Awaitable[None]]
+):
+    """Run fn(0..count-1) with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(i: int):
+        async with semaphore:
+            await fn(i)
+
+    await asyncio.gather(*(bounded(i) for i in range(count)))
+
+
+async def script_loop(options: Iterable[str]):
+    """Stand-in for prompt_loop in non-interactive runs: the given options, then exit."""
+    for option in options:
+        yield option
+    yield None
+
+
+def save_reports(path: str, reports: Iterable[LoadReport]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([r.summary() for r in reports], f, indent=2)
@@ -0,0 +1,331 @@
+"""Revocation helpers for the Faber demo.
+
+RevocationBatcher revokes many credentials and coalesces the ledger writes:
+each revocation is recorded without publishing, and every registry gets one
+published delta per batch instead of one ledger write per credential.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from aiohttp import ClientError
+
+from load_support import LoadReport, run_bounded
+
+# A credential is named by its exchange id or by its (rev_reg_id, cred_rev_id) pair
+RevocationTarget = Union[str, Tuple[str, str]]
+
+
+def read_targets(path: str) -> List[RevocationTarget]:
+    """Targets from a JSON list of cred_ex_ids and/or [rev_reg_id, cred_rev_id] pairs."""
+    with open(path, encoding="utf-8") as f:
+        return [t if isinstance(t, str) else tuple(t) for t in json.load(f)]
+
+
+class RevocationBatcher:
+    """Revoke now, publish later: one publish per registry per batch.
+
+    A registry's pending revocations are published when `max_pending` of them
+    are waiting or `max_delay` seconds after the first one, whichever comes
+    first. Publishes of the same registry never overlap.
+    """
+
+    def __init__(
+        self,
+        agent,
+        anoncreds: bool = True,
+        max_pending: int = 100,
+        max_delay: float = 5.0,
+    ):
+        self.agent = agent
+        self.prefix = "/anoncreds/revocation" if anoncreds else "/revocation"
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        # rev_reg_id -> [(cred_rev_id, future resolved on publish)]
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks = set()
+        self.revoked = 0
+        self.published = 0
+        self.publish_failures = 0
+        self.ledger_writes = 0
+
+    @property
+    def ledger_writes_saved(self) -> int:
+        """Writes avoided compared to publishing every revocation on its own."""
+        return self.published - self.ledger_writes
+
+    async def resolve(self, cred_ex_id: str) -> Tuple[str, str]:
+        resp = await self.agent.admin_GET(
+            f"{self.prefix}/credential-record", params={"cred_ex_id": cred_ex_id}
+        )
+        return resp["result"]["rev_reg_id"], resp["result"]["cred_rev_id"]
+
+    async def submit(self, target: RevocationTarget) -> asyncio.Future:
+        """Revoke one credential without publishing.
+
+        The returned future resolves (to the perf_counter time) once its
+        registry delta is on the ledger.
+        """
+        if isinstance(target, str):
+            rev_reg_id, cred_rev_id = await self.resolve(target)
+        else:
+            rev_reg_id, cred_rev_id = target
+        await self.agent.admin_POST(
+            f"{self.prefix}/revoke",
+            {"rev_reg_id": rev_reg_id, "cred_rev_id": cred_rev_id, "publish": False},
+        )
+        self.revoked += 1
+
+        published = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(rev_reg_id, [])
+        pending.append((cred_rev_id, published))
+        if len(pending) >= self.max_pending:
+            self._schedule(rev_reg_id, 0)
+        elif rev_reg_id not in self._timers:
+            self._schedule(rev_reg_id, self.max_delay)
+        return published
+
+    async def revoke(self, target: RevocationTarget) -> float:
+        """Revoke one credential and wait for the publish. Returns the latency in seconds."""
+        start = time.perf_counter()
+        return await (await self.submit(target)) - start
+
+    async def revoke_many(
+        self, targets: Iterable[RevocationTarget], concurrency: int = 10
+    ) -> LoadReport:
+        """Revoke all targets, `concurrency` admin calls at a time, and wait for the publishes."""
+        targets = list(targets)
+        report = LoadReport("Batch revocation")
+        submitted = []
+
+        async def revoke(i):
+            start = time.perf_counter()
+            try:
+                submitted.append((start, await self.submit(targets[i])))
+            except Exception as e:
+                report.fail(f"{type(e).__name__}: {e}")
+
+        report.start()
+        await run_bounded(len(targets), concurrency, revoke)
+        # No more revocations coming: publish the partial batches now
+        await self.flush()
+        for start, published in submitted:
+            try:
+                report.record(await published - start)
+            except Exception as e:
+                report.fail(f"publish: {type(e).__name__}: {e}")
+        report.stop()
+        return report
+
+    async def flush(self):
+        """Publish everything still pending right away."""
+        await asyncio.gather(*(self._publish(r) for r in list(self._pending)))
+
+    def _schedule(self, rev_reg_id: str, delay: float):
+        timer = self._timers.pop(rev_reg_id, None)
+        if timer and delay == 0:
+            timer.cancel()
+        task = asyncio.create_task(self._publish_after(rev_reg_id, delay))
+        if delay:
+            self._timers[rev_reg_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish_after(self, rev_reg_id: str, delay: float):
+        await asyncio.sleep(delay)
+        if self._timers.get(rev_reg_id) is asyncio.current_task():
+            del self._timers[rev_reg_id]
+        await self._publish(rev_reg_id)
+
+    async def _publish(self, rev_reg_id: str):
+        async with self._locks.setdefault(rev_reg_id, asyncio.Lock()):
+            batch = self._pending.pop(rev_reg_id, [])
+            if not batch:
+                return
+            try:
+                await self.agent.admin_POST(
+                    f"{self.prefix}/publish-revocations",
+                    {"rrid2crid": {rev_reg_id: [crid for crid, _ in batch]}},
+                )
+            except Exception as e:
+                self.publish_failures += len(batch)
+                self.agent.log(
+                    f"Publishing {len(batch)} revocation(s) on {rev_reg_id} failed: {e}"
+                )
+                for _, published in batch:
+                    if not published.done():
+                        published.set_exception(e)
+                        # counted and logged above: callers of submit() that never
+                        # await the future must not trigger "never retrieved" warnings
+                        published.exception()
+                return
+            self.ledger_writes += 1
+            self.published += len(batch)
+            self.agent.log(
+                f"Published {len(batch)} revocation(s) on {rev_reg_id} in one ledger write"
+            )
+            for _, published in batch:
+                if not published.done():
+                    published.set_result(time.perf_counter())
+
+
+class RegistryManager:
+    """Keeps ready revocation registries ahead of issuance, per credential definition.
+
+    Every `interval` seconds it reads the fill level of each watched cred
+    def's active registry. From `prepare_at` on, spare registries are created
+    and published in the background until `depth` are ready, so the agent's
+    switch on a full registry finds one instead of creating it in the issuance
+    path. With `switch_at` set, a ready spare is made active as soon as the
+    active registry is that full, before it fills up; by default the agent
+    switches on its own when the registry is full.
+
+    Spares are pre-created and activated on anoncreds wallets only; on legacy
+    indy wallets the manager only watches fill levels.
+    """
+
+    def __init__(
+        self,
+        agent,
+        anoncreds: bool = True,
+        depth: int = 2,
+        prepare_at: float = 0.5,
+        switch_at: Optional[float] = None,
+        interval: float = 5.0,
+    ):
+        self.agent = agent
+        self.anoncreds = anoncreds
+        self.prefix = "/anoncreds/revocation" if anoncreds else "/revocation"
+        self.depth = depth
+        self.prepare_at = prepare_at
+        self.switch_at = switch_at
+        self.interval = interval
+        self.cred_def_ids: List[str] = []
+        self.fill: Dict[str, float] = {}
+        self.spares: Dict[str, int] = {}
+        self.rotations = 0
+        self.provisioning = LoadReport("Registry provisioning")
+        self._creating: Dict[str, int] = {}
+        self._task = None
+        self._tasks = set()
+
+    def watch(self, cred_def_id: str):
+        if cred_def_id not in self.cred_def_ids:
+            self.cred_def_ids.append(cred_def_id)
+
+    def start(self):
+        self.provisioning.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._tasks] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.provisioning.stop()
+
+    async def _run(self):
+        while True:
+            for cred_def_id in list(self.cred_def_ids):
+                try:
+                    await self.check(cred_def_id)
+                except (ClientError, KeyError, TypeError) as e:
+                    self.agent.log(f"Registry check failed for {cred_def_id}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def check(self, cred_def_id: str):
+        resp = await self.agent.admin_GET(
+            f"{self.prefix}/active-registry/{cred_def_id}"
+        )
+        rev_reg_id = resp["result"]["revoc_reg_id"]
+        size = int(resp["result"]["max_cred_num"])
+        resp = await self.agent.admin_GET(f"{self.prefix}/registry/{rev_reg_id}/issued")
+        fill = self.fill[cred_def_id] = resp["result"] / size
+        spares = await self._spares(cred_def_id, rev_reg_id)
+        self.spares[cred_def_id] = len(spares)
+
+        switch = self.anoncreds and self.switch_at is not None
+        if switch and fill >= self.switch_at and spares:
+            # `rotate` would decommission the spares too: activate one directly
+            await self.agent.admin_PUT(f"/anoncreds/registry/{spares[0]}/active")
+            self.rotations += 1
+            self.agent.log(
+                f"Switched {cred_def_id} at {fill:.0%} full onto pre-provisioned "
+                f"registry {spares[0]}"
+            )
+        elif fill >= self.prepare_at and self.anoncreds:
+            missing = self.depth - len(spares) - self._creating.get(cred_def_id, 0)
+            for _ in range(missing):
+                task = asyncio.create_task(self._create_spare(cred_def_id, size))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _spares(self, cred_def_id: str, active_id: str) -> List[str]:
+        """Ready registries nothing was issued from yet.
+
+        A registry switched away from keeps its "finished" state, so the
+        issued count is what tells a fresh spare from an old, nearly full one.
+        """
+        candidates = [
+            r for r in await self._ready_registries(cred_def_id) if r != active_id
+        ]
+        issued = await asyncio.gather(
+            *(
+                self.agent.admin_GET(f"{self.prefix}/registry/{r}/issued")
+                for r in candidates
+            )
+        )
+        return [r for r, resp in zip(candidates, issued) if resp["result"] == 0]
+
+    async def _ready_registries(self, cred_def_id: str) -> List[str]:
+        if self.anoncreds:
+            endpoint, states = f"{self.prefix}/registries", ["finished"]
+        else:
+            endpoint = f"{self.prefix}/registries/created"
+            states = ["posted", "active"]
+        ready = []
+        for state in states:
+            resp = await self.agent.admin_GET(
+                endpoint, params={"cred_def_id": cred_def_id, "state": state}
+            )
+            ready += resp["rev_reg_ids"]
+        return ready
+
+    async def _create_spare(self, cred_def_id: str, size: int):
+        self._creating[cred_def_id] = self._creating.get(cred_def_id, 0) + 1
+        start = time.perf_counter()
+        try:
+            # the agent publishes the tails file and the initial list on its own
+            await self.agent.admin_POST(
+                "/anoncreds/revocation-registry-definition",
+                {
+                    "revocation_registry_definition": {
+                        "credDefId": cred_def_id,
+                        "issuerId": self.agent.did,
+                        "maxCredNum": size,
+                        # spares created in the same pass need distinct tags
+                        "tag": f"spare-{uuid.uuid4().hex[:8]}",
+                    },
+                    "options": {},
+                },
+            )
+            self.provisioning.record(time.perf_counter() - start)
+        except ClientError as e:
+            self.provisioning.fail(f"admin API: {e}")
+        finally:
+            self._creating[cred_def_id] -= 1
+
+    def format(self) -> List[str]:
+        lines = [
+            f"{cred_def_id}: active {self.fill.get(cred_def_id, 0):.0%} full, "
+            f"{self.spares.get(cred_def_id, 0)} spare(s) ready, "
+            f"{self._creating.get(cred_def_id, 0)} being created"
+            for cred_def_id in self.cred_def_ids
+        ]
+        lines.append(f"Switches onto a spare: {self.rotations}")
+        return lines + self.provisioning.format("registries")
@@ -0,0 +1,292 @@
+"""Supervisor da stack de agentes ACA-Py (Issuer, Holder e Verifier).
+
+Sobe os três agentes ao mesmo tempo a partir de agents/stack.toml, espera cada
+admin responder /status/ready e só então marca a stack como pronta, mostrando
+o tempo de partida de cada um. Agente que cai é reiniciado com backoff
+exponencial. A saída de cada agente vai para agents/logs/<agente>.log.
+
+Uso (a partir da raiz do projeto, com a von-network rodando):
+    python agents/supervisor.py
+    python agents/supervisor.py --agentes issuer,verifier --relatorio partida.json
+    python agents/supervisor.py --medir      # mede a partida a frio, derruba tudo e sai
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+# A configuração da stack é compartilhada com o controller e fica na raiz do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from stack_config import AGENTES, GENESIS_URL, STACK, Agente
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Configuração ---
+LOGS_DIR = Path(__file__).resolve().parent / "logs"
+INTERVALO_PRONTO = 0.25   # entre consultas a /status/ready
+# Um agente que ficou de pé por mais que isso volta ao primeiro degrau do backoff
+TEMPO_ESTAVEL = 60.0
+ESPERA_TERMINO = 10.0     # SIGTERM -> SIGKILL
+
+INICIANDO = "iniciando"
+PRONTO = "pronto"
+AGUARDANDO = "aguardando_reinicio"
+FALHOU = "falhou"
+PARADO = "parado"
+
+
+class Processo:
+    """Um agente supervisionado e o histórico das suas partidas."""
+
+    def __init__(self, agente: Agente):
+        self.agente = agente
+        self.estado = PARADO
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.reinicios = 0
+        self.partidas: List[float] = []   # segundos até /status/ready, uma por partida
+        self.pronto = asyncio.Event()
+
+    @property
+    def nome(self) -> str:
+        return self.agente.nome
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "agente": self.nome,
+            "estado": self.estado,
+            "pid": self.proc.pid if self.proc and self.proc.returncode is None else None,
+            "admin_url": self.agente.admin_url,
+            "partida_s": self.partidas[-1] if self.partidas else None,
+            "partidas_s": self.partidas,
+            "reinicios": self.reinicios,
+        }
+
+
+class Supervisor:
+    def __init__(self, agentes: List[Agente], timeout_pronto: float, backoff_base: float,
+                 backoff_max: float, max_reinicios: int, relatorio: Optional[str] = None,
+                 esperar_ledger: bool = True):
+        self.processos = [Processo(a) for a in agentes]
+        self.timeout_pronto = timeout_pronto
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_reinicios = max_reinicios
+        self.relatorio = relatorio
+        self.esperar_ledger = esperar_ledger
+        self.parando = asyncio.Event()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inicio = 0.0
+        self.tempo_stack: Optional[float] = None
+
+    def parar(self) -> None:
+        if not self.parando.is_set():
+            logging.info("Parando a stack...")
+            self.parando.set()
+
+    async def executar(self, medir: bool = False) -> bool:
+        """Supervisiona até receber SIGINT/SIGTERM. Com `medir`, sai assim que a stack fica pronta.
+
+        Retorna se a stack chegou a ficar pronta.
+        """
+        LOGS_DIR.mkdir(exist_ok=True)
+        logging.info(f"Perfil {STACK.perfil}: log {STACK.perfil_ativo.log_level}, transportes {','.join(STACK.perfil_ativo.transportes_saida)}.")
+        self._inicio = time.monotonic()
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as self._session:
+            if self.esperar_ledger and not await self._aguardar_ledger():
+                return False
+
+            tarefas = [asyncio.create_task(self._supervisionar(p)) for p in self.processos]
+            pronta = asyncio.create_task(self._aguardar_stack())
+            parando = asyncio.create_task(self.parando.wait())
+            await asyncio.wait({pronta, parando}, return_when=asyncio.FIRST_COMPLETED)
+            ok = pronta.done() and pronta.result()
+            if medir or not ok:
+                self.parar()
+            await parando
+            pronta.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+        self._salvar_relatorio()
+        return ok
+
+    async def _aguardar_ledger(self) -> bool:
+        """Os agentes caem na partida sem o genesis; melhor esperar aqui do que reiniciá-los em loop."""
+        limite = time.monotonic() + self.timeout_pronto
+        avisado = False
+        while not self.parando.is_set():
+            try:
+                async with self._session.get(GENESIS_URL) as resp:
+                    if resp.status == 200:
+                        return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if not avisado:
+                logging.info(f"Aguardando o ledger em {GENESIS_URL}...")
+                avisado = True
+            if time.monotonic() > limite:
+                logging.error(f"Ledger indisponível após {self.timeout_pronto:.0f}s. A von-network está rodando?")
+                return False
+            await self._dormir(1.0)
+        return False
+
+    async def _aguardar_stack(self) -> bool:
+        # Agentes que desistiram (FALHOU) também liberam o evento; a stack só conta como pronta com todos de pé
+        await asyncio.gather(*(p.pronto.wait() for p in self.processos))
+        if any(p.estado != PRONTO for p in self.processos):
+            logging.error("A stack não ficou pronta: " + ", ".join(f"{p.nome}={p.estado}" for p in self.processos))
+            return False
+        self.tempo_stack = round(time.monotonic() - self._inicio, 3)
+        self._imprimir()
+        return True
+
+    async def _supervisionar(self, p: Processo) -> None:
+        falhas_seguidas = 0
+        while not self.parando.is_set():
+            inicio = time.monotonic()
+            p.estado = INICIANDO
+            try:
+                p.proc = await self._iniciar(p)
+            except OSError as e:
+                logging.error(f"Não foi possível iniciar o {p.agente.rotulo}: {e}")
+                p.estado = FALHOU
+                p.pronto.set()
+                return
+            logging.info(f"{p.agente.rotulo} iniciado (pid {p.proc.pid}), aguardando {p.agente.admin_url}/status/ready...")
+
+            fim = asyncio.create_task(p.proc.wait())
+            pronto = asyncio.create_task(self._aguardar_pronto(p))
+            parando = asyncio.create_task(self.parando.wait())
+            await asyncio.wait({fim, pronto, parando}, return_when=asyncio.FIRST_COMPLETED)
+
+            if pronto.done() and pronto.result():
+                p.partidas.append(round(time.monotonic() - inicio, 3))
+                p.estado = PRONTO
+                logging.info(f"{p.agente.rotulo} pronto em {p.partidas[-1]:.2f}s.")
+                self._salvar_relatorio()
+                p.pronto.set()
+            elif not fim.done() and not self.parando.is_set():
+                logging.error(f"{p.agente.rotulo} não ficou pronto em {self.timeout_pronto:.0f}s, reiniciando.")
+                await self._terminar(p)
+            pronto.cancel()
+
+            await asyncio.wait({fim, parando}, return_when=asyncio.FIRST_COMPLETED)
+            parando.cancel()
+            if self.parando.is_set():
+                await self._terminar(p)
+                p.estado = PARADO
+                return
+
+            no_ar = time.monotonic() - inicio
+            logging.warning(f"{p.agente.rotulo} saiu com código {p.proc.returncode} após {no_ar:.1f}s "
+                            f"(veja {LOGS_DIR / (p.nome + '.log')}).")
+            falhas_seguidas = 1 if no_ar > TEMPO_ESTAVEL else falhas_seguidas + 1
+            if self.max_reinicios and p.reinicios >= self.max_reinicios:
+                logging.error(f"{p.agente.rotulo} atingiu {self.max_reinicios} reinícios, desistindo.")
+                p.estado = FALHOU
+                p.pronto.set()
+                return
+
+            atraso = min(self.backoff_base * 2 ** (falhas_seguidas - 1), self.backoff_max)
+            p.estado = AGUARDANDO
+            p.pronto.clear()
+            logging.info(f"Reiniciando {p.agente.rotulo} em {atraso:.1f}s...")
+            await self._dormir(atraso)
+            p.reinicios += 1
+
+    async def _iniciar(self, p: Processo) -> asyncio.subprocess.Process:
+        with open(LOGS_DIR / f"{p.nome}.log", "ab") as log:
+            log.write(f"\n--- {time.strftime('%Y-%m-%d %H:%M:%S')} supervisor: iniciando {p.agente.rotulo} ---\n".encode())
+            log.flush()
+            # Sessão própria: o Ctrl+C do terminal chega só ao supervisor, que encerra os agentes em ordem
+            return await asyncio.create_subprocess_exec(
+                *p.agente.argumentos(), stdout=log, stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.DEVNULL, start_new_session=True,
+            )
+
+    async def _aguardar_pronto(self, p: Processo) -> bool:
+        limite = time.monotonic() + self.timeout_pronto
+        url = f"{p.agente.admin_url}/status/ready"
+        while time.monotonic() < limite:
+            try:
+                async with self._session.get(url) as resp:
+                    if resp.status == 200 and (await resp.json()).get("ready"):
+                        return True
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pass  # admin ainda não está escutando
+            await asyncio.sleep(INTERVALO_PRONTO)
+        return False
+
+    async def _terminar(self, p: Processo) -> None:
+        if p.proc is None or p.proc.returncode is not None:
+            return
+        p.proc.terminate()
+        try:
+            await asyncio.wait_for(p.proc.wait(), ESPERA_TERMINO)
+        except asyncio.TimeoutError:
+            logging.warning(f"{p.agente.rotulo} não respondeu ao SIGTERM, forçando.")
+            p.proc.kill()
+            await p.proc.wait()
+
+    async def _dormir(self, segundos: float) -> None:
+        """Espera que acaba antes se a stack estiver parando."""
+        try:
+            await asyncio.wait_for(self.parando.wait(), segundos)
+        except asyncio.TimeoutError:
+            pass
+
+    def _imprimir(self) -> None:
+        logging.info(f"Stack pronta em {self.tempo_stack:.2f}s.")
+        print(f"\n{'agente':<10}{'pid':>8}{'partida_s':>11}{'reinicios':>11}  admin")
+        for p in self.processos:
+            r = p.resumo()
+            print(f"{r['agente']:<10}{str(r['pid']):>8}{str(r['partida_s']):>11}{r['reinicios']:>11}  {r['admin_url']}")
+        print()
+
+    def _salvar_relatorio(self) -> None:
+        if not self.relatorio:
+            return
+        dados = {"stack_pronta_s": self.tempo_stack, "agentes": [p.resumo() for p in self.processos]}
+        with open(self.relatorio, "w", encoding="utf-8") as f:
+            json.dump(dados, f, indent=2, ensure_ascii=False)
+
+
+def parse_agentes(valor: str) -> List[Agente]:
+    nomes = [n.strip() for n in valor.split(",") if n.strip()]
+    for nome in nomes:
+        if nome not in AGENTES:
+            raise argparse.ArgumentTypeError(f"Agente desconhecido: {nome} (use {', '.join(AGENTES)})")
+    return [AGENTES[n] for n in nomes]
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Sobe e supervisiona os agentes ACA-Py da stack.")
+    parser.add_argument("--agentes", type=parse_agentes, default=list(AGENTES.values()),
+                        help="Agentes a subir, separados por vírgula (padrão: todos).")
+    parser.add_argument("--timeout-pronto", type=float, default=120.0, help="Segundos para cada agente ficar pronto.")
+    parser.add_argument("--backoff-base", type=float, default=1.0, help="Primeira espera antes de reiniciar (s).")
+    parser.add_argument("--backoff-max", type=float, default=60.0, help="Espera máxima entre reinícios (s).")
+    parser.add_argument("--max-reinicios", type=int, default=0, help="Desiste do agente após N reinícios (0 = sem limite).")
+    parser.add_argument("--relatorio", help="Arquivo JSON com estado e tempos de partida de cada agente.")
+    parser.add_argument("--sem-ledger", action="store_true", help="Não espera o genesis do ledger antes de subir.")
+    parser.add_argument("--medir", action="store_true", help="Sai (derrubando os agentes) assim que a stack fica pronta.")
+    return parser
+
+
+async def main(args: argparse.Namespace) -> bool:
+    supervisor = Supervisor(args.agentes, args.timeout_pronto, args.backoff_base, args.backoff_max,
+                            args.max_reinicios, args.relatorio, esperar_ledger=not args.sem_ledger)
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sinal, supervisor.parar)
+    return await supervisor.executar(medir=args.medir)
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(main(arg_parser().parse_args()))
+    sys.exit(0 if ok else 1)
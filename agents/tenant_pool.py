@@ -0,0 +1,266 @@
+"""Warm pool of tenant wallets for the multitenant Faber demo.
+
+Creating a sub-wallet, its DID and the ledger registration of that DID takes
+seconds. The pool does that work in the background and keeps `size` wallets
+ready, so onboarding a tenant only has to claim one. Tenant tokens are cached
+and refreshed shortly before they expire.
+"""
+
+import asyncio
+import base64
+import json
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession
+
+from load_support import LoadReport
+
+
+@dataclass
+class PooledWallet:
+    wallet_id: str
+    wallet_name: str
+    wallet_key: str
+    did: Optional[str] = None
+    verkey: Optional[str] = None
+
+
+def token_expiry(token: str, default_ttl: float) -> float:
+    """Expiry (epoch seconds) of a tenant JWT; tokens without `exp` get `default_ttl`."""
+    try:
+        payload = token.split(".")[1]
+        padded = payload + "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(padded))
+    except (IndexError, ValueError):
+        return time.time() + default_ttl
+    if "exp" in claims:
+        return float(claims["exp"])
+    return float(claims.get("iat", time.time())) + default_ttl
+
+
+class TokenCache:
+    """Tenant auth tokens by wallet id, refreshed `margin` seconds before expiry."""
+
+    def __init__(
+        self, pool: "TenantWalletPool", ttl: float = 3600, margin: float = 60
+    ):
+        self.pool = pool
+        self.ttl = ttl
+        self.margin = margin
+        self._tokens: Dict[str, tuple] = {}
+        self.hits = 0
+        self.refreshes = 0
+
+    def put(self, wallet: PooledWallet, token: str):
+        self._tokens[wallet.wallet_id] = (token, token_expiry(token, self.ttl))
+        if self.pool.on_token:
+            self.pool.on_token(wallet, token)
+
+    def discard(self, wallet: PooledWallet):
+        self._tokens.pop(wallet.wallet_id, None)
+
+    def fresh(self, wallet: PooledWallet) -> bool:
+        cached = self._tokens.get(wallet.wallet_id)
+        return cached is not None and cached[1] - self.margin > time.time()
+
+    async def get(self, wallet: PooledWallet) -> str:
+        if self.fresh(wallet):
+            self.hits += 1
+            return self._tokens[wallet.wallet_id][0]
+        resp = await self.pool.request(
+            "POST",
+            f"/multitenancy/wallet/{wallet.wallet_id}/token",
+            {"wallet_key": wallet.wallet_key},
+        )
+        self.refreshes += 1
+        self.put(wallet, resp["token"])
+        return resp["token"]
+
+
+class TenantWalletPool:
+    """Keeps `size` provisioned sub-wallets ready for new tenants.
+
+    Each pooled wallet gets a public DID registered on the ledger (when
+    `public_did` is set) and, optionally, `webhook_urls` as its webhook targets.
+    Claimed wallets are remembered by tenant name, so switching back to a
+    tenant reuses its wallet and cached token. `on_token(wallet, token)` is
+    called whenever a wallet gets a new token, so holders of a copy can swap it.
+    """
+
+    def __init__(
+        self,
+        agent,
+        size: int = 5,
+        public_did: bool = True,
+        webhook_urls: Optional[List[str]] = None,
+        token_ttl: float = 3600,
+        token_margin: float = 60,
+        interval: float = 2.0,
+        on_token: Optional[Callable[[PooledWallet, str], None]] = None,
+    ):
+        self.agent = agent
+        self.on_token = on_token
+        self.size = size
+        self.public_did = public_did
+        self.webhook_urls = webhook_urls or []
+        self.interval = interval
+        self.tokens = TokenCache(self, token_ttl, token_margin)
+        self.ready: Deque[PooledWallet] = deque()
+        self.claimed: Dict[str, PooledWallet] = {}
+        self.hits = 0
+        self.misses = 0
+        self.provisioning = LoadReport("Tenant wallet provisioning")
+        self._creating = 0
+        self._session: Optional[ClientSession] = None
+        self._task = None
+        self._tasks = set()
+
+    @property
+    def hit_rate(self) -> float:
+        claims = self.hits + self.misses
+        return self.hits / claims if claims else 0.0
+
+    def start(self):
+        self._session = ClientSession()
+        self.provisioning.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._tasks] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.provisioning.stop()
+        if self._session:
+            await self._session.close()
+
+    async def request(
+        self, method: str, path: str, data=None, token: str = None, params=None
+    ):
+        headers = {}
+        if getattr(self.agent, "admin_api_key", None):
+            headers["X-API-Key"] = self.agent.admin_api_key
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        async with self._session.request(
+            method,
+            self.agent.admin_url + path,
+            json=data,
+            params=params,
+            headers=headers,
+        ) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def claim(self, tenant_name: str) -> Optional[PooledWallet]:
+        """Hand a ready wallet to `tenant_name`, or None when the pool is empty."""
+        if not self.ready:
+            self.misses += 1
+            return None
+        wallet = self.ready.popleft()
+        self.hits += 1
+        self.claimed[tenant_name] = wallet
+        # relabel off the critical path; the pool refills on its next pass
+        self._spawn(
+            self.request(
+                "PUT",
+                f"/multitenancy/wallet/{wallet.wallet_id}",
+                {"label": tenant_name},
+            )
+        )
+        return wallet
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            self.agent.log(f"Tenant pool task failed: {task.exception()!r}")
+
+    async def _run(self):
+        while True:
+            for _ in range(self.size - len(self.ready) - self._creating):
+                self._creating += 1
+                self._spawn(self._provision())
+            for wallet in [*self.ready, *self.claimed.values()]:
+                if not self.tokens.fresh(wallet):
+                    try:
+                        await self.tokens.get(wallet)
+                    except ClientError as e:
+                        self.agent.log(
+                            f"Token refresh failed for {wallet.wallet_name}: {e}"
+                        )
+            await asyncio.sleep(self.interval)
+
+    async def _provision(self):
+        start = time.perf_counter()
+        name = f"pool-{uuid.uuid4().hex[:12]}"
+        wallet = None
+        try:
+            params = {
+                "wallet_name": name,
+                "wallet_key": uuid.uuid4().hex,
+                "wallet_type": self.agent.wallet_type,
+                "label": name,
+            }
+            if self.webhook_urls:
+                params["wallet_webhook_urls"] = self.webhook_urls
+            resp = await self.request("POST", "/multitenancy/wallet", params)
+            wallet = PooledWallet(resp["wallet_id"], name, params["wallet_key"])
+            self.tokens.put(wallet, resp["token"])
+            if self.public_did:
+                token = await self.tokens.get(wallet)
+                resp = await self.request("POST", "/wallet/did/create", {}, token)
+                wallet.did = resp["result"]["did"]
+                wallet.verkey = resp["result"]["verkey"]
+                await self.agent.register_did(
+                    did=wallet.did, verkey=wallet.verkey, alias=name
+                )
+                await self.request(
+                    "POST",
+                    "/wallet/did/public",
+                    token=token,
+                    params={"did": wallet.did},
+                )
+            self.ready.append(wallet)
+            self.provisioning.record(time.perf_counter() - start)
+        except asyncio.CancelledError:
+            if wallet:
+                await self._remove(wallet)
+            raise
+        except Exception as e:
+            # register_did and friends raise more than ClientError: record them all
+            self.provisioning.fail(f"{type(e).__name__}: {e}")
+            if wallet:
+                await self._remove(wallet)
+            # don't spin on a broken setup: the next pass retries after the interval
+            await asyncio.sleep(self.interval)
+        finally:
+            self._creating -= 1
+
+    async def _remove(self, wallet: PooledWallet):
+        """Delete a half-provisioned wallet instead of leaking it."""
+        self.tokens.discard(wallet)
+        try:
+            await self.request(
+                "POST",
+                f"/multitenancy/wallet/{wallet.wallet_id}/remove",
+                {"wallet_key": wallet.wallet_key},
+            )
+        except ClientError as e:
+            self.agent.log(f"Could not remove wallet {wallet.wallet_name}: {e}")
+
+    def format(self) -> List[str]:
+        return [
+            f"Tenant pool: {len(self.ready)} ready, {self._creating} being created, "
+            f"{len(self.claimed)} claimed",
+            f"  hit rate {self.hit_rate:.0%} ({self.hits} hits, {self.misses} misses)",
+            f"  tokens: {self.tokens.hits} cached, {self.tokens.refreshes} fetched",
+        ] + self.provisioning.format("wallets")
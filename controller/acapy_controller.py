@@ -1,14 +1,71 @@
 import aiohttp
 import logging
 import asyncio
-from typing import Dict, Any
+import os
+import sys
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+from urllib.parse import urlsplit
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# A configuração da stack (agents/stack.toml) é lida por um módulo compartilhado na raiz do projeto
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import metrics
+import progress
+import proof_cache
+import resilience
+import stack_config
+from event_bus import BUS
+from invitation_pool import INVITATION_POOL
+from proof_cache import PROOF_CACHE
+from storage import STORAGE
+from subscribers import ASSINANTE_PADRAO, REGISTRO
+
+metrics.instalar_request_id_no_log()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s')
 
 # --- Constantes ---
-OPERADORA_ADMIN = "http://localhost:8001"
-CLIENTE_ADMIN = "http://localhost:8011"
-VERIFICADOR_ADMIN = "http://localhost:8021"
+# URLs dos admins vêm do mesmo agents/stack.toml que sobe os agentes (overrides STACK_<AGENTE>_HOST/_PORTA_ADMIN)
+OPERADORA_ADMIN = stack_config.AGENTES["issuer"].admin_url
+CLIENTE_ADMIN = stack_config.AGENTES["holder"].admin_url
+VERIFICADOR_ADMIN = stack_config.AGENTES["verifier"].admin_url
+
+# Nome de cada agente -> URL Admin (usado pelo pool de sessões HTTP por agente)
+AGENTES = {
+    "operadora": OPERADORA_ADMIN,
+    "cliente": CLIENTE_ADMIN,
+    "verificador": VERIFICADOR_ADMIN,
+}
+
+# Sem webhooks chegando, consulta a API a cada segundo (comportamento antigo);
+# com webhooks ativos, a consulta vira apenas uma rede de segurança.
+POLL_SEM_WEBHOOK = 1.0
+POLL_FALLBACK = 5.0
+# Com vários workers, o webhook de uma troca pode cair em outro processo: o polling precisa ser curto
+MULTI_WORKER = int(os.getenv("CHATBOT_WORKERS", 1)) > 1
+
+TIMEOUT_CONEXAO = 15
+TIMEOUT_EMISSAO = 30
+TIMEOUT_PROVA = 90
+
+# Emissão em lote: quantos /issue-credential-2.0/send ficam em voo ao mesmo tempo
+LOTE_CONCORRENCIA = 16
+
+# Liveness das conexões reaproveitadas: resposta do trust-ping e por quanto tempo ela vale
+TIMEOUT_PING = 3
+VALIDADE_PING = 30
+
+# Atributos revelados na prova de acesso (referente -> atributo da credencial de plano)
+ATRIBUTOS_PROVA = {"attr1": "franquia_gb", "attr2": "nome_plano"}
+
+# Pedidos de prova em andamento ao mesmo tempo: o Cliente gera as provas na CPU
+PROVA_MAX_CONCORRENCIA = int(os.getenv("PROVA_MAX_CONCORRENCIA", 4))
+
+# IDs do setup guardados no storage (arquivo JSON ou SQLite) para reiniciar sem refazer o setup
+CHAVES_PERSISTIDAS = ("operadora_did", "kyc_schema_id", "kyc_cred_def_id", "plano_schema_id", "plano_cred_def_id")
 
 # --- Estado em Memória ---
 STATE = {
@@ -16,26 +73,250 @@ STATE = {
     "kyc_schema_id": None,
     "kyc_cred_def_id": None,
     "plano_schema_id": None,
-    "plano_cred_def_id": None,
-    "conn_id_operadora": None,
-    "conn_id_verificador": None
+    "plano_cred_def_id": None
 }
+# Cache do processo; a fonte é o storage. As conexões de cada cliente ficam no registro de assinantes (subscribers.REGISTRO)
+
+# --- Persistência do Setup ---
+def carregar_estado() -> bool:
+    """Restaura os IDs do último setup salvos no storage. Retorna True se havia cache."""
+    salvo = STORAGE.ler_estado()
+    if not salvo:
+        return False
+
+    for chave in CHAVES_PERSISTIDAS:
+        STATE[chave] = salvo.get(chave)
+    logging.info(f"Setup restaurado do armazenamento: DID {STATE['operadora_did']}")
+    return True
+
+def salvar_estado() -> None:
+    STORAGE.salvar_estado({chave: STATE.get(chave) for chave in CHAVES_PERSISTIDAS})
+
+def id_setup(chave: str) -> Optional[str]:
+    """Lê um ID do setup. Se faltar e o storage for compartilhado, outro worker pode ter feito o setup."""
+    if not STATE.get(chave) and STORAGE.compartilhado:
+        carregar_estado()
+    return STATE.get(chave)
+
+def setup_completo() -> bool:
+    return all(STATE.get(chave) for chave in CHAVES_PERSISTIDAS)
 
 # --- Auxiliar HTTP ---
-async def admin_request(session, method, url, json_data=None, params=None):
+_AGENTE_POR_URL = {url: nome for nome, url in AGENTES.items()}
+
+def nome_agente(url: str) -> str:
+    for base, nome in _AGENTE_POR_URL.items():
+        if url.startswith(base):
+            return nome
+    return "outros"
+
+async def admin_request(session, method, url, json_data=None, params=None, idempotente=None):
+    """Chamada à API Admin de um agente. Retorna o JSON da resposta ou None em caso de erro.
+
+    Chamadas idempotentes (GET por padrão) são repetidas com backoff exponencial e
+    jitter em falhas transitórias. Um disjuntor por agente rejeita na hora as
+    chamadas enquanto o agente estiver fora do ar, em vez de empilhar timeouts.
+    A duração total (com retries) vai para o histograma `telco_admin_request_seconds`.
+    """
+    agente = nome_agente(url)
+    caminho = metrics.modelo_caminho(urlsplit(url).path)
+    async with metrics.span(f"admin {method} {agente} {caminho}", metrics.ADMIN_REQUEST, metodo=method, agente=agente, caminho=caminho, status="cancelado") as labels:
+        dados, labels["status"] = await _admin_request(session, agente, method, url, json_data, params, idempotente)
+    return dados
+
+async def _admin_request(session, agente, method, url, json_data, params, idempotente):
+    """Executa a chamada com retry e circuit breaker. Retorna (dados, status para as métricas)."""
+    disjuntor = resilience.breaker(agente)
+    metricas = resilience.metricas(agente)
+
+    if not disjuntor.permitir():
+        metricas["rejeitadas_breaker"] += 1
+        logging.error(f"Agente '{agente}' indisponível (circuit breaker aberto): {method} {url}")
+        return None, "breaker"
+
+    if idempotente is None:
+        idempotente = method.upper() in resilience.METODOS_IDEMPOTENTES
+    tentativas = resilience.RETRY_TENTATIVAS if idempotente else 1
+    fim_primeira = None # Tudo que passa deste ponto é latência adicionada pelos retries
+
+    def contabilizar_latencia_extra():
+        if fim_primeira is not None:
+            metricas["latencia_extra_s"] += time.monotonic() - fim_primeira
+
+    status = "erro"
+    for tentativa in range(tentativas):
+        transitorio = False
+        try:
+            async with session.request(method, url, json=json_data, params=params) as resp:
+                status = str(resp.status)
+                if resp.status >= 400:
+                    text = await resp.text()
+                    logging.error(f"Erro API {resp.status} em {url}: {text}")
+                    transitorio = resp.status in resilience.STATUS_TRANSITORIOS
+                    if not transitorio:
+                        disjuntor.registrar_sucesso() # 4xx: o agente respondeu, o erro é da chamada
+                        return None, status
+                else:
+                    dados = await resp.json()
+                    disjuntor.registrar_sucesso()
+                    contabilizar_latencia_extra()
+                    return dados, status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Exceção Request {url}: {e!r}")
+            status = "erro"
+            transitorio = True
+        except asyncio.CancelledError:
+            disjuntor.liberar_teste()
+            raise
+        except Exception as e:
+            logging.error(f"Exceção Request {url}: {e}")
+
+        metricas["falhas"] += 1
+        if fim_primeira is None:
+            fim_primeira = time.monotonic()
+        if disjuntor.registrar_falha():
+            metricas["breaker_aberturas"] += 1
+            logging.error(f"Circuit breaker aberto para o agente '{agente}' após {disjuntor.falhas_seguidas} falhas seguidas.")
+        if not transitorio or tentativa == tentativas - 1 or disjuntor.estado == resilience.ABERTO:
+            break
+
+        metricas["retries"] += 1
+        espera = resilience.espera_backoff(tentativa)
+        logging.warning(f"Repetindo {method} {url} em {espera:.2f}s (tentativa {tentativa + 2}/{tentativas})")
+        await asyncio.sleep(espera)
+
+    contabilizar_latencia_extra()
+    return None, status
+
+# --- Espera por Eventos ---
+async def aguardar_estado(topico: str, chave: str, estados, timeout: float, consultar, etapa: Optional[str] = None):
+    """Aguarda o webhook `topico`/`chave` atingir um dos `estados`.
+
+    `consultar` é uma corrotina sem argumentos que busca o registro na API Admin;
+    ela só é usada como fallback quando nenhum webhook chega dentro do intervalo.
+    A espera é medida no histograma `telco_wait_seconds` com a `etapa` e por onde
+    o resultado chegou (webhook, polling ou timeout).
+    """
+    etapa = etapa or topico
+
+    # Quem acompanha o progresso vê também os estados intermediários (ex.: request-sent -> presentation-received)
+    emitir = progress.emissor()
+    ultimo_estado = [None]
+
+    def transicao(registro):
+        estado = registro.get("state")
+        if estado and estado != ultimo_estado[0]:
+            ultimo_estado[0] = estado
+            emitir("transicao", etapa=etapa, state=estado)
+
+    remover_observador = BUS.observar(topico, chave, transicao) if progress.ativo() else None
     try:
-        async with session.request(method, url, json=json_data, params=params) as resp:
-            if resp.status >= 400:
-                text = await resp.text()
-                logging.error(f"Erro API {resp.status} em {url}: {text}")
+        return await _aguardar_estado(topico, chave, set(estados), timeout, consultar, etapa, transicao)
+    finally:
+        if remover_observador:
+            remover_observador()
+
+async def _aguardar_estado(topico, chave, estados, timeout, consultar, etapa, transicao):
+    async with metrics.span(f"espera {etapa}", metrics.ESPERA, etapa=etapa, resultado="cancelado") as labels:
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + timeout
+
+        while True:
+            restante = limite - loop.time()
+            if restante <= 0:
+                labels["resultado"] = "timeout"
                 return None
-            return await resp.json()
-    except Exception as e:
-        logging.error(f"Exceção Request {url}: {e}")
+
+            intervalo = POLL_FALLBACK if BUS.recebendo and not MULTI_WORKER else POLL_SEM_WEBHOOK
+            evento = await BUS.wait_for(topico, chave, estados, min(intervalo, restante))
+            if evento:
+                labels["resultado"] = "webhook"
+                return evento
+
+            registro = await consultar()
+            if registro:
+                transicao(registro)
+            if registro and registro.get("state") in estados:
+                labels["resultado"] = "polling"
+                return registro
+
+async def aguardar_conexao(session, admin_url: str, invi_msg_id: str, timeout: float = TIMEOUT_CONEXAO):
+    """Aguarda a conexão originada pelo convite `invi_msg_id` ficar ativa em `admin_url`."""
+    async def consultar():
+        conns = await admin_request(session, "GET", f"{admin_url}/connections", params={"invitation_msg_id": invi_msg_id})
+        if conns and conns.get("results"):
+            return conns["results"][0]
         return None
 
+    return await aguardar_estado("connections", invi_msg_id, {"active"}, timeout, consultar, etapa=f"conexao_{nome_agente(admin_url)}")
+
 # --- Funcionalidades de Telecom ---
 
+# Cadeias Schema -> CredDef publicadas pela operadora. São independentes entre si,
+# então rodam em paralelo; o prefixo define as chaves correspondentes no STATE.
+CADEIAS_SETUP = [
+    {
+        "prefixo": "kyc",
+        "rotulo": "Identidade",
+        "schema": {"name": "identidade-assinante", "version": "1.2", "attrNames": ["nome_completo", "cpf", "status_conta"]},
+        "tag": "kyc",
+    },
+    {
+        "prefixo": "plano",
+        "rotulo": "Plano",
+        "schema": {"name": "plano-dados", "version": "1.2", "attrNames": ["nome_plano", "franquia_gb", "validade"]},
+        "tag": "promo",
+    },
+]
+
+async def _buscar_schema(session: aiohttp.ClientSession, op_did: str, schema: Dict[str, Any]) -> Optional[str]:
+    """Procura um Schema já publicado pela operadora com o mesmo nome e versão."""
+    params = {"schema_issuer_id": op_did, "schema_name": schema["name"], "schema_version": schema["version"]}
+    resp = await admin_request(session, "GET", f"{OPERADORA_ADMIN}/anoncreds/schemas", params=params)
+    ids = (resp or {}).get("schema_ids") or []
+    return ids[0] if ids else None
+
+async def _buscar_cred_def(session: aiohttp.ClientSession, op_did: str, schema_id: str, tag: str) -> Optional[str]:
+    """Procura uma CredDef já publicada para o Schema. A API não filtra por tag, então filtramos aqui."""
+    params = {"issuer_id": op_did, "schema_id": schema_id}
+    resp = await admin_request(session, "GET", f"{OPERADORA_ADMIN}/anoncreds/credential-definitions", params=params)
+    ids = (resp or {}).get("credential_definition_ids") or []
+    for cred_def_id in ids:
+        if cred_def_id.endswith(f":{tag}"):
+            return cred_def_id
+    return None
+
+async def _publicar_cadeia(session: aiohttp.ClientSession, op_did: str, cadeia: Dict[str, Any]):
+    """Publica o Schema e a CredDef de uma cadeia. Retorna a mensagem de erro ou None.
+
+    Etapas já concluídas (IDs presentes no STATE) são puladas e objetos que já
+    existem no ledger são reaproveitados, o que permite retomar um setup que
+    falhou no meio sem cair em "Schema already exists".
+    """
+    chave_schema = f"{cadeia['prefixo']}_schema_id"
+    chave_cred_def = f"{cadeia['prefixo']}_cred_def_id"
+
+    if not STATE.get(chave_schema):
+        STATE[chave_schema] = await _buscar_schema(session, op_did, cadeia["schema"])
+
+    if not STATE.get(chave_schema):
+        body = {"schema": {"issuerId": op_did, **cadeia["schema"]}}
+        resp = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/anoncreds/schema", body)
+        if not resp: return f"Erro ao criar Schema de {cadeia['rotulo']} (verifique os logs do terminal do chatbot)."
+        STATE[chave_schema] = resp["schema_state"]["schema_id"]
+
+    if not STATE.get(chave_cred_def):
+        STATE[chave_cred_def] = await _buscar_cred_def(session, op_did, STATE[chave_schema], cadeia["tag"])
+
+    if not STATE.get(chave_cred_def):
+        body = {"credential_definition": {"issuerId": op_did, "schemaId": STATE[chave_schema], "tag": cadeia["tag"]}}
+        resp = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/anoncreds/credential-definition", body)
+        if not resp: return f"Erro ao criar CredDef de {cadeia['rotulo']}."
+        STATE[chave_cred_def] = resp["credential_definition_state"]["credential_definition_id"]
+
+    progress.emitir("cadeia_publicada", cadeia=cadeia["rotulo"], cred_def_id=STATE[chave_cred_def])
+    return None
+
 async def setup_telco(session: aiohttp.ClientSession) -> str:
     """Configura Schemas e CredDefs da TelecomX no Blockchain."""
     logging.info("Iniciando setup da TelecomX...")
@@ -46,67 +327,88 @@ async def setup_telco(session: aiohttp.ClientSession) -> str:
         return "Erro crítico: Não foi possível obter o DID público da Operadora. Verifique se o agente está rodando e conectado ao ledger."
     
     op_did = did_data["result"]["did"]
+    progress.emitir("did_obtido", did=op_did)
+    if STORAGE.compartilhado:
+        # Outro worker pode ter avançado o setup desde que este processo subiu
+        carregar_estado()
+    if STATE["operadora_did"] != op_did:
+        # DID novo: IDs de um setup anterior (parcial ou não) não valem mais
+        for cadeia in CADEIAS_SETUP:
+            STATE[f"{cadeia['prefixo']}_schema_id"] = None
+            STATE[f"{cadeia['prefixo']}_cred_def_id"] = None
     STATE["operadora_did"] = op_did
 
-    # 2. Schema e CredDef: Identidade (KYC)
-    s_kyc = {"schema": {"issuerId": op_did, "name": "identidade-assinante", "version": "1.2", "attrNames": ["nome_completo", "cpf", "status_conta"]}}
-    resp_s_kyc = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/anoncreds/schema", s_kyc)
-    
-    if not resp_s_kyc: return "Erro ao criar Schema de Identidade (verifique os logs do terminal do chatbot)."
-    STATE["kyc_schema_id"] = resp_s_kyc["schema_state"]["schema_id"]
+    if setup_completo():
+        return f"Infraestrutura TelecomX já configurada (cache local). DID: {op_did}"
 
-    cd_kyc = {"credential_definition": {"issuerId": op_did, "schemaId": STATE["kyc_schema_id"], "tag": "kyc"}}
-    resp_cd_kyc = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/anoncreds/credential-definition", cd_kyc)
-    
-    if not resp_cd_kyc: return "Erro ao criar CredDef de Identidade."
-    STATE["kyc_cred_def_id"] = resp_cd_kyc["credential_definition_state"]["credential_definition_id"]
+    # 2. Cadeias Identidade (KYC) e Plano (Promoção) em paralelo
+    resultados = await asyncio.gather(
+        *(_publicar_cadeia(session, op_did, cadeia) for cadeia in CADEIAS_SETUP),
+        return_exceptions=True,
+    )
 
-    # 3. Schema e CredDef: Plano (Promoção)
-    s_plano = {"schema": {"issuerId": op_did, "name": "plano-dados", "version": "1.2", "attrNames": ["nome_plano", "franquia_gb", "validade"]}}
-    resp_s_plano = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/anoncreds/schema", s_plano)
-    
-    if not resp_s_plano: return "Erro ao criar Schema de Plano."
-    STATE["plano_schema_id"] = resp_s_plano["schema_state"]["schema_id"]
+    erros = []
+    for cadeia, resultado in zip(CADEIAS_SETUP, resultados):
+        if isinstance(resultado, BaseException):
+            logging.error(f"Falha na cadeia {cadeia['rotulo']}: {resultado}")
+            erros.append(f"Erro inesperado na cadeia de {cadeia['rotulo']}: {resultado}")
+        elif resultado:
+            erros.append(resultado)
 
-    cd_plano = {"credential_definition": {"issuerId": op_did, "schemaId": STATE["plano_schema_id"], "tag": "promo"}}
-    resp_cd_plano = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/anoncreds/credential-definition", cd_plano)
-    
-    if not resp_cd_plano: return "Erro ao criar CredDef de Plano."
-    STATE["plano_cred_def_id"] = resp_cd_plano["credential_definition_state"]["credential_definition_id"]
+    # Salva inclusive o progresso parcial, para a retomada não repetir etapas
+    salvar_estado()
 
-    return f"Infraestrutura TelecomX configurada com sucesso. DID: {op_did}"
+    if erros:
+        return " | ".join(erros) + " Execute o setup novamente para retomar as etapas pendentes."
 
-async def conectar_cliente(session: aiohttp.ClientSession) -> str:
-    logging.info("Conectando cliente à Operadora...")
+    return f"Infraestrutura TelecomX configurada com sucesso. DID: {op_did}"
 
-    # 1. Convite da Operadora
+async def criar_convite(session: aiohttp.ClientSession) -> Optional[Dict[str, Any]]:
+    """Convite de uso único da Operadora (resposta de /out-of-band/create-invitation)."""
     body = {"handshake_protocols": ["https://didcomm.org/didexchange/1.0"]}
-    inv_resp = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/out-of-band/create-invitation", body)
+    return await admin_request(session, "POST", f"{OPERADORA_ADMIN}/out-of-band/create-invitation", body)
+
+async def descartar_convite(session: aiohttp.ClientSession, convite: Dict[str, Any]) -> None:
+    """Apaga na Operadora um convite do pool que expirou sem ser usado."""
+    if convite.get("oob_id"):
+        await admin_request(session, "DELETE", f"{OPERADORA_ADMIN}/out-of-band/invitations/{convite['oob_id']}")
+
+async def conectar_cliente(session: aiohttp.ClientSession, assinante: str = ASSINANTE_PADRAO) -> str:
+    logging.info(f"Conectando cliente '{assinante}' à Operadora...")
+
+    # 1. Convite da Operadora: do pool pré-gerado ou, se ele estiver vazio, criado na hora
+    inv_resp = INVITATION_POOL.retirar()
+    origem = "pool" if inv_resp else "na_hora"
+    if not inv_resp:
+        inv_resp = await criar_convite(session)
     if not inv_resp: return "Erro ao criar convite na Operadora."
+    progress.emitir("convite_criado", agente="operadora", invi_msg_id=inv_resp["invi_msg_id"], origem=origem)
 
     # 2. Cliente Aceita
     acc_resp = await admin_request(session, "POST", f"{CLIENTE_ADMIN}/out-of-band/receive-invitation", inv_resp["invitation"])
+    if not acc_resp and origem == "pool":
+        # O convite do pool pode não valer mais (ex.: carteira da Operadora recriada): tenta com um novo
+        inv_resp = await criar_convite(session)
+        if not inv_resp: return "Erro ao criar convite na Operadora."
+        progress.emitir("convite_criado", agente="operadora", invi_msg_id=inv_resp["invi_msg_id"], origem="na_hora")
+        acc_resp = await admin_request(session, "POST", f"{CLIENTE_ADMIN}/out-of-band/receive-invitation", inv_resp["invitation"])
     if not acc_resp: return "Erro ao receber convite no Cliente."
+    progress.emitir("convite_aceito", agente="operadora")
 
-    # 3. Resgatar ID da Conexão
-    await asyncio.sleep(2)
-    conns = await admin_request(session, "GET", f"{OPERADORA_ADMIN}/connections", params={"their_label": "Holder"})
-    
-    if conns and conns.get("results"):
-        # Pega a conexão mais recente (última da lista ou ordena se necessário)
-        STATE["conn_id_operadora"] = conns["results"][0]["connection_id"]
-        return "Cliente conectado e autenticado na base da TelecomX."
+    # 3. Resgatar ID da Conexão (correlacionada pelo convite, via webhook)
+    conexao = await aguardar_conexao(session, OPERADORA_ADMIN, inv_resp["invi_msg_id"])
+
+    if conexao:
+        await REGISTRO.registrar_conexao_operadora(assinante, conexao["connection_id"])
+        progress.emitir("conexao_ativa", agente="operadora", connection_id=conexao["connection_id"])
+        return f"Cliente '{assinante}' conectado e autenticado na base da TelecomX."
     
     return "Conexão iniciada, mas ID não encontrado na Operadora."
 
-async def ativar_plano(session: aiohttp.ClientSession, nome_plano: str, franquia: str) -> str:
-    conn_id = STATE.get("conn_id_operadora")
-    cred_def_id = STATE.get("plano_cred_def_id")
-
-    if not conn_id or not cred_def_id: return "Erro: Necessário setup e conexão prévia."
-
+async def _enviar_credencial_plano(session, conn_id: str, cred_def_id: str, nome_plano: str, franquia: str):
     body = {
         "connection_id": conn_id,
+        "auto_remove": False, # Mantém o registro para o polling de fallback
         "filter": {"anoncreds": {"cred_def_id": cred_def_id}},
         "credential_preview": {
             "@type": "issue-credential/2.0/credential-preview",
@@ -117,83 +419,376 @@ async def ativar_plano(session: aiohttp.ClientSession, nome_plano: str, franquia
             ]
         }
     }
+    return await admin_request(session, "POST", f"{OPERADORA_ADMIN}/issue-credential-2.0/send", body)
 
-    resp = await admin_request(session, "POST", f"{OPERADORA_ADMIN}/issue-credential-2.0/send", body)
-    if resp:
-        return f"Plano '{nome_plano}' ({franquia}) ativado na carteira do cliente."
-    return "Falha na ativação."
+async def ativar_plano(session: aiohttp.ClientSession, nome_plano: str, franquia: str, assinante: str = ASSINANTE_PADRAO) -> str:
+    registro_assinante = REGISTRO.get(assinante)
+    conn_id = registro_assinante.conn_id_operadora if registro_assinante else None
+    cred_def_id = id_setup("plano_cred_def_id")
 
-async def verificar_acesso(session: aiohttp.ClientSession) -> str:
-    logging.info("Iniciando verificação de rede...")
-    
-    cred_def_id = STATE.get("plano_cred_def_id")
-    if not cred_def_id: return "Erro: Sistema não configurado. Execute o setup primeiro."
+    if not conn_id or not cred_def_id: return f"Erro: Necessário setup e conexão prévia do assinante '{assinante}'."
 
-    # 1. Conexão Verificador <-> Cliente
-    # Criamos o convite
-    body_inv = {"handshake_protocols": ["https://didcomm.org/didexchange/1.0"]}
-    inv_resp = await admin_request(session, "POST", f"{VERIFICADOR_ADMIN}/out-of-band/create-invitation", body_inv)
-    
-    # O Cliente aceita
-    await admin_request(session, "POST", f"{CLIENTE_ADMIN}/out-of-band/receive-invitation", inv_resp["invitation"])
-    
-    # ESPERA INTELIGENTE PELA CONEXÃO
-    # Tenta por até 15 segundos encontrar a conexão ativa
-    verifier_conn_id = None
-    for _ in range(15):
-        await asyncio.sleep(1)
-        conns = await admin_request(session, "GET", f"{VERIFICADOR_ADMIN}/connections", params={"their_label": "Holder", "state": "active"})
-        if conns and conns.get("results"):
-            # Pega a mais recente
-            verifier_conn_id = conns["results"][-1]["connection_id"] # -1 pega a última da lista
+    resp = await _enviar_credencial_plano(session, conn_id, cred_def_id, nome_plano, franquia)
+    if not resp: return "Falha na ativação."
+
+    cred_ex_id = resp["cred_ex_id"]
+    await REGISTRO.registrar_emissao(assinante, cred_ex_id)
+    progress.emitir("credencial_oferecida", cred_ex_id=cred_ex_id)
+
+    async def consultar():
+        return await admin_request(session, "GET", f"{OPERADORA_ADMIN}/issue-credential-2.0/records/{cred_ex_id}")
+
+    STORAGE.registrar_pendente(cred_ex_id, "emissao", assinante)
+    try:
+        registro = await aguardar_estado("issue_credential_v2_0", cred_ex_id, {"done", "abandoned"}, TIMEOUT_EMISSAO, consultar, etapa="emissao")
+    finally:
+        STORAGE.concluir_pendente(cred_ex_id)
+
+    if not registro:
+        return f"Plano '{nome_plano}' ({franquia}) enviado; aguardando confirmação da carteira do cliente."
+    progress.emitir("emissao_concluida", cred_ex_id=cred_ex_id, state=registro["state"])
+    if registro["state"] == "abandoned":
+        return "O Cliente recusou a credencial do plano."
+    return f"Plano '{nome_plano}' ({franquia}) ativado na carteira do cliente."
+
+async def _ativar_item_lote(session, cred_def_id: str, indice: int, item: Dict[str, str]) -> Dict[str, Any]:
+    assinante = item.get("assinante") or ASSINANTE_PADRAO
+    resultado = {"indice": indice, "assinante": assinante, "nome_plano": item.get("nome_plano"), "franquia": item.get("franquia")}
+    inicio = time.monotonic()
+    try:
+        registro_assinante = REGISTRO.get(assinante)
+        conn_id = registro_assinante.conn_id_operadora if registro_assinante else None
+        if not conn_id:
+            resultado.update(ok=False, erro="Assinante sem conexão com a Operadora.")
+        else:
+            resp = await _enviar_credencial_plano(session, conn_id, cred_def_id, item["nome_plano"], item["franquia"])
+            if resp:
+                await REGISTRO.registrar_emissao(assinante, resp["cred_ex_id"])
+                resultado.update(ok=True, cred_ex_id=resp["cred_ex_id"])
+            else:
+                resultado.update(ok=False, erro="Falha ao enviar a credencial.")
+    except Exception as e:
+        resultado.update(ok=False, erro=f"Erro de execução: {e}")
+    resultado["latencia_ms"] = round((time.monotonic() - inicio) * 1000, 1)
+    return resultado
+
+async def ativar_planos_em_lote(session, itens: Iterable[Dict[str, str]], concorrencia: int = LOTE_CONCORRENCIA) -> AsyncIterator[Dict[str, Any]]:
+    """Emite credenciais de plano para vários assinantes com concorrência limitada.
+
+    Cada item tem `assinante`, `nome_plano` e `franquia`. Produz um resultado por
+    item à medida que terminam e, por último, um resumo com vazão e falhas. As
+    ofertas são enviadas sem esperar a carteira confirmar, para maximizar a vazão.
+    """
+    itens = list(itens)
+    inicio = time.monotonic()
+    cred_def_id = id_setup("plano_cred_def_id")
+    if not cred_def_id:
+        yield {"resumo": True, "total": len(itens), "sucesso": 0, "falhas": len(itens), "erro": "Sistema não configurado. Execute o setup primeiro."}
+        return
+
+    pendentes = iter(enumerate(itens))
+    concluidos: asyncio.Queue = asyncio.Queue()
+
+    async def trabalhador():
+        # O iterador é compartilhado: cada trabalhador pega o próximo item livre
+        for indice, item in pendentes:
+            concluidos.put_nowait(await _ativar_item_lote(session, cred_def_id, indice, item))
+
+    trabalhadores = [asyncio.create_task(trabalhador()) for _ in range(min(concorrencia, len(itens)))]
+    falhas_por_motivo: Dict[str, int] = {}
+    sucesso = 0
+    try:
+        for _ in range(len(itens)):
+            resultado = await concluidos.get()
+            if resultado["ok"]:
+                sucesso += 1
+            else:
+                falhas_por_motivo[resultado["erro"]] = falhas_por_motivo.get(resultado["erro"], 0) + 1
+            yield resultado
+    finally:
+        # Se quem consome desistir (cliente desconectou), para de emitir
+        for tarefa in trabalhadores:
+            tarefa.cancel()
+
+    duracao = time.monotonic() - inicio
+    logging.info(f"Lote de planos: {sucesso}/{len(itens)} emitidos em {duracao:.2f}s")
+    yield {
+        "resumo": True,
+        "total": len(itens),
+        "sucesso": sucesso,
+        "falhas": len(itens) - sucesso,
+        "falhas_por_motivo": falhas_por_motivo,
+        "duracao_s": round(duracao, 3),
+        "itens_por_segundo": round(len(itens) / duracao, 2) if duracao > 0 else None,
+    }
+
+# Em ordem de inserção (um reset move a chave para o fim): os mais antigos ficam no começo
+_ultimo_ping_ok: Dict[str, float] = {}
+
+def _registrar_ping_ok(conn_id: str) -> None:
+    """Marca a conexão como viva e descarta as marcas que já passaram da validade."""
+    agora = time.monotonic()
+    _ultimo_ping_ok.pop(conn_id, None)
+    _ultimo_ping_ok[conn_id] = agora
+    for antigo, quando in list(_ultimo_ping_ok.items()):
+        if agora - quando < VALIDADE_PING:
             break
-    
-    if not verifier_conn_id:
-        return "Erro: Falha ao estabelecer conexão ativa entre Rede e Cliente (Timeout de conexão)."
-
-    # 2. Solicitar Prova
-    req_body = {
-        "connection_id": verifier_conn_id,
-        "presentation_request": {
-            "anoncreds": {
-                "name": "Verificacao de Rede TelecomX",
-                "version": "1.0",
-                "requested_attributes": {
-                    "attr1": {"name": "franquia_gb", "restrictions": [{"cred_def_id": cred_def_id}]},
-                    "attr2": {"name": "nome_plano", "restrictions": [{"cred_def_id": cred_def_id}]}
-                },
-                "requested_predicates": {}
+        del _ultimo_ping_ok[antigo]
+
+async def conexao_viva(session, admin_url: str, conn_id: str) -> bool:
+    """Checa se a conexão ainda está ativa e se o outro lado responde a um trust-ping."""
+    if time.monotonic() - _ultimo_ping_ok.get(conn_id, float("-inf")) < VALIDADE_PING:
+        return True
+
+    conn = await admin_request(session, "GET", f"{admin_url}/connections/{conn_id}")
+    if not conn or conn.get("state") not in ("active", "completed"):
+        return False
+
+    ping = await admin_request(session, "POST", f"{admin_url}/connections/{conn_id}/send-ping", {"comment": "liveness"})
+    if not ping:
+        return False
+
+    # A resposta só chega por webhook (agente com --monitor-ping). Sem webhooks, ou com
+    # vários workers (o webhook pode cair em outro processo), valem o registro ativo
+    # lido acima e o envio bem-sucedido do ping, como no polling de aguardar_estado.
+    if BUS.recebendo and not MULTI_WORKER:
+        resposta = await BUS.wait_for("ping", ping["thread_id"], {"response_received"}, TIMEOUT_PING)
+        if not resposta:
+            return False
+
+    _registrar_ping_ok(conn_id)
+    return True
+
+# --- Sessões de Verificação ---
+_semaforo_provas: Optional[asyncio.Semaphore] = None
+# Referências fracas: o lock some sozinho quando nenhuma sessão do assinante o segura ou espera
+_locks_conexao_verificador: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+SESSOES_VERIFICACAO: Dict[str, "VerificacaoSessao"] = {}
+STATS_VERIFICACAO = {"iniciadas": 0, "liberadas": 0, "negadas": 0, "falhas": 0}
+
+def _get_semaforo_provas() -> asyncio.Semaphore:
+    global _semaforo_provas
+    if _semaforo_provas is None:
+        _semaforo_provas = asyncio.Semaphore(PROVA_MAX_CONCORRENCIA)
+    return _semaforo_provas
+
+def _lock_conexao_verificador(assinante: str) -> asyncio.Lock:
+    lock = _locks_conexao_verificador.get(assinante)
+    if lock is None:
+        lock = _locks_conexao_verificador[assinante] = asyncio.Lock()
+    return lock
+
+class VerificacaoSessao:
+    """Uma verificação de acesso: conexão Verificador <-> Cliente, pedido de prova e resultado.
+
+    Cada etapa fica presa aos IDs da anterior (convite -> conexão -> troca de prova),
+    então várias sessões rodam em paralelo no mesmo loop sem pegar o registro de outra.
+    """
+
+    def __init__(self, assinante: str, cred_def_id: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.assinante = assinante
+        self.cred_def_id = cred_def_id
+        self.invi_msg_id: Optional[str] = None
+        self.conn_id: Optional[str] = None
+        self.pres_ex_id: Optional[str] = None
+        self.etapa = "criada"
+        self.resultado: Optional[str] = None
+        self.inicio = time.monotonic()
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "sessao": self.id,
+            "assinante": self.assinante,
+            "etapa": self.etapa,
+            "invi_msg_id": self.invi_msg_id,
+            "connection_id": self.conn_id,
+            "pres_ex_id": self.pres_ex_id,
+            "duracao_s": round(time.monotonic() - self.inicio, 3),
+        }
+
+    async def conectar(self, session) -> Optional[str]:
+        """Reaproveita a conexão do assinante ou cria uma nova. Retorna a mensagem de erro, se houver."""
+        self.etapa = "conexao"
+        # Sessões do mesmo assinante esperam aqui: só a primeira cria convite, as demais reaproveitam
+        async with _lock_conexao_verificador(self.assinante):
+            registro_assinante = REGISTRO.get(self.assinante)
+            conn_id = registro_assinante.conn_id_verificador if registro_assinante else None
+
+            if conn_id:
+                if await conexao_viva(session, VERIFICADOR_ADMIN, conn_id):
+                    logging.info(f"Reaproveitando conexão do Verificador {conn_id}")
+                    self.conn_id = conn_id
+                    progress.emitir("conexao_reaproveitada", agente="verificador", connection_id=conn_id)
+                    return None
+                logging.info(f"Conexão {conn_id} do Verificador não responde; criando uma nova.")
+                _ultimo_ping_ok.pop(conn_id, None)
+
+            # Criamos o convite
+            body_inv = {"handshake_protocols": ["https://didcomm.org/didexchange/1.0"]}
+            inv_resp = await admin_request(session, "POST", f"{VERIFICADOR_ADMIN}/out-of-band/create-invitation", body_inv)
+            if not inv_resp: return "Erro ao criar convite no Verificador."
+            self.invi_msg_id = inv_resp["invi_msg_id"]
+            progress.emitir("convite_criado", agente="verificador", invi_msg_id=self.invi_msg_id)
+
+            # O Cliente aceita
+            acc_resp = await admin_request(session, "POST", f"{CLIENTE_ADMIN}/out-of-band/receive-invitation", inv_resp["invitation"])
+            if not acc_resp: return "Erro ao receber convite do Verificador no Cliente."
+
+            # ESPERA PELA CONEXÃO originada por este convite (até 15 segundos)
+            conexao = await aguardar_conexao(session, VERIFICADOR_ADMIN, self.invi_msg_id)
+            if not conexao:
+                return "Erro: Falha ao estabelecer conexão ativa entre Rede e Cliente (Timeout de conexão)."
+
+            self.conn_id = conexao["connection_id"]
+            await REGISTRO.registrar_conexao_verificador(self.assinante, self.conn_id)
+            _registrar_ping_ok(self.conn_id)
+            progress.emitir("conexao_ativa", agente="verificador", connection_id=self.conn_id)
+            return None
+
+    def _pedido_prova(self) -> Dict[str, Any]:
+        restricoes = [{"cred_def_id": self.cred_def_id}]
+        return {
+            "connection_id": self.conn_id,
+            "presentation_request": {
+                "anoncreds": {
+                    "name": "Verificacao de Rede TelecomX",
+                    "version": "1.0",
+                    "requested_attributes": {
+                        referente: {"name": atributo, "restrictions": restricoes} for referente, atributo in ATRIBUTOS_PROVA.items()
+                    },
+                    "requested_predicates": {}
+                }
             }
         }
-    }
-    
-    proof_resp = await admin_request(session, "POST", f"{VERIFICADOR_ADMIN}/present-proof-2.0/send-request", req_body)
-    if not proof_resp: return "Erro ao enviar pedido de prova."
-    
-    pres_ex_id = proof_resp["pres_ex_id"]
-
-    # 3. Aumento de verificação para 90 segundos
-    logging.info("Aguardando prova do cliente (pode demorar devido à carga da CPU)...")
-    for i in range(90):
-        await asyncio.sleep(1)
-        record = await admin_request(session, "GET", f"{VERIFICADOR_ADMIN}/present-proof-2.0/records/{pres_ex_id}")
-        
-        if not record: continue
-        
+
+    async def provar(self, session):
+        """Pede a prova e aguarda o resultado. Retorna (registro, None) ou (None, mensagem de erro).
+
+        O semáforo global cobre do pedido ao resultado: é nesse intervalo que o
+        Cliente gera a prova na CPU.
+        """
+        self.etapa = "fila_prova"
+        progress.emitir("fila_prova")
+        semaforo = _get_semaforo_provas()
+        async with metrics.span("fila prova", metrics.ESPERA, etapa="fila_prova", resultado="cancelado") as labels:
+            await semaforo.acquire()
+            labels["resultado"] = "liberada"
+        try:
+            self.etapa = "prova"
+            proof_resp = await admin_request(session, "POST", f"{VERIFICADOR_ADMIN}/present-proof-2.0/send-request", self._pedido_prova())
+            if not proof_resp: return None, "Erro ao enviar pedido de prova."
+            self.pres_ex_id = proof_resp["pres_ex_id"]
+            progress.emitir("prova_solicitada", pres_ex_id=self.pres_ex_id)
+
+            # Aguarda a prova por até 90 segundos (webhook, com polling de fallback)
+            logging.info(f"Aguardando prova do cliente (sessão {self.id}, pode demorar devido à carga da CPU)...")
+            url_registro = f"{VERIFICADOR_ADMIN}/present-proof-2.0/records/{self.pres_ex_id}"
+
+            async def consultar():
+                return await admin_request(session, "GET", url_registro)
+
+            STORAGE.registrar_pendente(self.pres_ex_id, "prova", self.assinante)
+            try:
+                record = await aguardar_estado("present_proof_v2_0", self.pres_ex_id, {"done", "verified", "abandoned"}, TIMEOUT_PROVA, consultar, etapa="prova")
+            finally:
+                STORAGE.concluir_pendente(self.pres_ex_id)
+        finally:
+            semaforo.release()
+
+        if not record:
+            return None, "Timeout: O Cliente demorou muito para responder (Tente novamente)."
+
+        # O payload do webhook pode vir sem a apresentação; nesse caso busca o registro completo
+        if record["state"] != "abandoned" and "by_format" not in record:
+            record = await admin_request(session, "GET", url_registro) or record
+
+        if record.get("connection_id") not in (None, self.conn_id):
+            logging.error(f"Prova {self.pres_ex_id} veio da conexão {record.get('connection_id')}, esperada {self.conn_id}")
+            return None, "Erro: A prova recebida não pertence a esta verificação."
+        return record, None
+
+    async def executar(self, session) -> str:
+        logging.info(f"Iniciando verificação de rede do assinante '{self.assinante}' (sessão {self.id})...")
+        SESSOES_VERIFICACAO[self.id] = self
+        STATS_VERIFICACAO["iniciadas"] += 1
+        try:
+            resposta, self.resultado = await self._executar(session)
+        finally:
+            SESSOES_VERIFICACAO.pop(self.id, None)
+        STATS_VERIFICACAO[self.resultado] += 1
+        return resposta
+
+    async def _executar(self, session):
+        # 1. Conexão Verificador <-> Cliente (reaproveitada enquanto responder ao trust-ping)
+        erro = await self.conectar(session)
+        if erro: return erro, "falhas"
+
+        # 2. Pedido de prova e resultado
+        record, erro = await self.provar(session)
+        if erro: return erro, "falhas"
+
+        self.etapa = "concluida"
         state = record["state"]
-        logging.info(f"Status da prova ({i}s): {state}") # Log para você acompanhar
-
-        if state == "done" or state == "verified":
-            if str(record["verified"]).lower() == "true":
-                try:
-                    dados = record["by_format"]["pres"]["anoncreds"]["presentation"]["requested_proof"]["revealed_attrs"]
-                    return f"Acesso Liberado! Plano: {dados['attr2']['raw']} | Franquia: {dados['attr1']['raw']}"
-                except KeyError:
-                    return "Verificado, mas erro ao ler dados."
-            else:
-                return "Acesso Negado! Credencial inválida."
-        
+        logging.info(f"Status da prova: {state}") # Log para você acompanhar
+        progress.emitir("prova_recebida", pres_ex_id=self.pres_ex_id, state=state, verified=record.get("verified"))
+
         if state == "abandoned":
-             return "O Cliente rejeitou o pedido de prova."
-                
-    return "Timeout: O Cliente demorou muito para responder (Tente novamente)."
\ No newline at end of file
+            return "O Cliente rejeitou o pedido de prova.", "negadas"
+
+        if str(record.get("verified")).lower() == "true":
+            try:
+                dados = record["by_format"]["pres"]["anoncreds"]["presentation"]["requested_proof"]["revealed_attrs"]
+                return f"Acesso Liberado! Plano: {dados['attr2']['raw']} | Franquia: {dados['attr1']['raw']}", "liberadas"
+            except KeyError:
+                return "Verificado, mas erro ao ler dados.", "falhas"
+        return "Acesso Negado! Credencial inválida.", "negadas"
+
+def get_verification_stats() -> Dict[str, Any]:
+    """Contadores das verificações e as sessões em andamento com a etapa de cada uma."""
+    return {
+        **STATS_VERIFICACAO,
+        "limite_provas": PROVA_MAX_CONCORRENCIA,
+        "cache": PROOF_CACHE.get_stats(),
+        "em_andamento": [sessao.resumo() for sessao in SESSOES_VERIFICACAO.values()],
+    }
+
+async def verificar_acesso(session: aiohttp.ClientSession, assinante: str = ASSINANTE_PADRAO) -> str:
+    cred_def_id = id_setup("plano_cred_def_id")
+    if not cred_def_id: return "Erro: Sistema não configurado. Execute o setup primeiro."
+
+    # A carteira do Cliente é uma só: a prova não distingue assinantes, então quem
+    # não passou pelo onboarding e não recebeu plano é negado antes de pedir prova
+    registro_assinante = REGISTRO.get(assinante)
+    if not registro_assinante or not registro_assinante.conn_id_operadora:
+        STATS_VERIFICACAO["negadas"] += 1
+        return f"Acesso Negado! Assinante '{assinante}' não está conectado à Operadora."
+    if not registro_assinante.cred_ex_ids:
+        STATS_VERIFICACAO["negadas"] += 1
+        return f"Acesso Negado! Assinante '{assinante}' não tem plano ativado."
+
+    # Verificação aprovada há pouco, sem emissão nova desde então, dispensa uma nova prova
+    chave_cache = proof_cache.chave(assinante, cred_def_id, ATRIBUTOS_PROVA.values())
+    emissoes = registro_assinante.cred_ex_ids
+    if PROOF_CACHE.ativo:
+        resposta = PROOF_CACHE.get(chave_cache, emissoes)
+        if resposta:
+            logging.info(f"Verificação do assinante '{assinante}' respondida pelo cache de provas.")
+            progress.emitir("cache_prova", assinante=assinante)
+            return resposta
+
+    sessao = VerificacaoSessao(assinante, cred_def_id)
+    resposta = await sessao.executar(session)
+    if sessao.resultado == "liberadas":
+        PROOF_CACHE.put(chave_cache, emissoes, resposta)
+    return resposta
+
+def _invalidar_cache_prova(payload: Dict[str, Any]) -> None:
+    """Webhook de revogação (issuer_cred_rev) na Operadora: a prova em cache do assinante deixa de valer."""
+    if payload.get("state") != "revoked":
+        return
+    assinante = REGISTRO.por_cred_ex(payload.get("cred_ex_id") or "")
+    if assinante and PROOF_CACHE.invalidar(assinante.assinante_id):
+        logging.info(f"Cache de provas do assinante '{assinante.assinante_id}' invalidado por revogação.")
+
+BUS.assinar("issuer_cred_rev", _invalidar_cache_prova)
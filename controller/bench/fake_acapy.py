@@ -0,0 +1,276 @@
+"""Substituto local das APIs Admin da Operadora, do Cliente e do Verificador.
+
+Implementa só os endpoints que o acapy_controller usa, com latência configurável
+e transições de estado assíncronas (com webhooks para o chatbot_server), para
+medir o pipeline /chat -> controller -> agentes sem ledger, aca-py ou wallets.
+
+Uso (a partir de controller/):
+    python bench/fake_acapy.py --webhook-url http://localhost:8080/webhooks
+"""
+import argparse
+import asyncio
+import logging
+import random
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DID_OPERADORA = "Th7MpTaRZVRYnPiabds81Y"
+
+
+class Rede:
+    """Mundo compartilhado entre os três agentes falsos (convites, ledger e configuração)."""
+
+    def __init__(self, args):
+        self.args = args
+        self.agentes: Dict[str, "AgenteFake"] = {}
+        self.convites: Dict[str, "AgenteFake"] = {}
+        self.schemas: List[str] = []
+        self.cred_defs: List[Tuple[str, str]] = []
+        self.ultima_credencial = {"nome_plano": "Plano Bench", "franquia_gb": "50GB"}
+        self.sessao: Optional[aiohttp.ClientSession] = None
+
+    def atraso(self, base: float) -> float:
+        """Latência com ±50% de jitter, para não sincronizar as requisições."""
+        return base * random.uniform(0.5, 1.5) if base > 0 else 0.0
+
+
+class AgenteFake:
+    def __init__(self, nome: str, label: str, rede: Rede, webhook_url: Optional[str]):
+        self.nome = nome
+        self.label = label
+        self.rede = rede
+        self.webhook_url = webhook_url
+        self.conexoes: Dict[str, Dict[str, Any]] = {}
+        self.emissoes: Dict[str, Dict[str, Any]] = {}
+        self.provas: Dict[str, Dict[str, Any]] = {}
+        self._tarefas = set()
+
+    # --- Webhooks e transições ---
+    async def webhook(self, topico: str, payload: Dict[str, Any]) -> None:
+        if not self.webhook_url or self.rede.args.sem_webhooks:
+            return
+        try:
+            async with self.rede.sessao.post(f"{self.webhook_url}/topic/{topico}/", json=payload) as resp:
+                await resp.read()
+        except aiohttp.ClientError as e:
+            logging.warning(f"[{self.nome}] webhook {topico} falhou: {e}")
+
+    def agendar(self, registro: Dict[str, Any], topico: str, passos: List[Tuple[float, Dict[str, Any]]]) -> None:
+        """Aplica cada (atraso, alterações) ao registro, em ordem, emitindo um webhook por passo."""
+        async def transicionar():
+            for atraso, alteracoes in passos:
+                await asyncio.sleep(self.rede.atraso(atraso))
+                registro.update(alteracoes)
+                await self.webhook(topico, dict(registro))
+
+        tarefa = asyncio.create_task(transicionar())
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    # --- Rotas ---
+    def rotas(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware_latencia])
+        app.add_routes([
+            web.get("/status/ready", self.status_ready),
+            web.get("/wallet/did/public", self.did_publico),
+            web.get("/anoncreds/schemas", self.listar_schemas),
+            web.post("/anoncreds/schema", self.criar_schema),
+            web.get("/anoncreds/credential-definitions", self.listar_cred_defs),
+            web.post("/anoncreds/credential-definition", self.criar_cred_def),
+            web.post("/out-of-band/create-invitation", self.criar_convite),
+            web.post("/out-of-band/receive-invitation", self.receber_convite),
+            web.delete("/out-of-band/invitations/{oob_id}", self.apagar_convite),
+            web.get("/connections", self.listar_conexoes),
+            web.get("/connections/{conn_id}", self.obter_conexao),
+            web.post("/connections/{conn_id}/send-ping", self.enviar_ping),
+            web.post("/issue-credential-2.0/send", self.emitir),
+            web.get("/issue-credential-2.0/records/{cred_ex_id}", self.obter_emissao),
+            web.post("/present-proof-2.0/send-request", self.pedir_prova),
+            web.get("/present-proof-2.0/records/{pres_ex_id}", self.obter_prova),
+        ])
+        return app
+
+    @web.middleware
+    async def middleware_latencia(self, request: web.Request, handler):
+        await asyncio.sleep(self.rede.atraso(self.rede.args.latencia_admin))
+        if request.path != "/status/ready" and random.random() < self.rede.args.taxa_erro:
+            return web.json_response({"erro": "falha simulada"}, status=503)
+        return await handler(request)
+
+    async def status_ready(self, request):
+        return web.json_response({"ready": True})
+
+    async def did_publico(self, request):
+        return web.json_response({"result": {"did": DID_OPERADORA}})
+
+    async def listar_schemas(self, request):
+        nome, versao = request.query.get("schema_name"), request.query.get("schema_version")
+        ids = [s for s in self.rede.schemas if s.endswith(f":2:{nome}:{versao}")]
+        return web.json_response({"schema_ids": ids})
+
+    async def criar_schema(self, request):
+        schema = (await request.json())["schema"]
+        schema_id = f"{schema['issuerId']}:2:{schema['name']}:{schema['version']}"
+        await asyncio.sleep(self.rede.atraso(self.rede.args.latencia_ledger))
+        if schema_id not in self.rede.schemas:
+            self.rede.schemas.append(schema_id)
+        return web.json_response({"schema_state": {"state": "finished", "schema_id": schema_id}})
+
+    async def listar_cred_defs(self, request):
+        schema_id = request.query.get("schema_id")
+        ids = [cd for s, cd in self.rede.cred_defs if s == schema_id]
+        return web.json_response({"credential_definition_ids": ids})
+
+    async def criar_cred_def(self, request):
+        cred_def = (await request.json())["credential_definition"]
+        await asyncio.sleep(self.rede.atraso(self.rede.args.latencia_ledger * 3)) # CredDef é a escrita mais lenta
+        cred_def_id = f"{cred_def['issuerId']}:3:CL:{len(self.rede.cred_defs) + 10}:{cred_def['tag']}"
+        self.rede.cred_defs.append((cred_def["schemaId"], cred_def_id))
+        return web.json_response({"credential_definition_state": {"state": "finished", "credential_definition_id": cred_def_id}})
+
+    async def criar_convite(self, request):
+        invi_msg_id = str(uuid.uuid4())
+        self.rede.convites[invi_msg_id] = self
+        convite = {"@type": "https://didcomm.org/out-of-band/1.1/invitation", "@id": invi_msg_id, "label": self.label}
+        return web.json_response({"invitation": convite, "invi_msg_id": invi_msg_id, "oob_id": invi_msg_id, "state": "initial"})
+
+    async def apagar_convite(self, request):
+        self.rede.convites.pop(request.match_info["oob_id"], None)
+        return web.json_response({})
+
+    async def receber_convite(self, request):
+        convite = await request.json()
+        emissor = self.rede.convites.get(convite.get("@id"))
+        if emissor is None:
+            return web.json_response({"erro": "convite desconhecido"}, status=400)
+
+        meu_registro = {"connection_id": str(uuid.uuid4()), "invitation_msg_id": convite["@id"], "their_label": emissor.label, "state": "request"}
+        registro_emissor = {"connection_id": str(uuid.uuid4()), "invitation_msg_id": convite["@id"], "their_label": self.label, "state": "request"}
+        self.conexoes[meu_registro["connection_id"]] = meu_registro
+        emissor.conexoes[registro_emissor["connection_id"]] = registro_emissor
+
+        latencia = self.rede.args.latencia_conexao
+        emissor.agendar(registro_emissor, "connections", [(latencia / 2, {"state": "response"}), (latencia / 2, {"state": "active"})])
+        self.agendar(meu_registro, "connections", [(latencia, {"state": "active"})])
+        return web.json_response(meu_registro)
+
+    async def listar_conexoes(self, request):
+        filtros = {k: v for k, v in request.query.items() if k in ("invitation_msg_id", "their_label", "state")}
+        resultados = [c for c in self.conexoes.values() if all(c.get(k) == v for k, v in filtros.items())]
+        return web.json_response({"results": resultados})
+
+    async def obter_conexao(self, request):
+        conexao = self.conexoes.get(request.match_info["conn_id"])
+        if conexao is None:
+            return web.json_response({"erro": "não encontrada"}, status=404)
+        return web.json_response(conexao)
+
+    async def enviar_ping(self, request):
+        if request.match_info["conn_id"] not in self.conexoes:
+            return web.json_response({"erro": "não encontrada"}, status=404)
+        thread_id = str(uuid.uuid4())
+        registro = {"thread_id": thread_id, "connection_id": request.match_info["conn_id"], "state": "sent"}
+        self.agendar(registro, "ping", [(self.rede.args.latencia_admin, {"state": "response_received", "responded": True})])
+        return web.json_response({"thread_id": thread_id})
+
+    async def emitir(self, request):
+        body = await request.json()
+        if body.get("connection_id") not in self.conexoes:
+            return web.json_response({"erro": "conexão não encontrada"}, status=404)
+        atributos = {a["name"]: a["value"] for a in body["credential_preview"]["attributes"]}
+        registro = {"cred_ex_id": str(uuid.uuid4()), "connection_id": body["connection_id"], "state": "offer-sent"}
+        self.emissoes[registro["cred_ex_id"]] = registro
+
+        latencia = self.rede.args.latencia_emissao
+        self.agendar(registro, "issue_credential_v2_0", [(latencia / 2, {"state": "credential-issued"}), (latencia / 2, {"state": "done"})])
+        self.rede.ultima_credencial = atributos
+        return web.json_response(dict(registro))
+
+    async def obter_emissao(self, request):
+        registro = self.emissoes.get(request.match_info["cred_ex_id"])
+        if registro is None:
+            return web.json_response({"erro": "não encontrado"}, status=404)
+        return web.json_response(registro)
+
+    async def pedir_prova(self, request):
+        body = await request.json()
+        if body.get("connection_id") not in self.conexoes:
+            return web.json_response({"erro": "conexão não encontrada"}, status=404)
+        registro = {"pres_ex_id": str(uuid.uuid4()), "connection_id": body["connection_id"], "state": "request-sent"}
+        self.provas[registro["pres_ex_id"]] = registro
+
+        credencial = self.rede.ultima_credencial
+        revelados = {
+            "attr1": {"raw": credencial.get("franquia_gb", "")},
+            "attr2": {"raw": credencial.get("nome_plano", "")},
+        }
+        final = {
+            "state": "done",
+            "verified": "true",
+            "by_format": {"pres": {"anoncreds": {"presentation": {"requested_proof": {"revealed_attrs": revelados}}}}},
+        }
+        latencia = self.rede.args.latencia_prova
+        self.agendar(registro, "present_proof_v2_0", [(latencia * 0.9, {"state": "presentation-received"}), (latencia * 0.1, final)])
+        return web.json_response(dict(registro))
+
+    async def obter_prova(self, request):
+        registro = self.provas.get(request.match_info["pres_ex_id"])
+        if registro is None:
+            return web.json_response({"erro": "não encontrado"}, status=404)
+        return web.json_response(registro)
+
+
+async def main(args):
+    rede = Rede(args)
+    rede.sessao = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    agentes = [
+        ("operadora", "Issuer", args.porta_operadora, args.webhook_url),
+        ("cliente", "Holder", args.porta_cliente, None),
+        ("verificador", "Verifier", args.porta_verificador, args.webhook_url),
+    ]
+
+    runners = []
+    for nome, label, porta, webhook_url in agentes:
+        agente = AgenteFake(nome, label, rede, webhook_url)
+        rede.agentes[nome] = agente
+        runner = web.AppRunner(agente.rotas(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, args.host, porta).start()
+        runners.append(runner)
+        logging.info(f"ACA-Py falso '{nome}' ouvindo em http://{args.host}:{porta}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        await rede.sessao.close()
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="APIs Admin falsas do ACA-Py para benchmark do controller.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta-operadora", type=int, default=8001)
+    parser.add_argument("--porta-cliente", type=int, default=8011)
+    parser.add_argument("--porta-verificador", type=int, default=8021)
+    parser.add_argument("--webhook-url", default="http://localhost:8080/webhooks", help="Base de webhooks do chatbot_server.")
+    parser.add_argument("--sem-webhooks", action="store_true", help="Não envia webhooks (força o polling de fallback).")
+    parser.add_argument("--latencia-admin", type=float, default=0.005, help="Segundos por chamada Admin.")
+    parser.add_argument("--latencia-ledger", type=float, default=0.2, help="Segundos por escrita de Schema (CredDef = 3x).")
+    parser.add_argument("--latencia-conexao", type=float, default=0.3, help="Segundos até a conexão ficar ativa.")
+    parser.add_argument("--latencia-emissao", type=float, default=0.3, help="Segundos até a emissão chegar a 'done'.")
+    parser.add_argument("--latencia-prova", type=float, default=2.0, help="Segundos até a prova ser verificada.")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Probabilidade de responder 503 (exercita retries).")
+    return parser
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(arg_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,69 @@
+"""Substituto local do endpoint /api/chat do Ollama para benchmark.
+
+Responde com uma chamada de função em JSON depois de uma latência configurável.
+Por padrão atende uma geração por vez, como o Phi-3 rodando em CPU.
+
+Uso (a partir de controller/):
+    python bench/fake_ollama.py --latencia 1.5
+    OLLAMA_URL=http://localhost:11434/api/chat python chatbot_server.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_client import match_fast_path  # noqa:E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Resposta para frases que nem o fast-path reconhece (o modelo "chutaria" algo plausível)
+RESPOSTA_PADRAO = {"function_name": "ativar_plano", "parameters": {"nome_plano": "Plano Bench", "franquia": "50GB"}}
+
+
+def criar_app(args) -> web.Application:
+    semaforo = asyncio.Semaphore(args.paralelismo)
+    stats = {"geracoes": 0}
+
+    async def chat(request: web.Request):
+        payload = await request.json()
+        mensagem = next((m["content"] for m in reversed(payload.get("messages", [])) if m.get("role") == "user"), "")
+
+        async with semaforo:
+            await asyncio.sleep(args.latencia * random.uniform(0.8, 1.2))
+            stats["geracoes"] += 1
+
+        resposta = match_fast_path(mensagem) or RESPOSTA_PADRAO
+        return web.json_response({
+            "model": payload.get("model"),
+            "message": {"role": "assistant", "content": json.dumps(resposta, ensure_ascii=False)},
+            "done": True,
+        })
+
+    async def status(request: web.Request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.add_routes([web.post("/api/chat", chat), web.get("/stats", status)])
+    return app
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Ollama falso (/api/chat) para benchmark do chatbot_server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=11434)
+    parser.add_argument("--latencia", type=float, default=1.5, help="Segundos por geração.")
+    parser.add_argument("--paralelismo", type=int, default=1, help="Gerações simultâneas (CPU = 1).")
+    return parser
+
+
+if __name__ == "__main__":
+    args = arg_parser().parse_args()
+    logging.info(f"Ollama falso em http://{args.host}:{args.porta}/api/chat (latência {args.latencia}s, paralelismo {args.paralelismo})")
+    web.run_app(criar_app(args), host=args.host, port=args.porta, access_log=None, print=None)
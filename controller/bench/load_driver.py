@@ -0,0 +1,263 @@
+"""Gerador de carga para o pipeline /chat -> controller -> agentes.
+
+Dispara mensagens de chat com uma mistura de funções a uma taxa alvo (RPS).
+A carga é em malha aberta: as chegadas são agendadas no relógio, não quando
+a resposta anterior volta, então filas no servidor aparecem na latência. O
+relatório traz p50/p95/p99 e vazão por função, e pode ser salvo em JSON e
+comparado com uma execução anterior para pegar regressões.
+
+Uso (a partir de controller/, com chatbot_server e os falsos rodando):
+    python bench/load_driver.py --rps 20 --duracao 60 --mix conectar=1,ativar=3,verificar=2,livre=1 \\
+        --saida resultados/atual.json --comparar resultados/base.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Mensagem de cada tipo de carga. `{assinante}` vira um assinante já conectado na preparação.
+MENSAGENS = {
+    "setup": "Iniciar sistema",
+    "conectar": "Conectar cliente do assinante {novo}",
+    "ativar": "Ative o plano Bench com 50GB para o assinante {assinante}",
+    "verificar": "Verificar acesso do assinante {assinante}",
+    # Frase inédita a cada envio: passa pelo cache sem acertar e vai até o modelo
+    "livre": "Quero contratar um pacote de internet {aleatorio}",
+}
+
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    """Percentil pelo método nearest-rank (sem interpolação)."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    # Mesmo cálculo de agents/load_support.percentile: os dois harnesses reportam os mesmos números
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def resumir(amostras: List[Dict[str, Any]], duracao: float) -> Dict[str, Any]:
+    latencias = [a["latencia_s"] for a in amostras if a["ok"]]
+    return {
+        "requisicoes": len(amostras),
+        "sucesso": len(latencias),
+        "falhas": len(amostras) - len(latencias),
+        "vazao_rps": round(len(latencias) / duracao, 3) if duracao > 0 else None,
+        "p50_ms": _ms(percentil(latencias, 50)),
+        "p95_ms": _ms(percentil(latencias, 95)),
+        "p99_ms": _ms(percentil(latencias, 99)),
+        "max_ms": _ms(max(latencias) if latencias else None),
+    }
+
+
+def _ms(segundos: Optional[float]) -> Optional[float]:
+    return round(segundos * 1000, 1) if segundos is not None else None
+
+
+def parse_mix(texto: str) -> Dict[str, float]:
+    mix = {}
+    for parte in texto.split(","):
+        nome, _, peso = parte.partition("=")
+        nome = nome.strip()
+        if nome not in MENSAGENS:
+            raise argparse.ArgumentTypeError(f"Tipo de carga desconhecido: {nome} (use {', '.join(MENSAGENS)})")
+        mix[nome] = float(peso or 1)
+    return mix
+
+
+def versao_git() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Driver:
+    def __init__(self, args):
+        self.args = args
+        self.assinantes: List[str] = []
+        self.amostras: List[Dict[str, Any]] = []
+        self._contador_novos = 0
+
+    def montar_mensagem(self, tipo: str) -> str:
+        self._contador_novos += 1
+        return MENSAGENS[tipo].format(
+            assinante=random.choice(self.assinantes) if self.assinantes else "padrao",
+            novo=f"{self.args.prefixo}-novo-{self._contador_novos}",
+            aleatorio=uuid.uuid4().hex[:8],
+        )
+
+    async def enviar(self, sessao: aiohttp.ClientSession, tipo: str, mensagem: str, registrar: bool = True) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        amostra = {"tipo": tipo, "ok": False}
+        try:
+            async with sessao.post(f"{self.args.url}/chat", json={"message": mensagem}) as resp:
+                corpo = await resp.json(content_type=None)
+                resposta = (corpo or {}).get("response", "")
+                amostra["status"] = resp.status
+                # O controller devolve erros como texto com status 200
+                amostra["ok"] = resp.status == 200 and not str(resposta).startswith(("Erro", "Falha", "Timeout"))
+                amostra["resposta"] = resposta if not amostra["ok"] else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            amostra["status"] = None
+            amostra["resposta"] = repr(e)
+        amostra["latencia_s"] = time.perf_counter() - inicio
+        if registrar:
+            self.amostras.append(amostra)
+        return amostra
+
+    async def preparar(self, sessao: aiohttp.ClientSession) -> None:
+        """Setup da operadora e onboarding dos assinantes usados por ativar/verificar."""
+        setup = await self.enviar(sessao, "setup", MENSAGENS["setup"], registrar=False)
+        if not setup["ok"]:
+            raise SystemExit(f"Setup falhou: {setup.get('resposta')}")
+
+        # "padrao" atende as frases livres, que o modelo interpreta sem assinante explícito
+        candidatos = ["padrao"] + [f"{self.args.prefixo}-{i}" for i in range(self.args.assinantes)]
+        semaforo = asyncio.Semaphore(8)
+
+        async def conectar(assinante):
+            async with semaforo:
+                r = await self.enviar(sessao, "conectar", f"Conectar cliente do assinante {assinante}", registrar=False)
+            if r["ok"]:
+                self.assinantes.append(assinante)
+            else:
+                logging.warning(f"Onboarding de {assinante} falhou: {r.get('resposta')}")
+
+        await asyncio.gather(*(conectar(a) for a in candidatos))
+        # Emite um plano para cada um, para que as verificações tenham o que provar
+        await asyncio.gather(*(self.enviar(sessao, "ativar", MENSAGENS["ativar"].format(assinante=a), registrar=False) for a in self.assinantes))
+        logging.info(f"Preparação concluída: {len(self.assinantes)} assinantes conectados.")
+
+    async def executar(self) -> Dict[str, Any]:
+        args = self.args
+        tipos = list(args.mix)
+        pesos = [args.mix[t] for t in tipos]
+        timeout = aiohttp.ClientTimeout(total=args.timeout)
+        conector = aiohttp.TCPConnector(limit=args.max_em_voo)
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=conector) as sessao:
+            if not args.sem_preparacao:
+                await self.preparar(sessao)
+
+            logging.info(f"Carga: {args.rps} req/s por {args.duracao}s (aquecimento {args.aquecimento}s), mix {args.mix}")
+            em_voo = set()
+            inicio = time.perf_counter()
+            fim_aquecimento = inicio + args.aquecimento
+            total = int((args.aquecimento + args.duracao) * args.rps)
+
+            for n in range(total):
+                # Chegadas agendadas no relógio (malha aberta)
+                atraso = inicio + n / args.rps - time.perf_counter()
+                if atraso > 0:
+                    await asyncio.sleep(atraso)
+                tipo = random.choices(tipos, pesos)[0]
+                registrar = time.perf_counter() >= fim_aquecimento
+                tarefa = asyncio.create_task(self.enviar(sessao, tipo, self.montar_mensagem(tipo), registrar))
+                em_voo.add(tarefa)
+                tarefa.add_done_callback(em_voo.discard)
+
+            if em_voo:
+                await asyncio.wait(em_voo)
+            duracao = time.perf_counter() - fim_aquecimento
+
+        por_funcao = {tipo: resumir([a for a in self.amostras if a["tipo"] == tipo], duracao) for tipo in tipos}
+        erros: Dict[str, int] = {}
+        for a in self.amostras:
+            if not a["ok"]:
+                motivo = str(a.get("resposta"))[:120]
+                erros[motivo] = erros.get(motivo, 0) + 1
+
+        return {
+            "versao": versao_git(),
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "parametros": {
+                "url": args.url,
+                "rps": args.rps,
+                "duracao_s": args.duracao,
+                "aquecimento_s": args.aquecimento,
+                "mix": args.mix,
+                "assinantes": len(self.assinantes),
+            },
+            "total": resumir(self.amostras, duracao),
+            "por_funcao": por_funcao,
+            "erros": erros,
+        }
+
+
+def comparar(atual: Dict[str, Any], base: Dict[str, Any], tolerancia: float) -> List[str]:
+    """Lista as regressões de p95/p99 (acima da tolerância relativa) e de vazão em relação à base.
+
+    A vazão só é comparada no total: por função ela depende do sorteio do mix.
+    """
+    regressoes = []
+    grupos = {"total": (atual["total"], base.get("total", {}))}
+    for funcao, resumo in atual["por_funcao"].items():
+        grupos[funcao] = (resumo, base.get("por_funcao", {}).get(funcao, {}))
+
+    for nome, (agora, antes) in grupos.items():
+        for metrica in ("p95_ms", "p99_ms"):
+            if agora.get(metrica) and antes.get(metrica) and agora[metrica] > antes[metrica] * (1 + tolerancia):
+                regressoes.append(f"{nome}.{metrica}: {antes[metrica]} -> {agora[metrica]}")
+        if nome == "total" and agora.get("vazao_rps") and antes.get("vazao_rps") and agora["vazao_rps"] < antes["vazao_rps"] * (1 - tolerancia):
+            regressoes.append(f"{nome}.vazao_rps: {antes['vazao_rps']} -> {agora['vazao_rps']}")
+    return regressoes
+
+
+def imprimir(resultado: Dict[str, Any]) -> None:
+    print(f"\n{'função':<12}{'req':>7}{'falhas':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    linhas = list(resultado["por_funcao"].items()) + [("TOTAL", resultado["total"])]
+    for nome, r in linhas:
+        print(f"{nome:<12}{r['requisicoes']:>7}{r['falhas']:>8}{str(r['vazao_rps']):>9}{str(r['p50_ms']):>10}{str(r['p95_ms']):>10}{str(r['p99_ms']):>10}")
+    for motivo, quantidade in resultado["erros"].items():
+        print(f"  erro x{quantidade}: {motivo}")
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark de carga do chatbot_server.")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--rps", type=float, default=10.0, help="Taxa alvo de requisições por segundo.")
+    parser.add_argument("--duracao", type=float, default=30.0, help="Segundos de medição.")
+    parser.add_argument("--aquecimento", type=float, default=5.0, help="Segundos iniciais descartados.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("conectar=1,ativar=3,verificar=2,livre=1"))
+    parser.add_argument("--assinantes", type=int, default=20, help="Assinantes conectados na preparação.")
+    parser.add_argument("--prefixo", default=f"bench-{uuid.uuid4().hex[:4]}", help="Prefixo dos IDs de assinante.")
+    parser.add_argument("--sem-preparacao", action="store_true", help="Pula setup e onboarding.")
+    parser.add_argument("--max-em-voo", type=int, default=1000, help="Limite de conexões simultâneas do driver.")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Timeout por requisição (s).")
+    parser.add_argument("--saida", help="Arquivo JSON para salvar o resultado.")
+    parser.add_argument("--comparar", help="Resultado JSON anterior para detectar regressões.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita na comparação (0.2 = 20%%).")
+    return parser
+
+
+if __name__ == "__main__":
+    args = arg_parser().parse_args()
+    resultado = asyncio.run(Driver(args).executar())
+    imprimir(resultado)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        logging.info(f"Resultado salvo em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        if regressoes:
+            print("\nRegressões em relação à base:")
+            for linha in regressoes:
+                print(f"  {linha}")
+            sys.exit(1)
+        print("\nSem regressões em relação à base.")
@@ -1,55 +1,373 @@
+import asyncio
+import json
 import logging
-import aiohttp
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import os
+import time
+from typing import Any, Dict, List, Optional
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from contextlib import asynccontextmanager
 
 import acapy_controller
+import event_bus
+import http_pool
+import invitation_pool
+import jobs
+import metrics
 import ollama_client
+import progress
+import resilience
+import storage
 
 app_state = {}
 
+# Intervalo para checar se o cliente HTTP desconectou durante operações longas
+INTERVALO_DESCONEXAO = 0.5
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app_state["session"] = aiohttp.ClientSession()
+    acapy_controller.carregar_estado()
+    # Uma sessão por agente (pool, keep-alive e timeouts próprios), com a interface de ClientSession
+    app_state["session"] = http_pool.SessionPool(acapy_controller.AGENTES)
+    app_state["ollama_session"] = ollama_client.create_session()
+    # Jobs de /chat?async=true rodam nestes workers, fora do ciclo da requisição HTTP
+    app_state["jobs"] = jobs.JobManager(processar_mensagem)
+    app_state["jobs"].iniciar()
+    # Convites da Operadora criados em segundo plano: o onboarding só retira um da fila
+    session = app_state["session"]
+    invitation_pool.INVITATION_POOL.iniciar(
+        lambda: acapy_controller.criar_convite(session),
+        lambda convite: acapy_controller.descartar_convite(session, convite),
+    )
     yield
+    await invitation_pool.INVITATION_POOL.parar()
+    await app_state["jobs"].parar()
+    storage.STORAGE.fechar()
     await app_state["session"].close()
+    await app_state["ollama_session"].close()
 
 app = FastAPI(lifespan=lifespan)
 
+@app.middleware("http")
+async def trace_middleware(request: Request, call_next):
+    """Dá um request ID a cada requisição (propagado nos logs) e mede a duração total.
+
+    A medição termina quando o corpo acaba de ser enviado (ou o envio é cancelado),
+    não quando a rota devolve a resposta: no /chat/stream e nos demais streams a
+    operação continua rodando enquanto as linhas são geradas.
+    """
+    request_id = request.headers.get("x-request-id") or metrics.novo_request_id()
+    tokens = metrics.iniciar_trace(request_id)
+    inicio = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        _registrar_requisicao(request, request_id, inicio, 500, metrics.encerrar_trace(tokens))
+        raise
+    # A lista de spans continua recebendo os das tarefas que a rota deixou rodando
+    spans = metrics.encerrar_trace(tokens)
+    response.headers["X-Request-ID"] = request_id
+    corpo = response.body_iterator
+
+    async def corpo_medido():
+        try:
+            async for parte in corpo:
+                yield parte
+        finally:
+            _registrar_requisicao(request, request_id, inicio, response.status_code, spans)
+
+    response.body_iterator = corpo_medido()
+    return response
+
+def _registrar_requisicao(request: Request, request_id: str, inicio: float, status: int, spans) -> None:
+    duracao = time.perf_counter() - inicio
+    # Usa o modelo da rota (ex.: /webhooks/topic/{topic}/) para não explodir a cardinalidade
+    rota = getattr(request.scope.get("route"), "path", "desconhecida")
+    metrics.HTTP_REQUEST.observe(duracao, rota=rota, metodo=request.method, status=status)
+    if spans:
+        logging.info(f"Trace [{request_id}] {request.method} {rota} total={duracao * 1000:.1f}ms | {metrics.formatar_trace(spans)}")
+
 class ChatInput(BaseModel):
     message: str
 
-@app.post("/chat")
-async def chat_endpoint(inp: ChatInput):
-    # 1. IA interpreta
-    cmd = ollama_client.get_ollama_function_call(inp.message)
+class PlanoLoteItem(BaseModel):
+    assinante: str
+    nome_plano: str
+    franquia: str
+
+class PlanoLoteInput(BaseModel):
+    itens: List[PlanoLoteItem]
+    concorrencia: int = Field(acapy_controller.LOTE_CONCORRENCIA, ge=1, le=256)
+
+async def executar_cancelavel(request: Request, coro):
+    """Executa `coro` e a cancela se o cliente HTTP desconectar antes do fim."""
+    tarefa = asyncio.ensure_future(coro)
+    try:
+        while not tarefa.done():
+            await asyncio.wait({tarefa}, timeout=INTERVALO_DESCONEXAO)
+            if not tarefa.done() and await request.is_disconnected():
+                logging.info("Cliente desconectou; cancelando operação em andamento.")
+                tarefa.cancel()
+                raise HTTPException(499, detail="Cliente desconectou.")
+        return tarefa.result()
+    finally:
+        if not tarefa.done():
+            tarefa.cancel()
+
+async def interpretar(mensagem: str):
+    """IA interpreta (regex/cache primeiro, Phi-3 só quando necessário). Retorna (função, parâmetros)."""
+    cmd = await ollama_client.resolve_intent(app_state["ollama_session"], mensagem)
     func = cmd.get("function_name")
     params = cmd.get("parameters", {})
 
     if func == "error":
         raise HTTPException(500, detail=params.get("message"))
 
-    # 2. Controller executa
+    progress.emitir("intencao", funcao=func, parametros=params)
+    return func, params
+
+def _texto(params: Any, chave: str) -> Optional[str]:
+    """Parâmetro vindo do modelo: só vale string não vazia (null, números soltos e listas são ignorados)."""
+    valor = params.get(chave) if isinstance(params, dict) else None
+    return valor.strip() if isinstance(valor, str) and valor.strip() else None
+
+def _argumentos_assinante(params: Any) -> Dict[str, str]:
+    # Sem assinante válido, a função usa o padrão dela (ASSINANTE_PADRAO)
+    assinante = _texto(params, "assinante")
+    return {"assinante": assinante} if assinante else {}
+
+async def executar_funcao(func: str, params: Dict[str, Any]) -> str:
+    """Controller executa a função interpretada. Erros viram texto na resposta, como no chat.
+
+    Os parâmetros do modelo passam por uma lista fixa por função: chaves extras
+    são descartadas, em vez de virarem "unexpected keyword argument".
+    """
     session = app_state["session"]
     result = ""
 
-    try:
-        if func == "setup_telco":
-            result = await acapy_controller.setup_telco(session)
-        elif func == "conectar_cliente":
-            result = await acapy_controller.conectar_cliente(session)
-        elif func == "ativar_plano":
-            result = await acapy_controller.ativar_plano(session, **params)
-        elif func == "verificar_acesso":
-            result = await acapy_controller.verificar_acesso(session)
-        else:
-            result = f"Função desconhecida: {func}"
-    except Exception as e:
-        result = f"Erro de execução: {str(e)}"
-
-    return {"response": result}
+    async with metrics.span(f"controller {func}", metrics.CHAT_FUNCAO, funcao=func if func in ollama_client.FUNCOES_PERMITIDAS else "desconhecida"):
+        try:
+            if func == "setup_telco":
+                result = await acapy_controller.setup_telco(session)
+            elif func == "conectar_cliente":
+                result = await acapy_controller.conectar_cliente(session, **_argumentos_assinante(params))
+            elif func == "ativar_plano":
+                nome_plano, franquia = _texto(params, "nome_plano"), _texto(params, "franquia")
+                if not nome_plano or not franquia:
+                    result = "Informe o nome do plano e a franquia (ex.: \"Ative o plano Turbo com 50GB\")."
+                else:
+                    result = await acapy_controller.ativar_plano(session, nome_plano, franquia, **_argumentos_assinante(params))
+            elif func == "verificar_acesso":
+                result = await acapy_controller.verificar_acesso(session, **_argumentos_assinante(params))
+            else:
+                result = f"Função desconhecida: {func}"
+        except Exception as e:
+            result = f"Erro de execução: {str(e)}"
+
+    return result
+
+async def processar_mensagem(mensagem: str) -> Dict[str, Any]:
+    func, params = await interpretar(mensagem)
+    return {"response": await executar_funcao(func, params)}
+
+@app.post("/chat")
+async def chat_endpoint(inp: ChatInput, request: Request, modo_async: bool = Query(False, alias="async")):
+    if modo_async:
+        # Responde na hora; o resultado sai em /jobs/{id} e o progresso em /jobs/{id}/events
+        try:
+            job = app_state["jobs"].submeter(inp.message)
+        except jobs.FilaCheia as e:
+            raise HTTPException(503, detail=str(e))
+        return JSONResponse(status_code=202, content={
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events",
+        })
+
+    func, params = await executar_cancelavel(request, interpretar(inp.message))
+    return {"response": await executar_funcao(func, params)}
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(inp: ChatInput):
+    """Como o /chat, mas em NDJSON: a intenção, cada marco do controller e o resultado, à medida que acontecem.
+
+    Se o cliente desconectar, a operação é cancelada (inclusive a espera por conexão ou prova).
+    """
+    eventos: asyncio.Queue = asyncio.Queue()
+    fim = object()
+
+    async def executar():
+        with progress.ouvir(eventos.put_nowait):
+            return await processar_mensagem(inp.message)
+
+    # Criada aqui para herdar o request ID da requisição
+    tarefa = asyncio.create_task(executar())
+    tarefa.add_done_callback(lambda _: eventos.put_nowait(fim))
+
+    async def linhas():
+        try:
+            while (evento := await eventos.get()) is not fim:
+                yield json.dumps(evento, ensure_ascii=False) + "\n"
+
+            if tarefa.cancelled():
+                final = {"evento": "erro", "detail": "Operação cancelada."}
+            elif tarefa.exception() is not None:
+                erro = tarefa.exception()
+                final = {"evento": "erro", "detail": getattr(erro, "detail", None) or str(erro)}
+            else:
+                final = {"evento": "resultado", **tarefa.result()}
+            yield json.dumps(final, ensure_ascii=False) + "\n"
+        finally:
+            if not tarefa.done():
+                logging.info("Cliente desconectou do stream; cancelando operação em andamento.")
+                tarefa.cancel()
+
+    return StreamingResponse(linhas(), media_type="application/x-ndjson")
+
+def _resumo_job(job_id: str) -> Dict[str, Any]:
+    resumo = app_state["jobs"].resumo(job_id)
+    if resumo is None:
+        raise HTTPException(404, detail="Job não encontrado (ou já descartado).")
+    return resumo
+
+@app.get("/jobs/stats")
+async def jobs_stats_endpoint():
+    return app_state["jobs"].stats()
+
+@app.get("/jobs/{job_id}")
+async def job_endpoint(job_id: str):
+    return _resumo_job(job_id)
+
+@app.delete("/jobs/{job_id}")
+async def job_cancel_endpoint(job_id: str):
+    """Cancela o job; se estiver esperando conexão ou prova, a espera é interrompida."""
+    _resumo_job(job_id)
+    job = await app_state["jobs"].cancelar(job_id)
+    if job is None:
+        raise HTTPException(409, detail="O job está em outro worker; cancele pelo worker que o executa.")
+    return job.resumo()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str):
+    """Server-Sent Events com o progresso do job, terminando no status final."""
+    _resumo_job(job_id)
+
+    async def eventos():
+        async for evento in app_state["jobs"].acompanhar(job_id):
+            yield f"event: {evento['evento']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/exchanges/pending")
+async def pending_exchanges_endpoint():
+    """Emissões e provas que algum worker está aguardando neste momento."""
+    return storage.STORAGE.listar_pendentes()
+
+@app.post("/plans/batch")
+async def plans_batch_endpoint(inp: PlanoLoteInput):
+    """Emite planos em lote. A resposta é NDJSON: uma linha por item e um resumo no final."""
+    itens = [item.model_dump() for item in inp.itens]
+
+    async def linhas():
+        async for resultado in acapy_controller.ativar_planos_em_lote(app_state["session"], itens, inp.concorrencia):
+            yield json.dumps(resultado, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(linhas(), media_type="application/x-ndjson")
+
+def _coletar_metricas_modulos():
+    """Expõe no /metrics os contadores que os módulos já mantêm (roteador, resiliência, pool, webhooks)."""
+    router = ollama_client.get_router_stats()
+    for origem in ("fast_path", "cache_hits", "cache_misses", "llm_errors"):
+        yield ("telco_intent_router_total", "counter", "Mensagens por caminho do roteador de intenções.", {"caminho": origem}, router[origem])
+    yield ("telco_intent_cache_size", "gauge", "Entradas no cache de intenções.", {}, router["cache_size"])
+
+    for agente, stats in resilience.get_stats().items():
+        yield ("telco_admin_retries_total", "counter", "Retries de chamadas à API Admin.", {"agente": agente}, stats["retries"])
+        yield ("telco_admin_failures_total", "counter", "Tentativas com falha na API Admin.", {"agente": agente}, stats["falhas"])
+        yield ("telco_breaker_trips_total", "counter", "Aberturas do circuit breaker.", {"agente": agente}, stats["breaker_aberturas"])
+        yield ("telco_breaker_rejected_total", "counter", "Chamadas rejeitadas com o breaker aberto.", {"agente": agente}, stats["rejeitadas_breaker"])
+        yield ("telco_retry_added_latency_seconds_total", "counter", "Latência adicionada por retries.", {"agente": agente}, stats["latencia_extra_s"])
+        yield ("telco_breaker_open", "gauge", "1 se o circuit breaker do agente não está fechado.", {"agente": agente}, int(stats["breaker"] != resilience.FECHADO))
+
+    session = app_state.get("session")
+    if session is not None:
+        for agente, stats in session.stats().items():
+            yield ("telco_pool_in_use", "gauge", "Requisições em voo no pool HTTP do agente.", {"agente": agente}, stats["em_uso"])
+            yield ("telco_pool_peak_in_use", "gauge", "Pico de requisições em voo no pool HTTP do agente.", {"agente": agente}, stats["pico_em_uso"])
+            yield ("telco_pool_limit_per_host", "gauge", "Limite de conexões por host do pool do agente.", {"agente": agente}, stats["limite_por_host"])
+
+    verificacoes = acapy_controller.get_verification_stats()
+    for resultado in ("liberadas", "negadas", "falhas"):
+        yield ("telco_verifications_total", "counter", "Verificações de acesso concluídas por resultado.", {"resultado": resultado}, verificacoes[resultado])
+    cache = verificacoes["cache"]
+    for resultado in ("hits", "misses"):
+        yield ("telco_proof_cache_total", "counter", "Consultas ao cache de provas por resultado.", {"resultado": resultado}, cache[resultado])
+    yield ("telco_proof_cache_invalidations_total", "counter", "Entradas do cache de provas invalidadas (emissão nova ou revogação).", {}, cache["invalidacoes"])
+    yield ("telco_proof_cache_size", "gauge", "Verificações aprovadas no cache de provas.", {}, cache["tamanho"])
+    etapas = {"conexao": 0, "fila_prova": 0, "prova": 0}
+    for sessao in verificacoes["em_andamento"]:
+        if sessao["etapa"] in etapas:
+            etapas[sessao["etapa"]] += 1
+    for etapa, quantidade in etapas.items():
+        yield ("telco_verification_sessions", "gauge", "Sessões de verificação em andamento por etapa.", {"etapa": etapa}, quantidade)
+
+    gerenciador = app_state.get("jobs")
+    if gerenciador is not None:
+        stats = gerenciador.stats()
+        yield ("telco_jobs_queue_depth", "gauge", "Jobs assíncronos aguardando um worker.", {}, stats["na_fila"])
+        yield ("telco_jobs_running", "gauge", "Jobs assíncronos em execução.", {}, stats["executando"])
+        for status in (jobs.CONCLUIDO, jobs.ERRO, jobs.CANCELADO):
+            yield ("telco_jobs_total", "counter", "Jobs assíncronos finalizados por status.", {"status": status}, stats[status])
+
+    convites = invitation_pool.INVITATION_POOL.get_stats()
+    for resultado in ("hits", "misses"):
+        yield ("telco_invitation_pool_total", "counter", "Retiradas do pool de convites por resultado.", {"resultado": resultado}, convites[resultado])
+    yield ("telco_invitation_pool_expired_total", "counter", "Convites do pool descartados por TTL.", {}, convites["expirados"])
+    yield ("telco_invitation_pool_available", "gauge", "Convites prontos no pool.", {}, convites["disponiveis"])
+
+    yield ("telco_webhooks_received_total", "counter", "Webhooks recebidos dos agentes.", {}, event_bus.BUS.eventos_recebidos)
+
+metrics.registrar_coletor(_coletar_metricas_modulos)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/pool/stats")
+async def pool_stats_endpoint():
+    return app_state["session"].stats()
+
+@app.get("/resilience/stats")
+async def resilience_stats_endpoint():
+    return resilience.get_stats()
+
+@app.get("/verifications/stats")
+async def verifications_stats_endpoint():
+    return acapy_controller.get_verification_stats()
+
+@app.get("/invitations/stats")
+async def invitations_stats_endpoint():
+    return invitation_pool.INVITATION_POOL.get_stats()
+
+@app.get("/router/stats")
+async def router_stats_endpoint():
+    return ollama_client.get_router_stats()
+
+# Receptor de webhooks: os agentes devem rodar com --webhook-url http://localhost:8080/webhooks
+@app.post("/webhooks/topic/{topic}/")
+async def webhook_endpoint(topic: str, payload: Dict[str, Any] = Body(...)):
+    event_bus.publicar_webhook(topic, payload)
+    return {}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    workers = int(os.getenv("CHATBOT_WORKERS", 1))
+    if workers > 1:
+        # Cada worker é um processo: o estado precisa estar num storage compartilhado
+        if not storage.STORAGE.compartilhado:
+            raise SystemExit("CHATBOT_WORKERS > 1 exige TELCO_STORAGE=sqlite.")
+        uvicorn.run("chatbot_server:app", host="0.0.0.0", port=8080, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8080)
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# --- Constantes ---
+# Campos do payload usados como chave de correlação em cada tópico de webhook do ACA-Py
+CHAVES_POR_TOPICO = {
+    "connections": ("connection_id", "invitation_msg_id"),
+    "present_proof_v2_0": ("pres_ex_id",),
+    "issue_credential_v2_0": ("cred_ex_id",),
+    "ping": ("thread_id",),
+}
+
+# Quantos últimos estados por chave ficam retidos para quem começar a esperar atrasado
+MAX_EVENTOS_RETIDOS = 5000
+
+
+class EventBus:
+    """Barramento de eventos em processo alimentado pelos webhooks dos agentes.
+
+    Cada evento é indexado por (tópico, chave). Quem espera registra um future
+    que é resolvido assim que um evento com um dos estados desejados chega.
+    O último evento de cada chave fica retido, de modo que uma espera iniciada
+    depois do webhook ainda é resolvida imediatamente.
+    """
+
+    def __init__(self, max_retidos: int = MAX_EVENTOS_RETIDOS):
+        self._max_retidos = max_retidos
+        self._ultimos: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._aguardando: Dict[Tuple[str, str], List[Tuple[frozenset, asyncio.Future]]] = {}
+        self._observadores: Dict[Tuple[str, str], List[Callable[[Dict[str, Any]], None]]] = {}
+        self._assinaturas: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self.eventos_recebidos = 0
+
+    @property
+    def recebendo(self) -> bool:
+        """Indica se algum webhook já chegou (ou seja, se os agentes estão configurados)."""
+        return self.eventos_recebidos > 0
+
+    def publish(self, topic: str, payload: Dict[str, Any]) -> None:
+        self.eventos_recebidos += 1
+        estado = payload.get("state")
+
+        for callback in self._assinaturas.get(topic, ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                logging.error(f"Assinante do tópico {topic} falhou: {e}")
+
+        for campo in CHAVES_POR_TOPICO.get(topic, ()):
+            valor = payload.get(campo)
+            if not valor:
+                continue
+
+            chave = (topic, valor)
+            self._ultimos[chave] = payload
+            self._ultimos.move_to_end(chave)
+
+            for observador in list(self._observadores.get(chave, ())):
+                try:
+                    observador(payload)
+                except Exception as e:
+                    logging.error(f"Observador de {topic} falhou: {e}")
+
+            pendentes = []
+            for estados, fut in self._aguardando.pop(chave, []):
+                if fut.done():
+                    continue
+                if estado in estados:
+                    fut.set_result(payload)
+                else:
+                    pendentes.append((estados, fut))
+            if pendentes:
+                self._aguardando[chave] = pendentes
+
+        while len(self._ultimos) > self._max_retidos:
+            self._ultimos.popitem(last=False)
+
+    def assinar(self, topic: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Chama `callback` para todo evento do tópico, seja qual for a chave (ex.: revogações)."""
+        self._assinaturas.setdefault(topic, []).append(callback)
+
+    def observar(self, topic: str, key: str, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Chama `callback` a cada evento de `key` (qualquer estado). Retorna a função que cancela a inscrição."""
+        chave = (topic, key)
+        self._observadores.setdefault(chave, []).append(callback)
+
+        def remover():
+            restantes = [c for c in self._observadores.get(chave, []) if c is not callback]
+            if restantes:
+                self._observadores[chave] = restantes
+            else:
+                self._observadores.pop(chave, None)
+
+        return remover
+
+    async def wait_for(self, topic: str, key: str, states: Iterable[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """Aguarda `key` atingir um dos `states` no tópico. Retorna None em timeout."""
+        chave = (topic, key)
+        estados = frozenset(states)
+
+        ultimo = self._ultimos.get(chave)
+        if ultimo and ultimo.get("state") in estados:
+            return ultimo
+
+        fut = asyncio.get_running_loop().create_future()
+        self._aguardando.setdefault(chave, []).append((estados, fut))
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            restantes = [(e, f) for e, f in self._aguardando.get(chave, []) if f is not fut]
+            if restantes:
+                self._aguardando[chave] = restantes
+            else:
+                self._aguardando.pop(chave, None)
+
+
+# Instância única do processo, alimentada pela rota de webhooks do chatbot_server
+BUS = EventBus()
+
+
+def publicar_webhook(topic: str, payload: Dict[str, Any]) -> None:
+    logging.debug(f"Webhook recebido [{topic}]: {payload.get('state')}")
+    BUS.publish(topic, payload)
@@ -0,0 +1,130 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Nome usado para URLs que não pertencem a nenhum agente conhecido
+AGENTE_DESCONHECIDO = "outros"
+
+
+@dataclass
+class PoolConfig:
+    """Connector e timeouts da sessão de um agente.
+
+    Cada campo pode ser sobrescrito por variável de ambiente: `ADMIN_POOL_<CAMPO>`
+    vale para todos os agentes e `ADMIN_POOL_<AGENTE>_<CAMPO>` só para um deles
+    (ex.: `ADMIN_POOL_VERIFICADOR_TIMEOUT_LEITURA=60`).
+    """
+    limite: int = 100
+    limite_por_host: int = 50
+    ttl_dns_cache: int = 300
+    keepalive: float = 30.0
+    timeout_total: float = 30.0
+    timeout_conexao: float = 5.0
+    timeout_leitura: float = 20.0
+
+    @classmethod
+    def do_ambiente(cls, agente: str) -> "PoolConfig":
+        valores = {}
+        for campo in fields(cls):
+            bruto = os.getenv(f"ADMIN_POOL_{agente.upper()}_{campo.name.upper()}") or os.getenv(f"ADMIN_POOL_{campo.name.upper()}")
+            if bruto is not None:
+                valores[campo.name] = type(campo.default)(bruto)
+        return cls(**valores)
+
+    def criar_sessao(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limite,
+            limit_per_host=self.limite_por_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            keepalive_timeout=self.keepalive,
+        )
+        timeout = aiohttp.ClientTimeout(total=self.timeout_total, connect=self.timeout_conexao, sock_read=self.timeout_leitura)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+class _RequisicaoRastreada:
+    """Envolve o context manager de `ClientSession.request` para contar conexões em uso."""
+
+    def __init__(self, pool: "SessionPool", agente: str, contexto):
+        self._pool = pool
+        self._agente = agente
+        self._contexto = contexto
+
+    async def __aenter__(self):
+        self._pool._entrar(self._agente)
+        try:
+            return await self._contexto.__aenter__()
+        except BaseException:
+            self._pool._sair(self._agente)
+            raise
+
+    async def __aexit__(self, *exc):
+        try:
+            return await self._contexto.__aexit__(*exc)
+        finally:
+            self._pool._sair(self._agente)
+
+
+class SessionPool:
+    """Uma ClientSession por agente ACA-Py, cada uma com connector e timeouts próprios.
+
+    Expõe o mesmo `request()` de aiohttp.ClientSession, então pode ser passada
+    no lugar de uma sessão para `admin_request` e para as funções do controller.
+    """
+
+    def __init__(self, agentes: Dict[str, str], configs: Optional[Dict[str, PoolConfig]] = None):
+        configs = configs or {}
+        self._agentes = {self._origem(url): nome for nome, url in agentes.items()}
+        self._configs = {nome: configs.get(nome) or PoolConfig.do_ambiente(nome) for nome in list(agentes) + [AGENTE_DESCONHECIDO]}
+        self._sessoes: Dict[str, aiohttp.ClientSession] = {}
+        self._stats = {nome: {"em_uso": 0, "pico_em_uso": 0, "requisicoes": 0} for nome in self._configs}
+
+    @staticmethod
+    def _origem(url: str) -> str:
+        partes = urlsplit(url)
+        return f"{partes.scheme}://{partes.netloc}"
+
+    def agente_da_url(self, url: str) -> str:
+        return self._agentes.get(self._origem(url), AGENTE_DESCONHECIDO)
+
+    def sessao(self, agente: str) -> aiohttp.ClientSession:
+        if agente not in self._sessoes:
+            self._sessoes[agente] = self._configs[agente].criar_sessao()
+        return self._sessoes[agente]
+
+    def request(self, method: str, url: str, **kwargs):
+        agente = self.agente_da_url(url)
+        return _RequisicaoRastreada(self, agente, self.sessao(agente).request(method, url, **kwargs))
+
+    def _entrar(self, agente: str) -> None:
+        stats = self._stats[agente]
+        stats["em_uso"] += 1
+        stats["requisicoes"] += 1
+        stats["pico_em_uso"] = max(stats["pico_em_uso"], stats["em_uso"])
+
+    def _sair(self, agente: str) -> None:
+        self._stats[agente]["em_uso"] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Utilização por agente: requisições em voo e pico frente aos limites do connector."""
+        resultado = {}
+        for agente, config in self._configs.items():
+            stats = self._stats[agente]
+            # limit_per_host=0 significa "sem limite por host": vale o limite global
+            teto = config.limite_por_host or config.limite
+            resultado[agente] = {
+                **stats,
+                "limite": config.limite,
+                "limite_por_host": config.limite_por_host,
+                "utilizacao": round(stats["em_uso"] / teto, 4) if teto else None,
+                "sessao_aberta": agente in self._sessoes,
+            }
+        return resultado
+
+    async def close(self) -> None:
+        for sessao in self._sessoes.values():
+            await sessao.close()
+        self._sessoes.clear()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+# --- Configuração ---
+# Convites de uso único da Operadora criados de antemão (0 desliga o pool)
+CONVITES_POOL = int(os.getenv("CONVITES_POOL", 10))
+# Convite mais velho que isto é descartado e apagado na Operadora
+CONVITES_TTL = float(os.getenv("CONVITES_TTL", 600))
+# Intervalo da reposição quando ninguém retira convites (e espera após uma falha)
+CONVITES_INTERVALO = float(os.getenv("CONVITES_INTERVALO", 5.0))
+# Convites criados ao mesmo tempo durante a reposição
+CONVITES_CONCORRENCIA = 4
+
+CriarConvite = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+DescartarConvite = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class InvitationPool:
+    """Convites out-of-band de uso único, prontos para o onboarding.
+
+    `retirar` só tira um convite da fila; a criação na Operadora fica com uma
+    tarefa de fundo, acordada a cada retirada, que repõe o pool até `tamanho`
+    e descarta os convites que passaram do TTL. Cada convite continua de uso
+    único, então a conexão segue correlacionada pelo `invi_msg_id`.
+    """
+
+    def __init__(self, tamanho: int = CONVITES_POOL, ttl: float = CONVITES_TTL, intervalo: float = CONVITES_INTERVALO):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self._convites: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._criar: Optional[CriarConvite] = None
+        self._descartar: Optional[DescartarConvite] = None
+        self._repor = asyncio.Event()
+        self._tarefa: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "criados": 0, "expirados": 0, "falhas": 0}
+
+    @property
+    def ativo(self) -> bool:
+        return self.tamanho > 0 and self._tarefa is not None
+
+    def iniciar(self, criar: CriarConvite, descartar: Optional[DescartarConvite] = None) -> None:
+        """`criar` devolve a resposta de /out-of-band/create-invitation (ou None em erro)."""
+        if self.tamanho <= 0:
+            return
+        self._criar = criar
+        self._descartar = descartar
+        self._tarefa = asyncio.create_task(self._repor_pool())
+
+    async def parar(self) -> None:
+        if self._tarefa:
+            self._tarefa.cancel()
+            await asyncio.gather(self._tarefa, return_exceptions=True)
+            self._tarefa = None
+        self._convites.clear()
+
+    def retirar(self) -> Optional[Dict[str, Any]]:
+        """Entrega um convite ainda válido, ou None se o pool estiver vazio."""
+        agora = time.monotonic()
+        while self._convites:
+            criado_em, convite = self._convites.popleft()
+            if agora - criado_em < self.ttl:
+                self.stats["hits"] += 1
+                self._repor.set()
+                return convite
+            self._expirar(convite)
+        self.stats["misses"] += 1
+        self._repor.set()
+        return None
+
+    def _expirar(self, convite: Dict[str, Any]) -> None:
+        self.stats["expirados"] += 1
+        if self._descartar:
+            tarefa = asyncio.create_task(self._descartar(convite))
+            tarefa.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _repor_pool(self) -> None:
+        while True:
+            # Retiradas feitas durante a reposição deixam o evento setado para a próxima volta
+            self._repor.clear()
+            # Os mais antigos estão no começo da fila
+            limite = time.monotonic() - self.ttl
+            while self._convites and self._convites[0][0] <= limite:
+                self._expirar(self._convites.popleft()[1])
+
+            faltando = min(self.tamanho - len(self._convites), CONVITES_CONCORRENCIA)
+            falhou = False
+            if faltando > 0:
+                resultados = await asyncio.gather(*(self._criar() for _ in range(faltando)), return_exceptions=True)
+                for resultado in resultados:
+                    if isinstance(resultado, dict):
+                        self._convites.append((time.monotonic(), resultado))
+                        self.stats["criados"] += 1
+                    else:
+                        if isinstance(resultado, BaseException):
+                            logging.error(f"Falha ao criar convite para o pool: {resultado}")
+                        self.stats["falhas"] += 1
+                        falhou = True
+                if not falhou and len(self._convites) < self.tamanho:
+                    continue
+
+            # Sem falhas, uma retirada acorda a reposição na hora; com falha, espera o intervalo
+            try:
+                if falhou:
+                    await asyncio.sleep(self.intervalo)
+                else:
+                    await asyncio.wait_for(self._repor.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        retiradas = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "disponiveis": len(self._convites),
+            "tamanho": self.tamanho,
+            "ttl_s": self.ttl,
+            "hit_ratio": round(self.stats["hits"] / retiradas, 4) if retiradas else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._convites)
+
+
+INVITATION_POOL = InvitationPool()
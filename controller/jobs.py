@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+import progress
+from storage import STORAGE, Storage
+
+# --- Configuração ---
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 4))
+JOBS_FILA_MAX = int(os.getenv("JOBS_FILA_MAX", 100))
+# Jobs concluídos mantidos para consulta em /jobs/{id}; os mais antigos saem primeiro
+JOBS_RETIDOS = int(os.getenv("JOBS_RETIDOS", 1000))
+# Com vários workers, um job de outro processo é acompanhado relendo o snapshot no storage
+INTERVALO_SNAPSHOT = 0.5
+
+NA_FILA = "na_fila"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+CANCELADO = "cancelado"
+FINAIS = {CONCLUIDO, ERRO, CANCELADO}
+
+ESPERA_FILA = metrics.Histogram("telco_job_queue_seconds", "Tempo dos jobs assíncronos na fila até um worker pegar.", ())
+DURACAO_JOB = metrics.Histogram("telco_job_seconds", "Execução dos jobs assíncronos por status final.", ("status",))
+metrics.HISTOGRAMAS.extend([ESPERA_FILA, DURACAO_JOB])
+
+
+class FilaCheia(Exception):
+    pass
+
+
+class Job:
+    """Uma mensagem de chat executada em segundo plano, com os eventos de progresso acumulados."""
+
+    def __init__(self, mensagem: str, request_id: str):
+        self.id = uuid.uuid4().hex
+        self.mensagem = mensagem
+        self.request_id = request_id
+        self.status = NA_FILA
+        self.resultado: Optional[Dict[str, Any]] = None
+        self.erro: Optional[str] = None
+        self.eventos: List[Dict[str, Any]] = []
+        self.criado_em = time.time()
+        self.iniciado_em: Optional[float] = None
+        self.concluido_em: Optional[float] = None
+        self.tarefa: Optional[asyncio.Task] = None
+        self.ao_atualizar: Optional[Callable[["Job"], None]] = None
+        self._novo_evento = asyncio.Event()
+
+    @property
+    def terminado(self) -> bool:
+        return self.status in FINAIS
+
+    def registrar_evento(self, evento: Dict[str, Any]) -> None:
+        self.eventos.append(evento)
+        # Acorda quem acompanha o stream e prepara o sinal do próximo evento
+        self._novo_evento.set()
+        self._novo_evento = asyncio.Event()
+        if self.ao_atualizar:
+            self.ao_atualizar(self)
+
+    def mudar_status(self, status: str, **dados) -> None:
+        self.status = status
+        self.registrar_evento({"evento": "status", "status": status, "t": round(time.time(), 3), **dados})
+
+    async def acompanhar(self) -> AsyncIterator[Dict[str, Any]]:
+        """Entrega os eventos já registrados e depois os novos, até o job terminar."""
+        enviados = 0
+        while True:
+            sinal = self._novo_evento
+            while enviados < len(self.eventos):
+                yield self.eventos[enviados]
+                enviados += 1
+            if self.terminado:
+                return
+            await sinal.wait()
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "mensagem": self.mensagem,
+            "resultado": self.resultado,
+            "erro": self.erro,
+            "criado_em": self.criado_em,
+            "iniciado_em": self.iniciado_em,
+            "concluido_em": self.concluido_em,
+            "eventos": self.eventos,
+        }
+
+
+class JobManager:
+    """Executor em processo: fila limitada e um número fixo de workers.
+
+    `executar` recebe a mensagem e devolve o corpo de resposta do /chat. Quando a
+    fila está cheia, `submeter` recusa na hora em vez de acumular sockets.
+    Cada mudança do job vai para o storage, para qualquer worker responder por ele.
+    """
+
+    def __init__(self, executar: Callable[[str], Awaitable[Dict[str, Any]]], workers: int = JOBS_WORKERS,
+                 fila_max: int = JOBS_FILA_MAX, retidos: int = JOBS_RETIDOS, storage: Storage = STORAGE):
+        self._executar = executar
+        self._storage = storage
+        self._n_workers = workers
+        self._retidos = retidos
+        self._fila: asyncio.Queue = asyncio.Queue(maxsize=fila_max)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+        self.contadores = {CONCLUIDO: 0, ERRO: 0, CANCELADO: 0}
+
+    def iniciar(self) -> None:
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(self._n_workers)]
+
+    async def parar(self) -> None:
+        for job in self._jobs.values():
+            if job.tarefa and not job.tarefa.done():
+                job.tarefa.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def submeter(self, mensagem: str) -> Job:
+        job = Job(mensagem, metrics.REQUEST_ID.get())
+        job.ao_atualizar = self._persistir
+        try:
+            self._fila.put_nowait(job)
+        except asyncio.QueueFull:
+            raise FilaCheia(f"Fila de jobs cheia ({self._fila.maxsize}).")
+        job.mudar_status(NA_FILA)
+        self._jobs[job.id] = job
+        self._descartar_antigos()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def resumo(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Resumo do job deste worker ou, se for de outro, o último snapshot no storage."""
+        job = self._jobs.get(job_id)
+        return job.resumo() if job else self._storage.ler_job(job_id)
+
+    async def acompanhar(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            async for evento in job.acompanhar():
+                yield evento
+            return
+
+        enviados = 0
+        while (resumo := self._storage.ler_job(job_id)) is not None:
+            for evento in resumo["eventos"][enviados:]:
+                yield evento
+            enviados = len(resumo["eventos"])
+            if resumo["status"] in FINAIS:
+                return
+            await asyncio.sleep(INTERVALO_SNAPSHOT)
+
+    def _persistir(self, job: Job) -> None:
+        try:
+            self._storage.salvar_job(job.id, job.resumo())
+        except Exception as e:
+            logging.error(f"Não foi possível salvar o job {job.id} no storage: {e}")
+
+    async def cancelar(self, job_id: str, espera: float = 5.0) -> Optional[Job]:
+        """Cancela o job e aguarda (até `espera` segundos) ele registrar o status final."""
+        job = self._jobs.get(job_id)
+        if job is None or job.terminado:
+            return job
+        if job.tarefa:
+            job.tarefa.cancel()
+            await asyncio.wait({job.tarefa}, timeout=espera)
+        else:
+            # Ainda na fila: o worker descarta quando chegar a vez dele
+            self._finalizar(job, CANCELADO)
+        return job
+
+    def _descartar_antigos(self) -> None:
+        excedente = len(self._jobs) - self._retidos
+        for job_id in [j.id for j in self._jobs.values() if j.terminado][:max(0, excedente)]:
+            del self._jobs[job_id]
+
+    def _finalizar(self, job: Job, status: str, **dados) -> None:
+        job.concluido_em = time.time()
+        self.contadores[status] += 1
+        if job.iniciado_em:
+            DURACAO_JOB.observe(job.concluido_em - job.iniciado_em, status=status)
+        job.mudar_status(status, **dados)
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            job = await self._fila.get()
+            try:
+                if job.terminado:
+                    continue
+                job.iniciado_em = time.time()
+                ESPERA_FILA.observe(job.iniciado_em - job.criado_em)
+                job.mudar_status(EXECUTANDO)
+                # Tarefa própria: cancelar o job não derruba o worker
+                job.tarefa = asyncio.create_task(self._rodar(job))
+                try:
+                    await asyncio.shield(job.tarefa)
+                except asyncio.CancelledError:
+                    if not job.tarefa.cancelled():
+                        # O worker foi cancelado (desligamento), não o job
+                        job.tarefa.cancel()
+                        raise
+                    if not job.terminado:
+                        # Cancelado antes de começar a rodar
+                        self._finalizar(job, CANCELADO)
+            finally:
+                self._fila.task_done()
+
+    async def _rodar(self, job: Job) -> None:
+        tokens = metrics.iniciar_trace(job.request_id)
+        inicio = time.perf_counter()
+        try:
+            with progress.ouvir(job.registrar_evento):
+                job.resultado = await self._executar(job.mensagem)
+            self._finalizar(job, CONCLUIDO, resultado=job.resultado)
+        except asyncio.CancelledError:
+            logging.info(f"Job {job.id} cancelado.")
+            self._finalizar(job, CANCELADO)
+        except Exception as e:
+            job.erro = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logging.error(f"Job {job.id} falhou: {job.erro}")
+            self._finalizar(job, ERRO, erro=job.erro)
+        finally:
+            spans = metrics.encerrar_trace(tokens)
+            logging.info(f"Trace [{job.request_id}] job {job.id} total={(time.perf_counter() - inicio) * 1000:.1f}ms | {metrics.formatar_trace(spans)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self._n_workers,
+            "na_fila": self._fila.qsize(),
+            "fila_max": self._fila.maxsize,
+            "executando": sum(1 for j in self._jobs.values() if j.status == EXECUTANDO),
+            "retidos": len(self._jobs),
+            **self.contadores,
+        }
@@ -0,0 +1,175 @@
+import bisect
+import contextvars
+import logging
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Limites dos buckets em segundos: do fast-path (microssegundos) às provas em CPU (dezenas de segundos)
+BUCKETS_PADRAO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# --- Contexto da Requisição ---
+REQUEST_ID: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_SPANS: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("spans", default=None)
+
+
+def novo_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def iniciar_trace(request_id: str):
+    """Associa o request ID ao contexto atual e começa a coletar spans. Retorna os tokens para `encerrar_trace`."""
+    return REQUEST_ID.set(request_id), _SPANS.set([])
+
+
+def encerrar_trace(tokens) -> List[Tuple[str, float]]:
+    spans = _SPANS.get() or []
+    REQUEST_ID.reset(tokens[0])
+    _SPANS.reset(tokens[1])
+    return spans
+
+
+def registrar_span(nome: str, duracao: float) -> None:
+    # Tarefas filhas (asyncio.gather) herdam a mesma lista, então os spans delas também entram
+    spans = _SPANS.get()
+    if spans is not None:
+        spans.append((nome, duracao))
+
+
+def formatar_trace(spans: Iterable[Tuple[str, float]]) -> str:
+    return " | ".join(f"{nome}={duracao * 1000:.1f}ms" for nome, duracao in spans)
+
+
+def instalar_request_id_no_log() -> None:
+    """Faz todo LogRecord carregar `request_id`, para usar `%(request_id)s` no formato do log."""
+    fabrica_original = logging.getLogRecordFactory()
+    if getattr(fabrica_original, "_com_request_id", False):
+        return
+
+    def fabrica(*args, **kwargs):
+        record = fabrica_original(*args, **kwargs)
+        record.request_id = REQUEST_ID.get()
+        return record
+
+    fabrica._com_request_id = True
+    logging.setLogRecordFactory(fabrica)
+
+
+# --- Histogramas ---
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pares = ",".join(f'{k}="{_escapar(v)}"' for k, v in labels.items())
+    return "{" + pares + "}"
+
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus, com uma série por combinação de labels."""
+
+    def __init__(self, nome: str, ajuda: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, valor: float, **labels) -> None:
+        chave = tuple(str(labels.get(nome, "")) for nome in self.labels)
+        serie = self._series.get(chave)
+        if serie is None:
+            serie = self._series[chave] = [[0] * len(self.buckets), 0.0, 0]
+        indice = bisect.bisect_left(self.buckets, valor)
+        if indice < len(self.buckets):
+            serie[0][indice] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        for chave, (contagens, soma, total) in sorted(self._series.items()):
+            labels = dict(zip(self.labels, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_formatar_labels({**labels, 'le': repr(float(limite))})} {acumulado}")
+            linhas.append(f"{self.nome}_bucket{_formatar_labels({**labels, 'le': '+Inf'})} {total}")
+            linhas.append(f"{self.nome}_sum{_formatar_labels(labels)} {soma}")
+            linhas.append(f"{self.nome}_count{_formatar_labels(labels)} {total}")
+        return linhas
+
+
+HTTP_REQUEST = Histogram("telco_http_request_seconds", "Duração total das requisições ao chatbot_server.", ("rota", "metodo", "status"))
+CHAT_FUNCAO = Histogram("telco_chat_seconds", "Duração do /chat por função interpretada.", ("funcao",))
+LLM_INTENT = Histogram("telco_llm_intent_seconds", "Interpretação da intenção (fast-path, cache ou Phi-3).", ("origem",))
+ADMIN_REQUEST = Histogram("telco_admin_request_seconds", "Chamadas à API Admin do ACA-Py, incluindo retries.", ("metodo", "agente", "caminho", "status"))
+ESPERA = Histogram("telco_wait_seconds", "Esperas por conexão, emissão e prova (webhook ou polling).", ("etapa", "resultado"))
+
+HISTOGRAMAS = [HTTP_REQUEST, CHAT_FUNCAO, LLM_INTENT, ADMIN_REQUEST, ESPERA]
+
+
+@asynccontextmanager
+async def span(nome: str, histograma: Optional[Histogram] = None, **labels):
+    """Cronometra um trecho: vai para o trace da requisição e, se informado, para o histograma.
+
+    Os labels podem ser ajustados dentro do bloco (ex.: status conhecido só no fim)
+    alterando o dicionário devolvido.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        duracao = time.perf_counter() - inicio
+        registrar_span(nome, duracao)
+        if histograma is not None:
+            histograma.observe(duracao, **labels)
+
+
+# --- Métricas de Outros Módulos ---
+# Cada coletor devolve amostras (nome, tipo, ajuda, labels, valor) lidas no momento do scrape
+Amostra = Tuple[str, str, str, Dict[str, str], float]
+_coletores: List[Callable[[], Iterable[Amostra]]] = []
+
+
+def registrar_coletor(coletor: Callable[[], Iterable[Amostra]]) -> None:
+    _coletores.append(coletor)
+
+
+def render_prometheus() -> str:
+    linhas: List[str] = []
+    for histograma in HISTOGRAMAS:
+        linhas.extend(histograma.render())
+
+    # Os coletores intercalam famílias (um laço por agente, por módulo...), mas o formato
+    # de exposição exige as amostras de cada família juntas, sob um único HELP/TYPE
+    familias: Dict[str, Tuple[str, str, List[str]]] = {}
+    for coletor in _coletores:
+        try:
+            amostras = list(coletor())
+        except Exception as e:
+            logging.error(f"Coletor de métricas falhou: {e}")
+            continue
+        for nome, tipo, ajuda, labels, valor in amostras:
+            familia = familias.setdefault(nome, (tipo, ajuda, []))
+            familia[2].append(f"{nome}{_formatar_labels(labels)} {valor}")
+
+    for nome, (tipo, ajuda, series) in familias.items():
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        linhas.extend(series)
+    return "\n".join(linhas) + "\n"
+
+
+# --- Caminhos da API Admin ---
+_SEGMENTO_ID = re.compile(r"^[0-9a-fA-F-]{32,36}$|.*:.*|^[A-Za-z0-9]{21,}$")
+
+
+def modelo_caminho(caminho: str) -> str:
+    """`/present-proof-2.0/records/3fa8...` -> `/present-proof-2.0/records/{id}` (cardinalidade baixa)."""
+    caminho = caminho.split("?", 1)[0]
+    return "/".join("{id}" if segmento and _SEGMENTO_ID.match(segmento) else segmento for segmento in caminho.split("/"))
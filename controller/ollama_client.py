@@ -1,10 +1,48 @@
-import requests
+import asyncio
+import aiohttp
+import copy
 import json
 import logging
-from typing import Dict, Any
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
-OLLAMA_URL = "http://localhost:11434/api/chat"
-MODEL_NAME = "phi3:mini"
+import metrics
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/chat")
+MODEL_NAME = os.getenv("OLLAMA_MODEL", "phi3:mini")
+
+# --- Pool de Conexões e Limites ---
+# O Phi-3 roda em CPU: poucas gerações simultâneas já saturam a máquina,
+# então as demais requisições esperam no semáforo sem travar o event loop.
+OLLAMA_MAX_CONCORRENCIA = int(os.getenv("OLLAMA_MAX_CONCORRENCIA", 2))
+OLLAMA_TIMEOUT_TOTAL = float(os.getenv("OLLAMA_TIMEOUT_TOTAL", 120))
+OLLAMA_TIMEOUT_CONEXAO = float(os.getenv("OLLAMA_TIMEOUT_CONEXAO", 5))
+OLLAMA_KEEPALIVE = float(os.getenv("OLLAMA_KEEPALIVE", 300))
+
+# --- Cache de Intenções ---
+INTENT_CACHE_TAMANHO = int(os.getenv("INTENT_CACHE_TAMANHO", 1024))
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", 3600))
+
+_semaforo: Optional[asyncio.Semaphore] = None
+
+def create_session() -> aiohttp.ClientSession:
+    """Sessão keep-alive compartilhada para todas as chamadas ao Ollama."""
+    connector = aiohttp.TCPConnector(limit=OLLAMA_MAX_CONCORRENCIA, keepalive_timeout=OLLAMA_KEEPALIVE)
+    timeout = aiohttp.ClientTimeout(total=OLLAMA_TIMEOUT_TOTAL, connect=OLLAMA_TIMEOUT_CONEXAO)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def _get_semaforo() -> asyncio.Semaphore:
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(OLLAMA_MAX_CONCORRENCIA)
+    return _semaforo
+
+# Nomes que o modelo pode devolver; respostas fora desta lista não entram no cache
+FUNCOES_PERMITIDAS = {"setup_telco", "conectar_cliente", "ativar_plano", "verificar_acesso"}
 
 # --- PROMPT REFORÇADO ---
 SYSTEM_PROMPT = """
@@ -24,17 +62,22 @@ LISTA DE FUNÇÕES PERMITIDAS:
 
 2. conectar_cliente
    - Gatilhos: "Conectar cliente", "Novo assinante", "Onboarding".
-   - Params: {}
+   - Params:
+     - "assinante": (string, opcional) ID do assinante. Ex: "cliente-042".
 
 3. ativar_plano
    - Gatilhos: "Ativar plano", "Vender promoção", "Quero 50GB".
    - Params:
      - "nome_plano": (string) Ex: "Promoção Turbo".
      - "franquia": (string) Ex: "50GB".
+     - "assinante": (string, opcional) ID do assinante.
 
 4. verificar_acesso
    - Gatilhos: "Verificar acesso", "Validar plano".
-   - Params: {}
+   - Params:
+     - "assinante": (string, opcional) ID do assinante.
+
+Se a mensagem não citar um assinante, omita o parâmetro "assinante".
 
 Exemplo de Saída Correta:
 {
@@ -46,7 +89,7 @@ Exemplo de Saída Correta:
 }
 """
 
-def get_ollama_function_call(user_prompt: str) -> Dict[str, Any]:
+async def get_ollama_function_call(session: aiohttp.ClientSession, user_prompt: str) -> Dict[str, Any]:
     logging.info(f"Enviando para Phi-3: {user_prompt}")
     
     payload = {
@@ -64,11 +107,138 @@ def get_ollama_function_call(user_prompt: str) -> Dict[str, Any]:
     }
     
     try:
-        response = requests.post(OLLAMA_URL, json=payload)
-        response.raise_for_status()
-        content = response.json()["message"]["content"]
+        # Cancelamentos (cliente desconectou) propagam normalmente e liberam o semáforo
+        async with _get_semaforo():
+            async with session.post(OLLAMA_URL, json=payload) as response:
+                response.raise_for_status()
+                data = await response.json()
+        content = data["message"]["content"]
         logging.info(f"Resposta IA: {content}")
         return json.loads(content)
+    except asyncio.TimeoutError:
+        logging.error(f"Erro IA: timeout após {OLLAMA_TIMEOUT_TOTAL}s")
+        return {"function_name": "error", "parameters": {"message": "Timeout aguardando o modelo de IA."}}
     except Exception as e:
         logging.error(f"Erro IA: {e}")
-        return {"function_name": "error", "parameters": {"message": str(e)}}
\ No newline at end of file
+        return {"function_name": "error", "parameters": {"message": str(e)}}
+
+# --- Roteador de Intenções ---
+# Frases-gatilho do SYSTEM_PROMPT resolvidas sem passar pelo modelo. Os padrões
+# rodam sobre o texto normalizado (minúsculo, sem acentos e sem pontuação).
+PADROES_FAST_PATH = [
+    ("verificar_acesso", re.compile(r"\b(verific|valid)\w*\b.*\b(acesso|plano)\b")),
+    ("conectar_cliente", re.compile(r"\b(conect|conex)\w*\b.*\bcliente\b|\bnovo assinante\b|\bonboarding\b")),
+    # Só frases de setup de fato: "Configurar plano..." ou qualquer menção a plano/assinante vai para o modelo
+    ("setup_telco", re.compile(
+        r"^(?!.*\b(plano|planos|assinante|cliente)\b)"
+        r"(inici\w*\b.*\bsistemas?\b|configur\w*\s+(a\s+|o\s+)?(sistema|rede|stack|infraestrutura|telecomx)\b|configur\w*$)"
+    )),
+]
+
+# "Ative o plano TelecomX Ultra com 500GB ..." -> nome_plano / franquia.
+# Roda sobre o texto original para preservar a grafia do nome do plano.
+PADRAO_ATIVAR_PLANO = re.compile(
+    r"\bativ\w*\s+(?:o\s+)?plano\s+(?P<nome>.+?)\s+(?:com|de)\s+(?P<franquia>\d+)\s*gb\b",
+    re.IGNORECASE,
+)
+
+# "... do assinante cliente-042" -> assinante. Também roda sobre o texto original.
+PADRAO_ASSINANTE = re.compile(r"\bassinante\s+(?P<id>[\w.@-]+)", re.IGNORECASE)
+PALAVRAS_NAO_ID = {"a", "o", "e", "na", "no", "da", "do", "de", "em", "para", "com", "que"}
+
+def normalizar(texto: str) -> str:
+    """Chave canônica de uma frase: minúscula, sem acentos, pontuação ou espaços repetidos."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+def match_fast_path(user_prompt: str) -> Optional[Dict[str, Any]]:
+    """Classifica frases-gatilho conhecidas de forma determinística. None se não reconhecer."""
+    assinante = PADRAO_ASSINANTE.search(user_prompt)
+    extras = {}
+    if assinante and assinante.group("id").lower() not in PALAVRAS_NAO_ID:
+        extras["assinante"] = assinante.group("id")
+
+    plano = PADRAO_ATIVAR_PLANO.search(user_prompt)
+    if plano:
+        return {
+            "function_name": "ativar_plano",
+            "parameters": {"nome_plano": plano.group("nome").strip(), "franquia": f"{plano.group('franquia')}GB", **extras},
+        }
+
+    texto = normalizar(user_prompt)
+    for funcao, padrao in PADROES_FAST_PATH:
+        if padrao.search(texto):
+            return {"function_name": funcao, "parameters": {} if funcao == "setup_telco" else extras}
+    return None
+
+class IntentCache:
+    """LRU com expiração (TTL) de frase normalizada -> chamada de função já interpretada."""
+
+    def __init__(self, tamanho: int = INTENT_CACHE_TAMANHO, ttl: float = INTENT_CACHE_TTL):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._itens: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        expira, valor = item
+        if expira < time.monotonic():
+            del self._itens[chave]
+            return None
+        self._itens.move_to_end(chave)
+        return copy.deepcopy(valor)
+
+    def put(self, chave: str, valor: Dict[str, Any]) -> None:
+        self._itens[chave] = (time.monotonic() + self.ttl, copy.deepcopy(valor))
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.tamanho:
+            self._itens.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+INTENT_CACHE = IntentCache()
+
+ROUTER_STATS = {"fast_path": 0, "cache_hits": 0, "cache_misses": 0, "llm_errors": 0}
+
+def get_router_stats() -> Dict[str, Any]:
+    """Contadores do roteador e a fração de mensagens que não precisou do modelo."""
+    total = ROUTER_STATS["fast_path"] + ROUTER_STATS["cache_hits"] + ROUTER_STATS["cache_misses"]
+    evitadas = ROUTER_STATS["fast_path"] + ROUTER_STATS["cache_hits"]
+    return {
+        **ROUTER_STATS,
+        "llm_calls": ROUTER_STATS["cache_misses"],
+        "cache_size": len(INTENT_CACHE),
+        "llm_avoided_ratio": round(evitadas / total, 4) if total else 0.0,
+    }
+
+async def resolve_intent(session: aiohttp.ClientSession, user_prompt: str) -> Dict[str, Any]:
+    """Interpreta a mensagem: fast-path por regex, depois cache e, só em último caso, o Phi-3."""
+    async with metrics.span("llm_intent", metrics.LLM_INTENT, origem="fast_path") as labels:
+        cmd = match_fast_path(user_prompt)
+        if cmd:
+            ROUTER_STATS["fast_path"] += 1
+            logging.info(f"Intenção resolvida por regex: {cmd['function_name']}")
+            return cmd
+
+        chave = normalizar(user_prompt)
+        cmd = INTENT_CACHE.get(chave)
+        if cmd:
+            labels["origem"] = "cache"
+            ROUTER_STATS["cache_hits"] += 1
+            logging.info(f"Intenção resolvida pelo cache: {cmd.get('function_name')}")
+            return cmd
+
+        labels["origem"] = "llm"
+        ROUTER_STATS["cache_misses"] += 1
+        cmd = await get_ollama_function_call(session, user_prompt)
+        if cmd.get("function_name") in FUNCOES_PERMITIDAS:
+            INTENT_CACHE.put(chave, cmd)
+        else:
+            labels["origem"] = "llm_erro"
+            ROUTER_STATS["llm_errors"] += 1
+        return cmd
@@ -0,0 +1,50 @@
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# Quem acompanha a operação atual (job assíncrono, stream do /chat). Tarefas filhas herdam o ouvinte.
+Ouvinte = Callable[[Dict[str, Any]], None]
+_OUVINTE: contextvars.ContextVar[Optional[Ouvinte]] = contextvars.ContextVar("ouvinte_progresso", default=None)
+
+
+def _entregar(ouvinte: Optional[Ouvinte], evento: str, dados: Dict[str, Any]) -> None:
+    if ouvinte is None:
+        return
+    try:
+        ouvinte({"evento": evento, "t": round(time.time(), 3), **dados})
+    except Exception as e:
+        logging.error(f"Ouvinte de progresso falhou em '{evento}': {e}")
+
+
+def emitir(evento: str, **dados) -> None:
+    """Avisa um marco da operação em andamento (convite criado, conexão ativa, prova recebida...).
+
+    Sem ninguém ouvindo é um no-op, então o controller pode chamar sempre.
+    """
+    _entregar(_OUVINTE.get(), evento, dados)
+
+
+def ativo() -> bool:
+    return _OUVINTE.get() is not None
+
+
+def emissor() -> Callable[..., None]:
+    """`emitir` preso ao ouvinte atual, para callbacks que rodam em outro contexto (ex.: webhooks)."""
+    ouvinte = _OUVINTE.get()
+
+    def emitir_capturado(evento: str, **dados) -> None:
+        _entregar(ouvinte, evento, dados)
+
+    return emitir_capturado
+
+
+@contextmanager
+def ouvir(ouvinte: Ouvinte):
+    """Direciona os eventos de progresso emitidos dentro do bloco para `ouvinte`."""
+    token = _OUVINTE.set(ouvinte)
+    try:
+        yield
+    finally:
+        _OUVINTE.reset(token)
@@ -0,0 +1,81 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# --- Configuração ---
+# Por quanto tempo uma verificação aprovada vale sem pedir nova prova (0 desliga o cache)
+PROVA_CACHE_TTL = float(os.getenv("PROVA_CACHE_TTL", 60))
+PROVA_CACHE_TAMANHO = int(os.getenv("PROVA_CACHE_TAMANHO", 10000))
+
+Chave = Tuple[str, str, Tuple[str, ...]]
+
+
+def chave(assinante: str, cred_def_id: str, atributos: Iterable[str]) -> Chave:
+    return assinante, cred_def_id, tuple(sorted(atributos))
+
+
+class ProofCache:
+    """LRU com TTL de verificações aprovadas, por assinante + CredDef + atributos pedidos.
+
+    Cada entrada guarda as emissões do assinante no momento da prova: se uma
+    emissão nova aparecer (em qualquer worker, via storage), a entrada deixa de valer.
+    Revogações chegam por webhook e invalidam o assinante na hora.
+    """
+
+    def __init__(self, tamanho: int = PROVA_CACHE_TAMANHO, ttl: float = PROVA_CACHE_TTL):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._itens: "OrderedDict[Chave, Tuple[float, Tuple[str, ...], str]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "invalidacoes": 0}
+
+    @property
+    def ativo(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, chave: Chave, emissoes: Iterable[str]) -> Optional[str]:
+        item = self._itens.get(chave)
+        if item is not None:
+            expira, emissoes_salvas, resposta = item
+            if expira < time.monotonic():
+                del self._itens[chave]
+            elif emissoes_salvas != tuple(emissoes):
+                del self._itens[chave]
+                self.stats["invalidacoes"] += 1
+            else:
+                self._itens.move_to_end(chave)
+                self.stats["hits"] += 1
+                return resposta
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, chave: Chave, emissoes: Iterable[str], resposta: str) -> None:
+        if not self.ativo:
+            return
+        self._itens[chave] = (time.monotonic() + self.ttl, tuple(emissoes), resposta)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.tamanho:
+            self._itens.popitem(last=False)
+
+    def invalidar(self, assinante: str) -> int:
+        """Remove todas as entradas do assinante. Retorna quantas saíram."""
+        removidas = [c for c in self._itens if c[0] == assinante]
+        for c in removidas:
+            del self._itens[c]
+        self.stats["invalidacoes"] += len(removidas)
+        return len(removidas)
+
+    def get_stats(self) -> Dict[str, Any]:
+        consultas = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "tamanho": len(self._itens),
+            "ttl_s": self.ttl,
+            "hit_ratio": round(self.stats["hits"] / consultas, 4) if consultas else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+
+PROOF_CACHE = ProofCache()
@@ -0,0 +1,95 @@
+import os
+import random
+import time
+from typing import Any, Dict
+
+# --- Configuração ---
+RETRY_TENTATIVAS = int(os.getenv("ADMIN_RETRY_TENTATIVAS", 3))
+RETRY_BASE = float(os.getenv("ADMIN_RETRY_BASE", 0.2))
+RETRY_MAX = float(os.getenv("ADMIN_RETRY_MAX", 2.0))
+BREAKER_LIMITE_FALHAS = int(os.getenv("BREAKER_LIMITE_FALHAS", 5))
+BREAKER_TEMPO_ABERTO = float(os.getenv("BREAKER_TEMPO_ABERTO", 15.0))
+
+# Só estes métodos são repetidos automaticamente; POSTs criam registros no agente
+METODOS_IDEMPOTENTES = {"GET", "HEAD"}
+
+# Status que indicam falha transitória do agente (vale repetir e conta para o breaker)
+STATUS_TRANSITORIOS = {500, 502, 503, 504}
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+def espera_backoff(tentativa: int) -> float:
+    """Backoff exponencial com jitter completo: sorteia entre 0 e base * 2^tentativa (limitado)."""
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * (2 ** tentativa)))
+
+
+class CircuitBreaker:
+    """Disjuntor de um agente: abre após falhas seguidas e rejeita chamadas até esfriar.
+
+    Depois de `tempo_aberto` segundos, deixa passar uma única chamada de teste
+    (meio-aberto): se ela funcionar o disjuntor fecha, senão reabre.
+    """
+
+    def __init__(self, limite_falhas: int = BREAKER_LIMITE_FALHAS, tempo_aberto: float = BREAKER_TEMPO_ABERTO):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self._aberto_em = 0.0
+        self._teste_em_andamento = False
+
+    def permitir(self) -> bool:
+        if self.estado == FECHADO:
+            return True
+        if self.estado == ABERTO and time.monotonic() - self._aberto_em >= self.tempo_aberto:
+            self.estado = MEIO_ABERTO
+        if self.estado == MEIO_ABERTO and not self._teste_em_andamento:
+            self._teste_em_andamento = True
+            return True
+        return False
+
+    def liberar_teste(self) -> None:
+        """Libera a vaga da chamada de teste quando ela é cancelada sem resultado."""
+        self._teste_em_andamento = False
+
+    def registrar_sucesso(self) -> None:
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self._teste_em_andamento = False
+
+    def registrar_falha(self) -> bool:
+        """Contabiliza uma falha. Retorna True se esta falha abriu o disjuntor."""
+        self.falhas_seguidas += 1
+        self._teste_em_andamento = False
+        if self.estado == MEIO_ABERTO or (self.estado == FECHADO and self.falhas_seguidas >= self.limite_falhas):
+            self.estado = ABERTO
+            self._aberto_em = time.monotonic()
+            return True
+        return False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+METRICAS: Dict[str, Dict[str, Any]] = {}
+
+
+def breaker(agente: str) -> CircuitBreaker:
+    if agente not in _breakers:
+        _breakers[agente] = CircuitBreaker()
+    return _breakers[agente]
+
+
+def metricas(agente: str) -> Dict[str, Any]:
+    if agente not in METRICAS:
+        METRICAS[agente] = {"retries": 0, "falhas": 0, "breaker_aberturas": 0, "rejeitadas_breaker": 0, "latencia_extra_s": 0.0}
+    return METRICAS[agente]
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    """Métricas de resiliência por agente, incluindo o estado atual do disjuntor."""
+    return {
+        agente: {**metricas(agente), "latencia_extra_s": round(metricas(agente)["latencia_extra_s"], 3), "breaker": breaker(agente).estado}
+        for agente in set(_breakers) | set(METRICAS)
+    }
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+# --- Configuração ---
+# "memoria" (padrão, um processo) ou "sqlite" (compartilhado entre workers do chatbot_server)
+TELCO_STORAGE = os.getenv("TELCO_STORAGE", "memoria").lower()
+_PASTA = os.path.dirname(os.path.abspath(__file__))
+# IDs publicados no ledger ficam em disco para o controller reiniciar sem refazer o setup
+ARQUIVO_ESTADO = os.getenv("TELCO_STATE_FILE", os.path.join(_PASTA, "telco_state.json"))
+ARQUIVO_DB = os.getenv("TELCO_DB", os.path.join(_PASTA, "telco_state.db"))
+# Snapshots de jobs mais antigos que isso são apagados do banco compartilhado
+JOBS_TTL = float(os.getenv("JOBS_TTL", 24 * 3600))
+
+CAMPOS_CONEXAO = ("conn_id_operadora", "conn_id_verificador")
+
+
+class Storage(ABC):
+    """Onde o controller guarda o que precisa sobreviver a reinícios ou ser visto por outros workers.
+
+    - estado do setup (DID da operadora, IDs de Schemas e CredDefs);
+    - assinantes: conexões com a Operadora e o Verificador e as emissões de cada um;
+    - trocas pendentes: emissões e provas que algum worker está aguardando;
+    - snapshots de jobs assíncronos, para `/jobs/{id}` responder de qualquer worker.
+
+    As operações são síncronas e curtas (dicionário ou uma instrução SQLite local).
+    Um backend que não implementar todas falha já ao ser instanciado.
+    """
+
+    compartilhado = False
+
+    @abstractmethod
+    def ler_estado(self) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def salvar_estado(self, dados: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def ler_assinante(self, assinante_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def assinante_por_conexao(self, conn_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def assinante_por_cred_ex(self, cred_ex_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def definir_conexao(self, assinante_id: str, campo: str, conn_id: Optional[str]) -> None:
+        ...
+
+    @abstractmethod
+    def adicionar_emissao(self, assinante_id: str, cred_ex_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def contar_assinantes(self) -> int:
+        ...
+
+    @abstractmethod
+    def registrar_pendente(self, troca_id: str, tipo: str, assinante_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def concluir_pendente(self, troca_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def listar_pendentes(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def salvar_job(self, job_id: str, resumo: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def ler_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def fechar(self) -> None:
+        pass
+
+
+class MemoryStorage(Storage):
+    """Tudo em memória do processo; só o setup vai para um arquivo JSON (`arquivo_estado`)."""
+
+    def __init__(self, arquivo_estado: Optional[str] = ARQUIVO_ESTADO):
+        self._arquivo_estado = arquivo_estado
+        self._assinantes: Dict[str, Dict[str, Any]] = {}
+        self._por_conexao: Dict[str, str] = {}
+        self._por_cred_ex: Dict[str, str] = {}
+        self._pendentes: Dict[str, Dict[str, Any]] = {}
+
+    def ler_estado(self) -> Dict[str, Any]:
+        if not self._arquivo_estado:
+            return {}
+        try:
+            with open(self._arquivo_estado, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cache de setup ignorado ({self._arquivo_estado}): {e}")
+            return {}
+
+    def salvar_estado(self, dados: Dict[str, Any]) -> None:
+        if not self._arquivo_estado:
+            return
+        temporario = f"{self._arquivo_estado}.tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(dados, f, indent=2)
+            os.replace(temporario, self._arquivo_estado) # Troca atômica: nunca deixa o cache pela metade
+        except OSError as e:
+            logging.error(f"Não foi possível salvar o cache de setup em {self._arquivo_estado}: {e}")
+
+    def _obter_ou_criar(self, assinante_id: str) -> Dict[str, Any]:
+        if assinante_id not in self._assinantes:
+            self._assinantes[assinante_id] = {"assinante_id": assinante_id, "conn_id_operadora": None, "conn_id_verificador": None, "cred_ex_ids": []}
+        return self._assinantes[assinante_id]
+
+    def ler_assinante(self, assinante_id: str) -> Optional[Dict[str, Any]]:
+        assinante = self._assinantes.get(assinante_id)
+        return {**assinante, "cred_ex_ids": list(assinante["cred_ex_ids"])} if assinante else None
+
+    def assinante_por_conexao(self, conn_id: str) -> Optional[str]:
+        return self._por_conexao.get(conn_id)
+
+    def assinante_por_cred_ex(self, cred_ex_id: str) -> Optional[str]:
+        return self._por_cred_ex.get(cred_ex_id)
+
+    def definir_conexao(self, assinante_id: str, campo: str, conn_id: Optional[str]) -> None:
+        assinante = self._obter_ou_criar(assinante_id)
+        if assinante[campo]:
+            self._por_conexao.pop(assinante[campo], None)
+        assinante[campo] = conn_id
+        if conn_id:
+            self._por_conexao[conn_id] = assinante_id
+
+    def adicionar_emissao(self, assinante_id: str, cred_ex_id: str) -> None:
+        self._obter_ou_criar(assinante_id)["cred_ex_ids"].append(cred_ex_id)
+        self._por_cred_ex[cred_ex_id] = assinante_id
+
+    def contar_assinantes(self) -> int:
+        return len(self._assinantes)
+
+    def registrar_pendente(self, troca_id: str, tipo: str, assinante_id: str) -> None:
+        self._pendentes[troca_id] = {"troca_id": troca_id, "tipo": tipo, "assinante_id": assinante_id, "criado_em": time.time()}
+
+    def concluir_pendente(self, troca_id: str) -> None:
+        self._pendentes.pop(troca_id, None)
+
+    def listar_pendentes(self) -> List[Dict[str, Any]]:
+        return list(self._pendentes.values())
+
+    def salvar_job(self, job_id: str, resumo: Dict[str, Any]) -> None:
+        pass # Em um único processo o JobManager já tem o job
+
+    def ler_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+
+class SQLiteStorage(Storage):
+    """Estado em um arquivo SQLite (modo WAL), compartilhado por todos os workers da máquina.
+
+    Cada escrita é uma instrução (ou uma transação curta), então workers concorrentes
+    não perdem atualizações uns dos outros; o timeout da conexão cobre a disputa
+    pelo lock de escrita.
+    """
+
+    compartilhado = True
+
+    def __init__(self, caminho: str = ARQUIVO_DB):
+        self.caminho = caminho
+        # Uma conexão por processo, usada só pelo loop de eventos (o lock cobre threads do uvicorn)
+        self._conn = sqlite3.connect(caminho, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS estado (chave TEXT PRIMARY KEY, valor TEXT);
+                CREATE TABLE IF NOT EXISTS assinantes (
+                    assinante_id TEXT PRIMARY KEY,
+                    conn_id_operadora TEXT,
+                    conn_id_verificador TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_conn_operadora ON assinantes (conn_id_operadora);
+                CREATE INDEX IF NOT EXISTS idx_conn_verificador ON assinantes (conn_id_verificador);
+                CREATE TABLE IF NOT EXISTS emissoes (cred_ex_id TEXT PRIMARY KEY, assinante_id TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS idx_emissoes_assinante ON emissoes (assinante_id);
+                CREATE TABLE IF NOT EXISTS pendentes (troca_id TEXT PRIMARY KEY, tipo TEXT, assinante_id TEXT, criado_em REAL);
+                CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, resumo TEXT, atualizado_em REAL);
+            """)
+
+    def _executar(self, sql: str, parametros=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, parametros).fetchall()
+
+    def _transacao(self, instrucoes) -> None:
+        """Executa várias escritas atomicamente (lista de (sql, parâmetros))."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parametros in instrucoes:
+                    self._conn.execute(sql, parametros)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def ler_estado(self) -> Dict[str, Any]:
+        return {linha["chave"]: json.loads(linha["valor"]) for linha in self._executar("SELECT chave, valor FROM estado")}
+
+    def salvar_estado(self, dados: Dict[str, Any]) -> None:
+        sql = "INSERT INTO estado (chave, valor) VALUES (?, ?) ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor"
+        self._transacao([(sql, (chave, json.dumps(valor))) for chave, valor in dados.items()])
+
+    def ler_assinante(self, assinante_id: str) -> Optional[Dict[str, Any]]:
+        linhas = self._executar("SELECT * FROM assinantes WHERE assinante_id = ?", (assinante_id,))
+        if not linhas:
+            return None
+        emissoes = self._executar("SELECT cred_ex_id FROM emissoes WHERE assinante_id = ? ORDER BY rowid", (assinante_id,))
+        return {**dict(linhas[0]), "cred_ex_ids": [linha["cred_ex_id"] for linha in emissoes]}
+
+    def assinante_por_conexao(self, conn_id: str) -> Optional[str]:
+        linhas = self._executar("SELECT assinante_id FROM assinantes WHERE conn_id_operadora = ? OR conn_id_verificador = ?", (conn_id, conn_id))
+        return linhas[0]["assinante_id"] if linhas else None
+
+    def assinante_por_cred_ex(self, cred_ex_id: str) -> Optional[str]:
+        linhas = self._executar("SELECT assinante_id FROM emissoes WHERE cred_ex_id = ?", (cred_ex_id,))
+        return linhas[0]["assinante_id"] if linhas else None
+
+    def definir_conexao(self, assinante_id: str, campo: str, conn_id: Optional[str]) -> None:
+        if campo not in CAMPOS_CONEXAO:
+            raise ValueError(f"Campo de conexão inválido: {campo}")
+        self._executar(
+            f"INSERT INTO assinantes (assinante_id, {campo}) VALUES (?, ?) ON CONFLICT(assinante_id) DO UPDATE SET {campo} = excluded.{campo}",
+            (assinante_id, conn_id),
+        )
+
+    def adicionar_emissao(self, assinante_id: str, cred_ex_id: str) -> None:
+        self._transacao([
+            ("INSERT INTO assinantes (assinante_id) VALUES (?) ON CONFLICT(assinante_id) DO NOTHING", (assinante_id,)),
+            ("INSERT OR REPLACE INTO emissoes (cred_ex_id, assinante_id) VALUES (?, ?)", (cred_ex_id, assinante_id)),
+        ])
+
+    def contar_assinantes(self) -> int:
+        return self._executar("SELECT COUNT(*) AS n FROM assinantes")[0]["n"]
+
+    def registrar_pendente(self, troca_id: str, tipo: str, assinante_id: str) -> None:
+        self._executar("INSERT OR REPLACE INTO pendentes VALUES (?, ?, ?, ?)", (troca_id, tipo, assinante_id, time.time()))
+
+    def concluir_pendente(self, troca_id: str) -> None:
+        self._executar("DELETE FROM pendentes WHERE troca_id = ?", (troca_id,))
+
+    def listar_pendentes(self) -> List[Dict[str, Any]]:
+        return [dict(linha) for linha in self._executar("SELECT * FROM pendentes ORDER BY criado_em")]
+
+    def salvar_job(self, job_id: str, resumo: Dict[str, Any]) -> None:
+        agora = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)", (job_id, json.dumps(resumo, ensure_ascii=False), agora))
+            if resumo.get("status") == "na_fila":
+                self._conn.execute("DELETE FROM jobs WHERE atualizado_em < ?", (agora - JOBS_TTL,))
+
+    def ler_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        linhas = self._executar("SELECT resumo FROM jobs WHERE job_id = ?", (job_id,))
+        return json.loads(linhas[0]["resumo"]) if linhas else None
+
+    def fechar(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def criar_storage(tipo: str = TELCO_STORAGE) -> Storage:
+    if tipo == "sqlite":
+        return SQLiteStorage()
+    if tipo == "memoria":
+        return MemoryStorage()
+    raise ValueError(f"TELCO_STORAGE inválido: {tipo} (use 'memoria' ou 'sqlite')")
+
+
+# Instância do processo; cada worker do uvicorn cria a sua (no SQLite, todas apontam para o mesmo arquivo)
+STORAGE = criar_storage()
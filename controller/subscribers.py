@@ -0,0 +1,60 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from storage import STORAGE, Storage
+
+# Assinante usado quando o chat não informa um ID (fluxo da demonstração com um único cliente)
+ASSINANTE_PADRAO = "padrao"
+
+
+@dataclass
+class Assinante:
+    assinante_id: str
+    conn_id_operadora: Optional[str] = None
+    conn_id_verificador: Optional[str] = None
+    cred_ex_ids: List[str] = field(default_factory=list)
+
+
+class SubscriberRegistry:
+    """Registro de assinantes com índices por conexão e por troca de credencial.
+
+    Os dados ficam no `Storage` (memória ou SQLite compartilhado entre workers).
+    As escritas passam por um lock para que onboardings e emissões concorrentes
+    de assinantes diferentes nunca sobrescrevam uns aos outros no mesmo processo.
+    As leituras devolvem cópias, então quem consulta não altera o registro por acidente.
+    """
+
+    def __init__(self, storage: Storage = STORAGE):
+        self._storage = storage
+        self._lock = asyncio.Lock()
+
+    async def registrar_conexao_operadora(self, assinante_id: str, conn_id: str) -> None:
+        async with self._lock:
+            self._storage.definir_conexao(assinante_id, "conn_id_operadora", conn_id)
+
+    async def registrar_conexao_verificador(self, assinante_id: str, conn_id: Optional[str]) -> None:
+        async with self._lock:
+            self._storage.definir_conexao(assinante_id, "conn_id_verificador", conn_id)
+
+    async def registrar_emissao(self, assinante_id: str, cred_ex_id: str) -> None:
+        async with self._lock:
+            self._storage.adicionar_emissao(assinante_id, cred_ex_id)
+
+    def get(self, assinante_id: str) -> Optional[Assinante]:
+        dados = self._storage.ler_assinante(assinante_id)
+        return Assinante(**dados) if dados else None
+
+    def por_conexao(self, conn_id: str) -> Optional[Assinante]:
+        assinante_id = self._storage.assinante_por_conexao(conn_id)
+        return self.get(assinante_id) if assinante_id else None
+
+    def por_cred_ex(self, cred_ex_id: str) -> Optional[Assinante]:
+        assinante_id = self._storage.assinante_por_cred_ex(cred_ex_id)
+        return self.get(assinante_id) if assinante_id else None
+
+    def __len__(self) -> int:
+        return self._storage.contar_assinantes()
+
+
+REGISTRO = SubscriberRegistry()
@@ -0,0 +1,163 @@
+"""Configuração tipada dos três agentes ACA-Py (Issuer, Holder e Verifier).
+
+Lê agents/stack.toml (ou o arquivo em STACK_CONFIG), aplica os overrides de
+ambiente STACK_* e monta o comando `aca-py start` de cada papel com o perfil
+de desempenho ativo. Fica na raiz do projeto porque é compartilhado: os
+scripts run-*.py e o supervisor.py (agents/) e o controller (URLs dos admins)
+importam este mesmo módulo.
+"""
+import os
+import shlex
+import tomllib
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, List, get_origin
+
+CONFIG_PADRAO = Path(__file__).resolve().parent / "agents" / "stack.toml"
+NIVEIS_LOG = ("debug", "info", "warning", "error", "critical")
+
+
+@dataclass
+class Perfil:
+    """Ajustes de desempenho comuns a todos os agentes."""
+    log_level: str = "info"
+    transportes_saida: List[str] = field(default_factory=lambda: ["http"])
+    flags: List[str] = field(default_factory=list)
+    args_extras: List[str] = field(default_factory=list)
+    wallet_storage_type: str = ""
+    wallet_storage_config: str = ""
+    wallet_storage_creds: str = ""
+    wallet_key_derivation: str = ""
+
+
+@dataclass
+class Agente:
+    rotulo: str
+    porta_inbound: int
+    porta_admin: int
+    wallet_name: str
+    host: str = "localhost"
+    wallet_key: str = "123456"
+    wallet_type: str = "askar-anoncreds"
+    webhook: bool = False
+    flags: List[str] = field(default_factory=list)
+    args_extras: List[str] = field(default_factory=list)
+    # Preenchidos por carregar()
+    nome: str = field(init=False, default="")
+    stack: "StackConfig" = field(init=False, default=None, repr=False)
+
+    @property
+    def admin_url(self) -> str:
+        return f"http://{self.host}:{self.porta_admin}"
+
+    @property
+    def comando(self) -> str:
+        return shlex.join(self.argumentos())
+
+    def argumentos(self) -> List[str]:
+        stack, perfil = self.stack, self.stack.perfil_ativo
+        args = ["aca-py", "start", "--inbound-transport", "http", "0.0.0.0", str(self.porta_inbound)]
+        for transporte in perfil.transportes_saida:
+            args += ["--outbound-transport", transporte]
+        args += [
+            "--log-level", perfil.log_level,
+            "--endpoint", f"http://{self.host}:{self.porta_inbound}",
+            "--label", self.rotulo,
+            "--seed", stack.seed,
+            "--genesis-url", stack.genesis_url,
+            "--ledger-pool-name", stack.ledger_pool_name,
+            "--wallet-key", self.wallet_key,
+            "--wallet-name", self.wallet_name,
+            "--wallet-type", self.wallet_type,
+        ]
+        for opcao, valor in (("--wallet-storage-type", perfil.wallet_storage_type),
+                             ("--wallet-storage-config", perfil.wallet_storage_config),
+                             ("--wallet-storage-creds", perfil.wallet_storage_creds),
+                             ("--wallet-key-derivation-method", perfil.wallet_key_derivation)):
+            if valor:
+                args += [opcao, valor]
+        args += ["--admin", "0.0.0.0", str(self.porta_admin), "--admin-insecure-mode", "--auto-provision"]
+        if self.webhook:
+            args += ["--webhook-url", stack.webhook_url]
+        # Sem duplicar flags que o papel e o perfil declaram ao mesmo tempo
+        args += list(dict.fromkeys(self.flags + perfil.flags))
+        return args + perfil.args_extras + self.args_extras
+
+
+@dataclass
+class StackConfig:
+    perfil: str = "desempenho"
+    genesis_url: str = "http://localhost:9000/genesis"
+    ledger_pool_name: str = "localindypool"
+    seed: str = "000000000000000000000000Steward1"
+    webhook_url: str = "http://localhost:8080/webhooks"
+    # Preenchidos por carregar()
+    perfil_ativo: Perfil = field(init=False, default_factory=Perfil)
+    agentes: Dict[str, Agente] = field(init=False, default_factory=dict)
+
+
+def _valor(tipo: Any, valor: Any, origem: str) -> Any:
+    """Confere o tipo de um valor do TOML; strings (vindas do ambiente) são convertidas."""
+    if get_origin(tipo) is list:
+        if isinstance(valor, str):
+            valor = [v.strip() for v in valor.split(",") if v.strip()]
+        if isinstance(valor, list) and all(isinstance(v, str) for v in valor):
+            return valor
+    elif tipo is bool:
+        if isinstance(valor, str) and valor.lower() in ("1", "true", "sim", "0", "false", "nao"):
+            return valor.lower() in ("1", "true", "sim")
+        if isinstance(valor, bool):
+            return valor
+    elif tipo is int:
+        if isinstance(valor, str) and valor.strip().isdigit():
+            return int(valor)
+        if isinstance(valor, int) and not isinstance(valor, bool):
+            return valor
+    elif isinstance(valor, tipo):
+        return valor
+    raise ValueError(f"{origem}: valor inválido {valor!r} (esperado {getattr(tipo, '__name__', tipo)})")
+
+
+def _montar(cls, dados: Dict[str, Any], prefixo_env: str, origem: str):
+    campos = [c for c in fields(cls) if c.init]
+    desconhecidos = set(dados) - {c.name for c in campos}
+    if desconhecidos:
+        raise ValueError(f"{origem}: campo(s) desconhecido(s): {', '.join(sorted(desconhecidos))}")
+
+    valores = {}
+    for campo in campos:
+        if campo.name in dados:
+            valores[campo.name] = _valor(campo.type, dados[campo.name], f"{origem}.{campo.name}")
+        variavel = f"{prefixo_env}{campo.name.upper()}"
+        if (bruto := os.getenv(variavel)) is not None:
+            valores[campo.name] = _valor(campo.type, bruto, variavel)
+    try:
+        return cls(**valores)
+    except TypeError as e:
+        raise ValueError(f"{origem}: {e}") from None
+
+
+def carregar(caminho: str = None) -> StackConfig:
+    """Lê o TOML, aplica os overrides STACK_* e resolve o perfil ativo."""
+    caminho = Path(caminho or os.getenv("STACK_CONFIG") or CONFIG_PADRAO)
+    with open(caminho, "rb") as f:
+        dados = tomllib.load(f)
+
+    stack = _montar(StackConfig, dados.get("stack", {}), "STACK_", "[stack]")
+    perfis = dados.get("perfis", {})
+    if stack.perfil not in perfis:
+        raise ValueError(f"Perfil desconhecido: {stack.perfil} (disponíveis: {', '.join(perfis) or 'nenhum'})")
+    stack.perfil_ativo = _montar(Perfil, perfis[stack.perfil], "STACK_", f"[perfis.{stack.perfil}]")
+    if stack.perfil_ativo.log_level not in NIVEIS_LOG:
+        raise ValueError(f"log_level inválido: {stack.perfil_ativo.log_level} (use {', '.join(NIVEIS_LOG)})")
+
+    for nome, secao in dados.get("agentes", {}).items():
+        agente = _montar(Agente, secao, f"STACK_{nome.upper()}_", f"[agentes.{nome}]")
+        agente.nome, agente.stack = nome, stack
+        stack.agentes[nome] = agente
+    return stack
+
+
+STACK = carregar()
+AGENTES = STACK.agentes
+GENESIS_URL = STACK.genesis_url